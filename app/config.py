@@ -1,4 +1,5 @@
 import os
+from typing import List
 from dotenv import load_dotenv
 from pydantic import Field
 from pydantic_settings import BaseSettings
@@ -15,16 +16,140 @@ class Settings(BaseSettings):
     SECRET_KEY: str = Field(default=os.getenv("SECRET_KEY", "super_secreto_y_largo_default"))
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+
+    # --- Hashing de contraseñas (bcrypt) ---
+    # Cambiar BCRYPT_ROUNDS provoca el rehash transparente en el siguiente login.
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+    # Máximo de operaciones en curso + en cola; por encima se responde 429
+    PASSWORD_HASH_MAX_PENDING: int = 64
+
+    # Máximo de tokens verificados que se mantienen en caché (ver decode_access_token)
+    TOKEN_CACHE_MAX_ENTRIES: int = 50000
+    # Si TOKEN_REVOCATION_REDIS_URL está definido, los tokens revocados (logout) se comparten entre workers.
+    TOKEN_REVOCATION_REDIS_URL: str = Field(default=os.getenv("TOKEN_REVOCATION_REDIS_URL", ""))
+
+    # --- Caché del usuario autenticado ---
+    # Si PRINCIPAL_CACHE_REDIS_URL está definido, la caché se comparte entre workers.
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 60
+    PRINCIPAL_CACHE_MAX_ENTRIES: int = 10000
+    PRINCIPAL_CACHE_REDIS_URL: str = Field(default=os.getenv("PRINCIPAL_CACHE_REDIS_URL", ""))
     
+    # Tiempo máximo esperado para el arranque (lifespan); si se supera se registra un aviso
+    STARTUP_TIME_BUDGET_SECONDS: float = 5.0
+    # Instrumentación por petición (latencias, consultas SQL, llamadas externas)
+    REQUEST_METRICS_ENABLED: bool = True
+    # Token Bearer para /metrics (scraper de Prometheus). Sin token, solo responde a loopback.
+    METRICS_TOKEN: str = Field(default=os.getenv("METRICS_TOKEN", ""))
+    # Consultas SQL por petición por encima de las cuales se avisa de un posible N+1 (0 desactiva)
+    REQUEST_QUERY_WARNING_THRESHOLD: int = 25
+    # Umbral de regresión del tiempo de importación de main (ver app.utils.import_profiler)
+    IMPORT_TIME_BUDGET_MS: int = 1500
+
     # --- Configuración de la Base de Datos ---
     DATABASE_URL: str = Field(default=os.getenv("DATABASE_URL", "sqlite:///./sql_app.db"))
+    # Rutas async sobre aiosqlite/asyncpg; en False se usa la sesión síncrona en el threadpool
+    DB_ASYNC_ENABLED: bool = True
+
+    # --- Pool de conexiones ---
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: int = 30
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    # Pre-ping en cada checkout; con False y un intervalo > 0 se verifica en segundo plano
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_LIVENESS_INTERVAL_SECONDS: int = 0
+    # Conexiones que se abren en paralelo al iniciar (0 desactiva el calentamiento)
+    DB_POOL_WARMUP_CONNECTIONS: int = 5
+    # Crear las tablas al iniciar; False cuando el esquema lo gestionan las migraciones
+    DB_CREATE_SCHEMA_ON_STARTUP: bool = True
+    # Ajustes específicos de SQLite
+    SQLITE_WAL: bool = True
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
     
+    # --- Asignación de citas ---
+    # Candidatos que se prueban antes de dejar la cita solicitada sin doctor
+    SCHEDULING_MAX_ATTEMPTS: int = 3
+    # Carga masiva: máximo de citas por petición y por transacción
+    APPOINTMENT_BATCH_MAX_ITEMS: int = 10000
+    APPOINTMENT_BATCH_CHUNK_SIZE: int = 500
+    # Transiciones masivas de estado: máximo de citas por petición y filas por bloque del barrido
+    APPOINTMENT_TRANSITION_MAX_ITEMS: int = 10000
+    APPOINTMENT_TRANSITION_CHUNK_SIZE: int = 5000
+    # Barrido nocturno: las citas confirmadas que terminaron hace más de
+    # NO_SHOW_GRACE_MINUTES pasan a NO_SHOW cada día a NO_SHOW_SWEEP_HOUR_UTC
+    NO_SHOW_SWEEP_ENABLED: bool = True
+    NO_SHOW_SWEEP_HOUR_UTC: int = 3
+    NO_SHOW_GRACE_MINUTES: int = 60
+
+    # Disponibilidad: tamaño del slot y horizonte máximo de búsqueda
+    AVAILABILITY_SLOT_MINUTES: int = 30
+    AVAILABILITY_MAX_DAYS: int = 90
+    # Caché de disponibilidad por doctor y día
+    AVAILABILITY_CACHE_MAX_DAYS: int = 50000
+    AVAILABILITY_CACHE_KEEP_PAST_DAYS: int = 1
+    AVAILABILITY_CACHE_TTL_SECONDS: int = 300
+    # Días que se precalculan al iniciar (0 desactiva el warm-up)
+    AVAILABILITY_WARMUP_DAYS: int = 7
+
+    # Listado de citas (paginación keyset)
+    APPOINTMENTS_PAGE_DEFAULT: int = 50
+    APPOINTMENTS_PAGE_MAX: int = 500
+
     # --- Configuración de Google OAuth y Calendar/Meet ---
     # Todos los campos de Google deben estar definidos
     GOOGLE_CLIENT_ID: str = Field(default=os.getenv("GOOGLE_CLIENT_ID", ""))
     GOOGLE_CLIENT_SECRET: str = Field(default=os.getenv("GOOGLE_CLIENT_SECRET", ""))
     GOOGLE_REDIRECT_URI: str = Field(default=os.getenv("GOOGLE_REDIRECT_URI", "http://localhost:8000/auth/google/callback"))
     TIME_ZONE: str = Field(default=os.getenv("TIME_ZONE", "America/Bogota"))
+    GOOGLE_SCOPES: List[str] = [
+        "openid",
+        "https://www.googleapis.com/auth/userinfo.email",
+        "https://www.googleapis.com/auth/calendar.events",
+    ]
+    # Conexiones HTTP compartidas con los endpoints OAuth de Google
+    GOOGLE_HTTP_POOL_SIZE: int = 10
+    GOOGLE_HTTP_TIMEOUT_SECONDS: float = 10.0
+    # Credenciales por doctor: se refrescan este margen antes de su expiración
+    GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS: int = 300
+    GOOGLE_CREDENTIALS_CACHE_MAX_ENTRIES: int = 10000
+    # Operaciones en lote: límite de sub-peticiones por lote de la API y reintentos
+    GOOGLE_BATCH_MAX_SIZE: int = 50
+    GOOGLE_BATCH_MAX_ATTEMPTS: int = 3
+    GOOGLE_BATCH_BACKOFF_BASE_SECONDS: float = 1.0
+    GOOGLE_BATCH_BACKOFF_MAX_SECONDS: float = 30.0
+    # Límite de llamadas a la API de Google (token bucket global y por doctor)
+    GOOGLE_RATE_LIMIT_GLOBAL_PER_SECOND: float = 10.0
+    GOOGLE_RATE_LIMIT_GLOBAL_BURST: float = 20.0
+    GOOGLE_RATE_LIMIT_PER_DOCTOR_PER_SECOND: float = 2.0
+    GOOGLE_RATE_LIMIT_PER_DOCTOR_BURST: float = 50.0
+    # Circuit breaker: fallos seguidos que lo abren y segundos hasta la llamada de prueba
+    GOOGLE_BREAKER_FAILURE_THRESHOLD: int = 5
+    GOOGLE_BREAKER_RECOVERY_SECONDS: float = 30.0
+
+    # --- Outbox de eventos de Calendar/Meet ---
+    CALENDAR_OUTBOX_ENABLED: bool = True
+    # Eventos que se crean en Google a la vez
+    CALENDAR_OUTBOX_CONCURRENCY: int = 4
+    CALENDAR_OUTBOX_BATCH_SIZE: int = 50
+    CALENDAR_OUTBOX_POLL_SECONDS: float = 2.0
+    # Reintentos con backoff exponencial ante errores transitorios de Google
+    CALENDAR_OUTBOX_MAX_ATTEMPTS: int = 8
+    CALENDAR_OUTBOX_BACKOFF_BASE_SECONDS: float = 2.0
+    CALENDAR_OUTBOX_BACKOFF_MAX_SECONDS: float = 600.0
+    # Una entrada tomada por un worker que no terminó vuelve a la cola tras este tiempo
+    CALENDAR_OUTBOX_LEASE_SECONDS: int = 300
+
+    # --- Eventos de agenda en tiempo real (SSE) ---
+    # Si AGENDA_EVENTS_REDIS_URL está definido, los eventos se reparten entre workers (Redis Streams).
+    AGENDA_EVENTS_REDIS_URL: str = Field(default=os.getenv("AGENDA_EVENTS_REDIS_URL", ""))
+    AGENDA_EVENTS_REDIS_STREAM: str = "agenda_events"
+    # Eventos recientes que se conservan para reanudar con Last-Event-ID
+    AGENDA_EVENTS_HISTORY_SIZE: int = 10000
+    # Eventos pendientes por conexión; si un cliente no los consume se cierra su stream
+    AGENDA_EVENTS_QUEUE_SIZE: int = 256
+    AGENDA_EVENTS_MAX_CONNECTIONS: int = 10000
+    AGENDA_EVENTS_HEARTBEAT_SECONDS: float = 15.0
 
 
     class Config:
@@ -1,23 +1,108 @@
-from sqlalchemy import create_engine
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.engine import CursorResult, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
+from starlette.concurrency import run_in_threadpool
 from app.config import settings
+from app.utils.metrics import Histogram
 import os
 
+logger = logging.getLogger(__name__)
+
 # Determina el tipo de motor de base de datos a usar. 
 # Si la URL apunta a PostgreSQL, usa ese motor.
 # Si la URL apunta a SQLite (como el valor predeterminado), usa SQLite.
 DATABASE_URL = settings.DATABASE_URL
 
+# --- Configuración del pool de conexiones ---
+# Tamaño, overflow, reciclado y timeout del pool salen de Settings. El pre-ping
+# (un SELECT antes de cada checkout) puede sustituirse por una verificación
+# periódica en segundo plano (ver run_pool_liveness_checks).
+
+class _CheckoutTimingMixin:
+    """Mide el tiempo de espera de cada checkout del pool."""
+    metrics_name = "sync"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT[self.metrics_name].observe(time.perf_counter() - start)
+
+
+class InstrumentedQueuePool(_CheckoutTimingMixin, QueuePool):
+    metrics_name = "sync"
+
+
+class InstrumentedAsyncAdaptedQueuePool(_CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    metrics_name = "async"
+
+
+# Histogramas de espera en el checkout, por motor
+POOL_CHECKOUT_WAIT = {"sync": Histogram(), "async": Histogram()}
+
+
+def _is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _engine_options(url: str, is_async: bool = False) -> dict:
+    """Opciones de create_engine según el backend y la configuración del pool."""
+    options = {
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+    }
+    if _is_sqlite(url):
+        # SQLite: conexiones compartibles entre hilos y espera ante bloqueos de escritura
+        options["connect_args"] = {
+            "check_same_thread": False,
+            "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+        }
+        database = make_url(url).database
+        if not database or database == ":memory:":
+            # Base en memoria: una única conexión compartida, que es donde vive la DB
+            options["poolclass"] = StaticPool
+            return options
+
+    options.update(
+        poolclass=InstrumentedAsyncAdaptedQueuePool if is_async else InstrumentedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+    )
+    return options
+
+
+def _configure_sqlite_connection(dbapi_connection, connection_record) -> None:
+    """PRAGMAs aplicados a cada conexión nueva de SQLite."""
+    cursor = dbapi_connection.cursor()
+    if settings.SQLITE_WAL:
+        # WAL permite lecturas concurrentes mientras se escribe
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.close()
+
+
 # Configuración del motor de SQLAlchemy
-# La opción 'pool_pre_ping=True' ayuda a manejar reconexiones si la DB se cae temporalmente.
 # 'future=True' habilita las características futuras de SQLAlchemy 2.0.
 engine = create_engine(
     DATABASE_URL, 
-    pool_pre_ping=True, 
-    future=True
+    future=True,
+    **_engine_options(DATABASE_URL)
 )
 
+if _is_sqlite(DATABASE_URL):
+    event.listen(engine, "connect", _configure_sqlite_connection)
+
 # Sesión de la base de datos
 SessionLocal = sessionmaker(
     autocommit=False, 
@@ -37,3 +122,217 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# --- Motor y sesiones asíncronas ---
+# Las rutas async usan get_async_db. Con DB_ASYNC_ENABLED=False se conserva el
+# camino síncrono: la dependencia entrega la Session de siempre envuelta en un
+# adaptador con la misma interfaz awaitable, que ejecuta cada operación en el
+# threadpool de Starlette.
+
+# Driver async equivalente para cada backend soportado
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+def get_async_database_url(url: str) -> str:
+    """Convierte una URL síncrona (sqlite://, postgresql://) en su variante async."""
+    parsed = make_url(url)
+    drivername = ASYNC_DRIVERS.get(parsed.get_backend_name(), parsed.drivername)
+    return parsed.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+async_engine = None
+AsyncSessionLocal = None
+
+if settings.DB_ASYNC_ENABLED:
+    async_engine = create_async_engine(
+        get_async_database_url(DATABASE_URL),
+        **_engine_options(DATABASE_URL, is_async=True)
+    )
+    if _is_sqlite(DATABASE_URL):
+        event.listen(async_engine.sync_engine, "connect", _configure_sqlite_connection)
+    # expire_on_commit=False: en async no se puede recargar un atributo de forma perezosa
+    AsyncSessionLocal = async_sessionmaker(
+        bind=async_engine,
+        autoflush=False,
+        expire_on_commit=False,
+    )
+
+
+def _buffered(result):
+    # Lee todas las filas dentro del hilo de la consulta, como hace AsyncSession.
+    # Los resultados del ORM siempre traen filas; un DML sin RETURNING se devuelve
+    # tal cual (solo se consulta su rowcount).
+    if isinstance(result, CursorResult) and not result.returns_rows:
+        return result
+    return result.freeze()()
+
+
+class SyncSessionAdapter:
+    """
+    Expone una Session síncrona con la interfaz awaitable de AsyncSession
+    (execute, scalar, get, commit, refresh, run_sync...).
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    def add(self, instance) -> None:
+        self.sync_session.add(instance)
+
+    def add_all(self, instances) -> None:
+        self.sync_session.add_all(instances)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    async def execute(self, statement, params=None, **kwargs):
+        return await self.run_sync(lambda session: _buffered(session.execute(statement, params, **kwargs)))
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, statement, params, **kwargs)
+
+    async def scalars(self, statement, params=None, **kwargs):
+        return (await self.execute(statement, params, **kwargs)).scalars()
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    async def flush(self, objects=None) -> None:
+        await run_in_threadpool(self.sync_session.flush, objects)
+
+    async def commit(self) -> None:
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self) -> None:
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def refresh(self, instance, attribute_names=None) -> None:
+        await run_in_threadpool(self.sync_session.refresh, instance, attribute_names)
+
+    async def delete(self, instance) -> None:
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def close(self) -> None:
+        await run_in_threadpool(self.sync_session.close)
+
+
+async def get_async_db():
+    """Dependencia para obtener una sesión async (o el adaptador síncrono)."""
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            yield session
+    else:
+        db = SyncSessionAdapter(SessionLocal(expire_on_commit=False))
+        try:
+            yield db
+        finally:
+            await db.close()
+
+
+# --- Estado del pool y verificación periódica ---
+
+def pool_status(target_engine) -> dict:
+    """Conexiones en uso, ociosas y en overflow del pool de un motor."""
+    pool = target_engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__}
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": pool.overflow(),
+    }
+
+
+def get_pool_metrics() -> dict:
+    """Estado de los pools y los histogramas de espera en el checkout."""
+    metrics = {"sync": pool_status(engine)}
+    if async_engine is not None:
+        metrics["async"] = pool_status(async_engine.sync_engine)
+    metrics["checkout_wait_seconds"] = {
+        name: histogram.snapshot() for name, histogram in POOL_CHECKOUT_WAIT.items()
+    }
+    return metrics
+
+
+def _check_sync_pool() -> None:
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    except DBAPIError as e:
+        # Descarta todas las conexiones del pool: las nuevas se abrirán bajo demanda
+        logger.warning(f"Verificación del pool fallida, se recrea el pool: {e}")
+        engine.dispose()
+
+
+async def _check_async_pool() -> None:
+    try:
+        async with async_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+    except DBAPIError as e:
+        logger.warning(f"Verificación del pool async fallida, se recrea el pool: {e}")
+        await async_engine.dispose()
+
+
+async def run_pool_liveness_checks(interval_seconds: float) -> None:
+    """
+    Sustituto del pre-ping por checkout: cada `interval_seconds` comprueba que la DB
+    responde y, si no, descarta las conexiones del pool. Se lanza desde el lifespan.
+    """
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await run_in_threadpool(_check_sync_pool)
+            if async_engine is not None:
+                await _check_async_pool()
+        except Exception:
+            # Un fallo inesperado (no de la DB) no debe detener las verificaciones
+            logger.exception("Error inesperado en la verificación del pool")
+
+
+# --- Calentamiento del pool al iniciar ---
+
+def _warm_up_sync_pool(connections: int) -> int:
+    """Abre `connections` conexiones del pool síncrono en paralelo y las devuelve al pool."""
+    if connections <= 0 or not isinstance(engine.pool, QueuePool):
+        return 0
+    opened = []
+    with ThreadPoolExecutor(max_workers=connections) as executor:
+        futures = [executor.submit(engine.connect) for _ in range(connections)]
+        for future in futures:
+            try:
+                opened.append(future.result())
+            except DBAPIError as e:
+                logger.warning(f"No se pudo abrir una conexión al calentar el pool: {e}")
+    for connection in opened:
+        connection.close()
+    return len(opened)
+
+
+async def _warm_up_async_pool(connections: int) -> int:
+    if async_engine is None or connections <= 0 or not isinstance(async_engine.pool, QueuePool):
+        return 0
+    results = await asyncio.gather(
+        *(async_engine.connect().start() for _ in range(connections)), return_exceptions=True
+    )
+    opened = [result for result in results if not isinstance(result, BaseException)]
+    for error in (result for result in results if isinstance(result, BaseException)):
+        logger.warning(f"No se pudo abrir una conexión async al calentar el pool: {error}")
+    await asyncio.gather(*(connection.close() for connection in opened))
+    return len(opened)
+
+
+async def warm_up_pools(connections: int) -> dict:
+    """
+    Abre en paralelo `connections` conexiones de cada pool (síncrono y async) para que
+    las primeras peticiones no paguen el coste de conectar. Devuelve cuántas se abrieron.
+    """
+    sync_opened, async_opened = await asyncio.gather(
+        run_in_threadpool(_warm_up_sync_pool, connections),
+        _warm_up_async_pool(connections),
+    )
+    return {"sync": sync_opened, "async": async_opened}
@@ -1,3 +1,4 @@
+from typing import Dict, Optional
 from fastapi import HTTPException, status
 
 # Excepción base para errores de negocio específicos
@@ -6,14 +7,62 @@ class BusinessException(HTTPException):
     Clase base para manejar errores de la lógica de negocio.
     Hereda de HTTPException para que FastAPI lo maneje automáticamente.
     """
-    def __init__(self, status_code: int, detail: str):
-        super().__init__(status_code=status_code, detail=detail)
+    def __init__(self, status_code: int, detail: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(status_code=status_code, detail=detail, headers=headers)
 
 # Excepción específica para errores de Google Calendar
 class GoogleCalendarError(BusinessException):
     """
     Se lanza cuando hay un problema al interactuar con la API de Google Calendar/Meet.
+    `retryable` indica un fallo transitorio (cuota, 5xx, red) que puede reintentarse.
     """
-    def __init__(self, detail: str):
+    def __init__(self, detail: str, retryable: bool = False):
         # Usamos 500 porque es un error de servicio externo.
-        super().__init__(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=detail)
\ No newline at end of file
+        super().__init__(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=detail)
+        self.retryable = retryable
+
+# Límite de ritmo local hacia la API de Google alcanzado
+class GoogleThrottledError(GoogleCalendarError):
+    """
+    Se lanza cuando el limitador de llamadas a Google no admite más peticiones por
+    ahora (por doctor o global). Es transitorio: se puede reintentar o encolar.
+    """
+    def __init__(self, detail: str, retry_after_seconds: int = 1):
+        super().__init__(detail, retryable=True)
+        self.status_code = status.HTTP_429_TOO_MANY_REQUESTS
+        self.headers = {"Retry-After": str(retry_after_seconds)}
+        self.retry_after_seconds = retry_after_seconds
+
+# Circuit breaker abierto: Google está fallando y no se le llama durante un tiempo
+class GoogleUnavailableError(GoogleCalendarError):
+    """
+    Se lanza sin llamar a Google mientras el circuit breaker está abierto, para
+    responder rápido en lugar de esperar timeouts.
+    """
+    def __init__(self, detail: str, retry_after_seconds: int = 1):
+        super().__init__(detail, retryable=True)
+        self.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        self.headers = {"Retry-After": str(retry_after_seconds)}
+        self.retry_after_seconds = retry_after_seconds
+
+# Excepción para servicios internos saturados (backpressure)
+class ServiceSaturatedError(BusinessException):
+    """
+    Se lanza cuando un recurso interno acotado (por ejemplo, el pool de hashing
+    de contraseñas) no admite más trabajo. El cliente debe reintentar más tarde.
+    """
+    def __init__(self, detail: str, retry_after_seconds: int = 1):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers={"Retry-After": str(retry_after_seconds)},
+        )
+
+# Conflicto de agenda: el horario se ocupó de forma concurrente
+class SlotConflictError(BusinessException):
+    """
+    Se lanza cuando la base de datos rechaza una cita porque se solapa con otra
+    del mismo doctor y los reintentos no encontraron otro horario.
+    """
+    def __init__(self, detail: str = "El horario solicitado ya no está disponible."):
+        super().__init__(status_code=status.HTTP_409_CONFLICT, detail=detail)
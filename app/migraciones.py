@@ -0,0 +1,148 @@
+import argparse
+import sys
+from typing import List, Optional, Sequence
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import AddConstraint
+
+from app.database import Base, engine
+from app.models.agenda_version import AgendaVersion
+from app.models.appointment import (
+    OVERLAP_CONSTRAINT_NAME, SQLITE_OVERLAP_TRIGGERS, Appointment,
+)
+from app.models.calendar_outbox import CalendarOutbox
+from app.models.user import User
+from app.models.working_hours import DoctorWorkingHours
+
+# Actualización del esquema de bases de datos existentes.
+#
+#   python -m app.migraciones
+#
+# create_all solo crea las tablas que faltan: no altera las que ya existen. Este
+# módulo lleva una base creada con el esquema original al esquema actual y es
+# idempotente (cada paso comprueba antes si ya está aplicado):
+#   - tablas nuevas: agenda_versions, calendar_outbox, doctor_working_hours y
+#     clinical_records (con sus índices);
+#   - appointments.version (NOT NULL, 1 en las filas existentes);
+#   - índices compuestos de appointments, en lugar de los simples de patient_id
+#     y doctor_id;
+#   - protección contra solapamientos: triggers en SQLite, restricción de exclusión
+#     en PostgreSQL. Si ya hay citas activas solapadas se aborta antes de cambiar
+#     nada, para resolverlas a mano y repetir.
+
+# Modelos cuyas tablas gestiona este módulo (importados para registrarlas en Base.metadata)
+MODELS = (User, Appointment, AgendaVersion, CalendarOutbox, DoctorWorkingHours)
+
+# Índices simples de la versión original, cubiertos por los compuestos
+LEGACY_APPOINTMENT_INDEXES = ("ix_appointments_patient_id", "ix_appointments_doctor_id")
+
+_OVERLAPPING_APPOINTMENTS = text("""
+    SELECT a.id, b.id FROM appointments a
+    JOIN appointments b ON a.doctor_id = b.doctor_id AND a.id < b.id
+        AND a.start_time < b.end_time AND b.start_time < a.end_time
+    WHERE a.status IN ('REQUESTED', 'CONFIRMED') AND b.status IN ('REQUESTED', 'CONFIRMED')
+    LIMIT 20
+""")
+
+
+def _has_overlap_protection(connection: Connection) -> bool:
+    if connection.dialect.name == "sqlite":
+        triggers = connection.execute(text(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_appointments_no_overlap_%'"
+        )).scalar()
+        return triggers == len(SQLITE_OVERLAP_TRIGGERS)
+    if connection.dialect.name == "postgresql":
+        return connection.execute(
+            text("SELECT 1 FROM pg_constraint WHERE conname = :name"), {"name": OVERLAP_CONSTRAINT_NAME}
+        ).first() is not None
+    return True
+
+
+def _check_no_overlaps(connection: Connection) -> None:
+    overlapping = connection.execute(_OVERLAPPING_APPOINTMENTS).all()
+    if overlapping:
+        pairs = ", ".join(f"{first}/{second}" for first, second in overlapping)
+        raise RuntimeError(
+            f"Hay citas activas solapadas del mismo doctor (ids {pairs}). "
+            "Cancélalas o reprográmalas antes de actualizar el esquema."
+        )
+
+
+def _add_overlap_protection(connection: Connection) -> None:
+    if connection.dialect.name == "sqlite":
+        for trigger in SQLITE_OVERLAP_TRIGGERS:
+            connection.exec_driver_sql(trigger)
+    else:
+        connection.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        constraint = next(
+            constraint for constraint in Appointment.__table__.constraints
+            if constraint.name == OVERLAP_CONSTRAINT_NAME
+        )
+        connection.execute(AddConstraint(constraint))
+
+
+def _upgrade(connection: Connection) -> List[str]:
+    applied: List[str] = []
+    inspector = inspect(connection)
+    existing = set(inspector.get_table_names())
+    # Se comprueba antes de cualquier cambio: en SQLite el DDL no se revierte
+    needs_protection = "appointments" in existing and not _has_overlap_protection(connection)
+    if needs_protection:
+        _check_no_overlaps(connection)
+
+    missing = [table for table in Base.metadata.sorted_tables if table.name not in existing]
+    if missing:
+        Base.metadata.create_all(connection, tables=missing)
+        applied.extend(f"tabla {table.name} creada" for table in missing)
+    if "appointments" not in existing:
+        # Tabla recién creada con create_all: ya tiene columnas, índices y restricciones
+        return applied
+
+    # 1. Columna de versión para la concurrencia optimista
+    if "version" not in {column["name"] for column in inspector.get_columns("appointments")}:
+        connection.exec_driver_sql("ALTER TABLE appointments ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        applied.append("columna appointments.version añadida")
+
+    # 2. Índices: fuera los simples, dentro los compuestos (y el parcial de citas activas)
+    indexes = {index["name"] for index in inspector.get_indexes("appointments")}
+    for name in LEGACY_APPOINTMENT_INDEXES:
+        if name in indexes:
+            connection.exec_driver_sql(f"DROP INDEX {name}")
+            applied.append(f"índice {name} eliminado")
+    for index in sorted(Appointment.__table__.indexes, key=lambda index: index.name):
+        if index.name not in indexes:
+            index.create(connection)
+            applied.append(f"índice {index.name} creado")
+
+    # 3. Protección contra solapamientos (usa el índice parcial del paso 2)
+    if needs_protection:
+        _add_overlap_protection(connection)
+        applied.append("protección contra solapamientos añadida")
+    return applied
+
+
+def upgrade_schema(target_engine: Engine = engine) -> List[str]:
+    """Aplica los pasos pendientes y devuelve su descripción (vacía si no había ninguno)."""
+    with target_engine.begin() as connection:
+        return _upgrade(connection)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Actualiza el esquema de una base de datos existente.")
+    parser.parse_args(argv)
+
+    try:
+        applied = upgrade_schema(engine)
+    except RuntimeError as e:
+        print(f"No se actualizó el esquema: {e}")
+        return 1
+    for step in applied:
+        print(f"Aplicado: {step}")
+    if not applied:
+        print("El esquema ya está actualizado.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
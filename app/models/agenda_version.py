@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, ForeignKey, DateTime
+from datetime import datetime
+
+
+from app.database import Base
+
+
+
+class AgendaVersion(Base):
+    """
+    Versión de la agenda de un usuario (paciente o doctor). Se incrementa en la
+    misma transacción que cualquier cambio de una de sus citas y alimenta los
+    ETag / Last-Modified del listado de citas.
+    """
+    __tablename__ = "agenda_versions"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -1,5 +1,6 @@
 import enum
-from sqlalchemy import Column, Integer, String, Enum, ForeignKey, Boolean, DateTime, Text, func
+from sqlalchemy import Column, Integer, String, Enum, ForeignKey, Boolean, DateTime, Text, Index, DDL, bindparam, event, func, text
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -24,15 +25,46 @@ class AppointmentStatus(enum.Enum):
     NO_SHOW = "No Presentado"     
 
 
+# Estados que ocupan tiempo en la agenda del doctor
+ACTIVE_STATUSES = (AppointmentStatus.REQUESTED, AppointmentStatus.CONFIRMED)
+
+# Nombres con los que la base de datos informa de un solapamiento (ver scheduling.is_booking_conflict)
+OVERLAP_CONSTRAINT_NAME = "ex_appointments_doctor_no_overlap"
+OVERLAP_TRIGGER_MESSAGE = "appointment_overlap"
+
+
 
 class Appointment(Base):
     __tablename__ = "appointments"
 
+    # Índices para las consultas calientes: agenda por doctor/paciente ordenada por
+    # (start_time, id) para la paginación keyset, y un índice parcial con solo las
+    # citas que ocupan agenda para disponibilidad y asignación.
+    __table_args__ = (
+        Index("ix_appointments_doctor_start", "doctor_id", "start_time", "id"),
+        Index("ix_appointments_patient_start", "patient_id", "start_time", "id"),
+        Index(
+            "ix_appointments_doctor_active_interval", "doctor_id", "start_time", "end_time",
+            postgresql_where=text("status IN ('REQUESTED', 'CONFIRMED')"),
+            sqlite_where=text("status IN ('REQUESTED', 'CONFIRMED')"),
+        ),
+        # Sin dobles reservas: dos citas activas del mismo doctor no pueden solaparse.
+        # En SQLite lo garantizan los triggers creados más abajo.
+        ExcludeConstraint(
+            ("doctor_id", "="),
+            (func.tsrange(text("start_time"), text("end_time"), text("'[)'")), "&&"),
+            name=OVERLAP_CONSTRAINT_NAME,
+            using="gist",
+            where=text("status IN ('REQUESTED', 'CONFIRMED')"),
+        ).ddl_if(dialect="postgresql"),
+    )
+
     id = Column(Integer, primary_key=True, index=True)
     
     
-    patient_id = Column(Integer, ForeignKey("users.id"), index=True)
-    doctor_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True) 
+    # Indexados mediante los índices compuestos de __table_args__
+    patient_id = Column(Integer, ForeignKey("users.id"))
+    doctor_id = Column(Integer, ForeignKey("users.id"), nullable=True) 
 
    
     start_time = Column(DateTime)
@@ -49,6 +81,12 @@ class Appointment(Base):
    
     notes = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Concurrencia optimista: cada UPDATE del ORM exige la versión leída y la incrementa
+    # (StaleDataError si otra transacción modificó la cita entretanto)
+    version = Column(Integer, nullable=False, default=1)
+
+    __mapper_args__ = {"version_id_col": version}
     
     
     
@@ -57,7 +95,7 @@ class Appointment(Base):
         "User", 
         back_populates="patient_appointments", 
         foreign_keys=[patient_id],
-        lazy="joined"
+        lazy="select"
     )
 
     
@@ -65,5 +103,54 @@ class Appointment(Base):
         "User", 
         back_populates="doctor_appointments", 
         foreign_keys=[doctor_id],
-        lazy="joined"
+        lazy="select"
     )
+
+
+# Condición "ocupa agenda" para las consultas. Los estados van como literales, igual
+# que en el índice parcial: el planificador solo usa ix_appointments_doctor_active_interval
+# si puede demostrar su condición, y con parámetros enlazados no puede.
+ACTIVE_STATUS_FILTER = Appointment.status.in_(
+    bindparam("active_statuses", list(ACTIVE_STATUSES), expanding=True, literal_execute=True)
+)
+
+
+# --- Protección contra solapamientos en la base de datos ---
+# PostgreSQL: el índice GiST de la restricción de exclusión necesita btree_gist
+# para comparar doctor_id con "=".
+event.listen(
+    Appointment.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql"),
+)
+
+# SQLite no tiene restricciones de exclusión: triggers equivalentes en INSERT y UPDATE.
+# Las citas activas de un doctor no se solapan entre sí, así que basta con mirar la
+# última que empieza antes del fin de la nueva (índice parcial, O(log n)) en lugar
+# de recorrer todo su historial. Sin estadísticas, ix_appointments_doctor_start
+# empata en coste y el planificador elige según el orden de creación de los
+# índices: INDEXED BY fija el parcial.
+_SQLITE_OVERLAP_CHECK = f"""
+    SELECT RAISE(ABORT, '{OVERLAP_TRIGGER_MESSAGE}')
+    WHERE NEW.doctor_id IS NOT NULL AND NEW.status IN ('REQUESTED', 'CONFIRMED') AND (
+        SELECT end_time FROM appointments INDEXED BY ix_appointments_doctor_active_interval
+        WHERE doctor_id = NEW.doctor_id
+          AND id IS NOT NEW.id
+          AND status IN ('REQUESTED', 'CONFIRMED')
+          AND start_time < NEW.end_time
+        ORDER BY start_time DESC
+        LIMIT 1
+    ) > NEW.start_time;
+"""
+
+SQLITE_OVERLAP_TRIGGERS = (
+    f"""CREATE TRIGGER IF NOT EXISTS trg_appointments_no_overlap_insert
+    BEFORE INSERT ON appointments
+    BEGIN {_SQLITE_OVERLAP_CHECK} END""",
+    f"""CREATE TRIGGER IF NOT EXISTS trg_appointments_no_overlap_update
+    BEFORE UPDATE OF doctor_id, start_time, end_time, status ON appointments
+    BEGIN {_SQLITE_OVERLAP_CHECK} END""",
+)
+
+for _trigger in SQLITE_OVERLAP_TRIGGERS:
+    event.listen(Appointment.__table__, "after_create", DDL(_trigger).execute_if(dialect="sqlite"))
@@ -0,0 +1,55 @@
+import enum
+from sqlalchemy import Column, Integer, String, Enum, ForeignKey, DateTime, Text, Index
+from sqlalchemy.orm import relationship
+from datetime import datetime
+
+
+from app.database import Base
+
+
+
+class CalendarOutboxStatus(enum.Enum):
+
+    PENDING = "Pendiente"
+    IN_PROGRESS = "En Proceso"
+    DONE = "Completado"
+    FAILED = "Fallido"
+
+
+
+class CalendarOutbox(Base):
+    """
+    Outbox transaccional de eventos de Google Calendar/Meet.
+    La fila se confirma en la misma transacción que la cita y un worker en segundo
+    plano crea el evento en Google y escribe el enlace de Meet en la cita.
+    """
+    __tablename__ = "calendar_outbox"
+
+    # El worker busca las entradas pendientes cuyo próximo intento ya venció
+    __table_args__ = (
+        Index("ix_calendar_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    appointment_id = Column(Integer, ForeignKey("appointments.id"), unique=True, nullable=False)
+    doctor_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    # Datos del evento
+    summary = Column(String, nullable=False)
+    description = Column(Text, nullable=True)
+    patient_email = Column(String, nullable=False)
+
+    status = Column(Enum(CalendarOutboxStatus), default=CalendarOutboxStatus.PENDING, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Momento en que un worker tomó la entrada (para recuperar entradas huérfanas)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    event_url = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+    appointment = relationship("Appointment", lazy="select")
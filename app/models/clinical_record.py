@@ -0,0 +1,38 @@
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, Text
+from sqlalchemy.orm import relationship
+from datetime import datetime
+
+
+from app.database import Base
+
+
+
+class ClinicalRecord(Base):
+    """
+    Entrada del historial clínico de un paciente, registrada por un doctor.
+    Es el destino de User.patient_records y User.doctor_records.
+    """
+    __tablename__ = "clinical_records"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    patient_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    doctor_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+
+    notes = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+    patient = relationship(
+        "User",
+        back_populates="patient_records",
+        foreign_keys=[patient_id],
+        lazy="select"
+    )
+
+    doctor = relationship(
+        "User",
+        back_populates="doctor_records",
+        foreign_keys=[doctor_id],
+        lazy="select"
+    )
@@ -4,6 +4,7 @@ from sqlalchemy.orm import relationship
 
 
 from app.database import Base 
+from app.models.clinical_record import ClinicalRecord
 
 
 class UserRole(enum.Enum):
@@ -31,14 +32,15 @@ class User(Base):
     
     google_refresh_token = Column(Text, nullable=True) 
 
-    
+    # Las relaciones se cargan de forma perezosa por defecto. Cada endpoint
+    # elige su perfil de carga en app/utils/loading_profiles.py.
 
     
     patient_records = relationship(
         "ClinicalRecord", 
         back_populates="patient",
-        foreign_keys="ClinicalRecord.patient_id",
-        lazy="joined",
+        foreign_keys=[ClinicalRecord.patient_id],
+        lazy="select",
         cascade="all, delete-orphan"
     )
 
@@ -46,8 +48,8 @@ class User(Base):
     doctor_records = relationship(
         "ClinicalRecord", 
         back_populates="doctor", 
-        foreign_keys="ClinicalRecord.doctor_id",
-        lazy="joined"
+        foreign_keys=[ClinicalRecord.doctor_id],
+        lazy="select"
     )
 
     
@@ -55,7 +57,7 @@ class User(Base):
         "Appointment", 
         back_populates="patient", 
         foreign_keys="Appointment.patient_id",
-        lazy="joined"
+        lazy="select"
     )
 
     
@@ -63,5 +65,5 @@ class User(Base):
         "Appointment", 
         back_populates="doctor", 
         foreign_keys="Appointment.doctor_id",
-        lazy="joined"
+        lazy="select"
     )
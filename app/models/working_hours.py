@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, ForeignKey, Time
+
+
+from app.database import Base
+
+
+
+class DoctorWorkingHours(Base):
+    """
+    Franja del horario laboral semanal de un doctor: día de la semana (0 = lunes)
+    y horas [inicio, fin); un fin a las 00:00 llega hasta medianoche. Las franjas
+    de un doctor reemplazan por completo a DEFAULT_WORKING_HOURS (ver
+    app/utils/availability.py); un doctor sin franjas usa el horario por defecto.
+    """
+    __tablename__ = "doctor_working_hours"
+
+    id = Column(Integer, primary_key=True)
+    doctor_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    weekday = Column(Integer, nullable=False)
+    start_time = Column(Time, nullable=False)
+    end_time = Column(Time, nullable=False)
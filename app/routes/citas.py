@@ -1,74 +1,336 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import dataclasses
+import json
+import random
+from collections import defaultdict
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import and_, delete, insert, or_, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime, timedelta
+from typing import Any, Dict, List, Literal, Optional, Set, Tuple
+from datetime import datetime, time, timedelta, timezone
 
 # Importaciones del proyecto
-from app.database import get_db
+from app.database import get_async_db
 from app.models.user import User, UserRole
 from app.models.appointment import Appointment, AppointmentStatus, PriorityLevel
-from app.utils.schemas import AppointmentCreate, AppointmentResponse, AppointmentUpdate
+from app.models.working_hours import DoctorWorkingHours
+from app.utils.schemas import (
+    AppointmentBatchItem, AppointmentBatchItemResult, AppointmentBatchResponse,
+    AppointmentBulkTransition, AppointmentBulkTransitionResponse,
+    AppointmentCreate, AppointmentResponse, AppointmentUpdate, EarliestSlotResponse, WorkingHoursRange
+)
 from app.utils.security import get_current_user # Tu archivo de seguridad (validacion_s.py)
+from app.utils.principal_cache import PrincipalSnapshot
+from app.utils.loading_profiles import loading_options
+from app.utils.scheduling import (
+    ACTIVE_STATUS_FILTER, Assignment, DoctorIntervalIndex, SchedulingRequest,
+    is_booking_conflict, scheduling_engine, slot_is_free_in_db
+)
+from app.utils.pagination import decode_cursor, encode_cursor
+from app.utils.fast_json import RawJSONResponse, RowSerializer
+from app.utils.agenda_versions import agenda_etag, cache_headers, get_agenda_version, is_not_modified
+from app.utils.agenda_events import agenda_events
+from app.utils.availability import DEFAULT_WORKING_HOURS, load_working_hours
+from app.utils.availability_cache import availability_cache, find_earliest_slot_cached
+from app.utils.appointment_changes import AppointmentChange, AppointmentState, record_changes
+from app.utils.appointment_lifecycle import TransitionCriteria, bulk_transition
+from app.config import settings
+from app.excepciones import SlotConflictError
 
 # Inicialización del router
 router = APIRouter(prefix="/citas", tags=["Citas Médicas"])
 
 # ----------------------------------------------------------------------
-# LÓGICA DEL ALGORITMO DE ASIGNACIÓN (Placeholder)
+# LÓGICA DEL ALGORITMO DE ASIGNACIÓN
 # ----------------------------------------------------------------------
 
 def assign_priority_and_schedule(db: Session, appointment: Appointment):
     """
-    Función que implementará el Algoritmo de Asignación por Prioridad.
+    Algoritmo de Asignación por Prioridad (ver app/utils/scheduling.py).
     
     CRITERIOS DE PRIORIDAD:
-    1. UrgencyLevel (el más alto va primero).
+    1. PriorityLevel (el más alto va primero).
     2. Tiempo de espera (FIFO para misma prioridad).
-    3. Disponibilidad de doctores.
+    3. Disponibilidad de doctores (el menos cargado libre en el horario pedido,
+       o el hueco libre más cercano).
     
-    Esta es una implementación MOCK, se expandirá más adelante.
+    La reserva del motor en memoria se verifica contra la base de datos dentro de
+    la transacción actual; si otro proceso ocupó el horario, se recarga la agenda
+    de ese doctor y se reintenta con otro candidato. Si el paciente pidió un doctor
+    concreto y ese doctor está ocupado en el horario, la cita se rechaza (409).
     """
+    scheduling_engine.ensure_loaded(db)
+
+    if appointment.doctor_id is not None and not scheduling_engine.knows_doctor(appointment.doctor_id):
+        doctor = db.get(User, appointment.doctor_id, options=loading_options("auth"))
+        if doctor is None or doctor.role != UserRole.DOCTOR:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="El doctor solicitado no existe."
+            )
+        scheduling_engine.reload_doctor(db, doctor.id)
+
+    request = SchedulingRequest(
+        start_time=appointment.start_time,
+        end_time=appointment.end_time,
+        priority_level=appointment.priority_level,
+        doctor_id=appointment.doctor_id,
+    )
+
+    rejected = set()
+    for _ in range(settings.SCHEDULING_MAX_ATTEMPTS):
+        assignment = scheduling_engine.reserve(request, exclude=rejected)
+        if assignment is None:
+            break
+        free = False
+        try:
+            free = slot_is_free_in_db(db, assignment)
+        finally:
+            # Ocupado en la DB o la consulta falló: la reserva no debe quedar pendiente
+            if not free:
+                scheduling_engine.release(assignment)
+        if free:
+            appointment.doctor_id = assignment.doctor_id
+            appointment.start_time = assignment.start_time
+            appointment.end_time = assignment.end_time
+            appointment.status = AppointmentStatus.CONFIRMED
+            
+            # Opcional: Aquí se podría integrar la lógica para crear el evento en Google Calendar
+            # create_google_calendar_event(appointment)
+            return appointment
+
+        # El horario ya estaba ocupado en la DB (otro worker): se sincroniza y se reintenta
+        scheduling_engine.reload_doctor(db, assignment.doctor_id)
+        rejected.add(assignment.doctor_id)
+
+    if request.doctor_id is not None:
+        raise SlotConflictError("El doctor solicitado no está disponible en ese horario.")
+
+    # Si no hay doctor disponible, la cita queda solicitada sin doctor asignado
+    # (con doctor ocuparía su agenda y chocaría con la restricción de solapamiento)
+    appointment.doctor_id = None
+    appointment.status = AppointmentStatus.REQUESTED
+
+    return appointment
+
+# ----------------------------------------------------------------------
+# CARGA MASIVA (lista de espera completa en una sola pasada)
+# ----------------------------------------------------------------------
+
+def _find_db_conflicts(db: Session, scheduled: List[Tuple[SchedulingRequest, Optional[Assignment]]]) -> Set[int]:
+    """
+    Verifica un bloque de reservas contra la DB con una sola consulta y devuelve
+    las claves de las que se solapan. No bloquea a los doctores: lo que otra
+    transacción confirme después de esta lectura lo rechaza la restricción de
+    solapamiento al insertar, y el bloque se vuelve a verificar.
+    """
+    assignments = [(request, assignment) for request, assignment in scheduled if assignment is not None]
+    if not assignments:
+        return set()
+
+    doctor_ids = sorted({assignment.doctor_id for _, assignment in assignments})
+    rows = db.execute(
+        select(Appointment.doctor_id, Appointment.start_time, Appointment.end_time).where(
+            Appointment.doctor_id.in_(doctor_ids),
+            ACTIVE_STATUS_FILTER,
+            Appointment.start_time < max(assignment.end_time for _, assignment in assignments),
+            Appointment.end_time > min(assignment.start_time for _, assignment in assignments),
+        )
+    ).all()
+
+    booked = defaultdict(list)
+    for doctor_id, start, end in rows:
+        booked[doctor_id].append((start, end))
+    indexes = {doctor_id: DoctorIntervalIndex(booked[doctor_id]) for doctor_id in doctor_ids}
+
+    return {
+        request.key for request, assignment in assignments
+        if not indexes[assignment.doctor_id].is_free(assignment.start_time, assignment.end_time)
+    }
+
+
+def _resolve_conflicts(db: Session, scheduled, conflicts: Set[int], retry: bool):
+    """
+    Libera las reservas en conflicto, recarga esos doctores y (opcionalmente) reasigna.
+    La recarga conserva las reservas pendientes del resto del lote (ver
+    SchedulingEngine.reload_doctor).
+    """
+    for request, assignment in scheduled:
+        if request.key in conflicts:
+            scheduling_engine.release(assignment)
+    for doctor_id in {assignment.doctor_id for request, assignment in scheduled if request.key in conflicts}:
+        scheduling_engine.reload_doctor(db, doctor_id)
+    resolved = []
+    for request, assignment in scheduled:
+        if request.key in conflicts:
+            assignment = scheduling_engine.reserve(request) if retry else None
+        resolved.append((request, assignment))
+    return resolved
+
+
+def schedule_and_persist_batch(
+    db: Session,
+    items: List[Tuple[int, AppointmentBatchItem, int]]
+) -> Dict[int, AppointmentBatchItemResult]:
+    """
+    Asigna y guarda un lote de citas. items: (índice, datos, patient_id).
     
-    # 1. Mapear UrgencyLevel a un factor numérico de prioridad (ya hecho por el Enum)
-    priority_score = appointment.urgency_level.value
+    1. El motor asigna todo el lote en orden de prioridad en una sola pasada.
+    2. Cada bloque de APPOINTMENT_BATCH_CHUNK_SIZE citas se verifica contra la DB
+       con una consulta, se inserta con un INSERT masivo y se confirma en su
+       propia transacción.
     
-    # 2. Buscar al doctor con menor carga (MOCK)
-    # Por ahora, simplemente asignaremos un doctor ficticio con role DOCTOR
-    available_doctor = db.query(User).filter(User.role == UserRole.DOCTOR).first()
-
-    if available_doctor:
-        appointment.doctor_id = available_doctor.id
-        
-        # 3. Asignar una hora ficticia basada en la prioridad (MOCK: Citas más urgentes tienen 
-        # una hora de programación más cercana)
-        if priority_score == PriorityLevel.CRITICAL.value:
-            scheduled_time = datetime.utcnow() + timedelta(minutes=30)
-        elif priority_score == PriorityLevel.HIGH.value:
-            scheduled_time = datetime.utcnow() + timedelta(hours=2)
-        else:
-            scheduled_time = datetime.utcnow() + timedelta(hours=24)
-
-        appointment.scheduled_at = scheduled_time
-        appointment.status = AppointmentStatus.CONFIRMED
-        
-        # Opcional: Aquí se podría integrar la lógica para crear el evento en Google Calendar
-        # create_google_calendar_event(appointment)
-        
-    else:
-        # Si no hay doctor disponible, se queda en pendiente o se rechaza
-        appointment.status = AppointmentStatus.PENDING 
+    Las citas que piden un doctor concreto ocupado en ese horario no se guardan:
+    se devuelven con error.
+    """
+    scheduling_engine.ensure_loaded(db)
+    results: Dict[int, AppointmentBatchItemResult] = {}
 
-    return appointment
+    # Doctores solicitados que el motor aún no conoce
+    requested_doctors = {item.doctor_id for _, item, _ in items if item.doctor_id is not None}
+    unknown = {doctor_id for doctor_id in requested_doctors if not scheduling_engine.knows_doctor(doctor_id)}
+    valid_doctors = set(db.scalars(
+        select(User.id).where(User.id.in_(unknown), User.role == UserRole.DOCTOR)
+    ).all()) if unknown else set()
+    for doctor_id in valid_doctors:
+        scheduling_engine.reload_doctor(db, doctor_id)
+
+    requests = []
+    by_key = {}
+    for index, item, patient_id in items:
+        if item.doctor_id in unknown and item.doctor_id not in valid_doctors:
+            results[index] = AppointmentBatchItemResult(index=index, ok=False, error="El doctor solicitado no existe.")
+            continue
+        by_key[index] = (item, patient_id)
+        requests.append(SchedulingRequest(
+            start_time=item.start_time,
+            end_time=item.end_time,
+            priority_level=PriorityLevel(item.priority_level),
+            doctor_id=item.doctor_id,
+            key=index,
+        ))
+
+    scheduled = scheduling_engine.schedule_batch(requests)
+    chunk_size = settings.APPOINTMENT_BATCH_CHUNK_SIZE
+
+    for offset in range(0, len(scheduled), chunk_size):
+        chunk = scheduled[offset:offset + chunk_size]
+
+        # Si otra petición ocupa un horario entre la verificación y el INSERT, la
+        # restricción de solapamiento rechaza el bloque y se vuelve a verificar
+        for save_attempt in range(1, settings.SCHEDULING_MAX_ATTEMPTS + 1):
+            # Verificación transaccional; los conflictos se reasignan hasta agotar los intentos
+            conflicts = _find_db_conflicts(db, chunk)
+            for attempt in range(1, settings.SCHEDULING_MAX_ATTEMPTS + 1):
+                if not conflicts:
+                    break
+                chunk = _resolve_conflicts(db, chunk, conflicts, retry=attempt < settings.SCHEDULING_MAX_ATTEMPTS)
+                conflicts = _find_db_conflicts(db, chunk)
+
+            # Sin asignación: queda solicitada sin doctor, salvo que se pidiera uno concreto
+            accepted = [(request, assignment) for request, assignment in chunk
+                        if assignment is not None or request.doctor_id is None]
+            rows = []
+            for request, assignment in accepted:
+                item, patient_id = by_key[request.key]
+                rows.append({
+                    "patient_id": patient_id,
+                    "doctor_id": assignment.doctor_id if assignment else None,
+                    "start_time": assignment.start_time if assignment else request.start_time,
+                    "end_time": assignment.end_time if assignment else request.end_time,
+                    "is_virtual": item.is_virtual,
+                    "priority_level": request.priority_level,
+                    "notes": item.notes,
+                    "status": AppointmentStatus.CONFIRMED if assignment else AppointmentStatus.REQUESTED,
+                })
+
+            try:
+                appointment_ids = db.execute(
+                    insert(Appointment).returning(Appointment.id, sort_by_parameter_order=True),
+                    rows
+                ).scalars().all() if rows else []
+                # El INSERT masivo no pasa por los eventos del ORM: se notifican los cambios a mano
+                record_changes(db, [
+                    AppointmentChange(appointment_id, None, AppointmentState(
+                        patient_id=row["patient_id"], doctor_id=row["doctor_id"],
+                        start_time=row["start_time"], end_time=row["end_time"], status=row["status"],
+                    ))
+                    for appointment_id, row in zip(appointment_ids, rows)
+                ])
+                db.commit()
+                save_error = None
+                break
+            except SQLAlchemyError as e:
+                db.rollback()
+                save_error = e
+                if not is_booking_conflict(e):
+                    break
+
+        for request, assignment in chunk:
+            if assignment is None and request.doctor_id is not None:
+                results[request.key] = AppointmentBatchItemResult(
+                    index=request.key, ok=False, error="El doctor solicitado no está disponible en ese horario."
+                )
+
+        if save_error is not None:
+            for request, assignment in accepted:
+                if assignment is not None:
+                    scheduling_engine.release(assignment)
+                results[request.key] = AppointmentBatchItemResult(
+                    index=request.key, ok=False, error=f"Error al guardar el bloque: {save_error.__class__.__name__}"
+                )
+            continue
+
+        for (request, _), row, appointment_id in zip(accepted, rows, appointment_ids):
+            results[request.key] = AppointmentBatchItemResult(
+                index=request.key,
+                ok=True,
+                appointment_id=appointment_id,
+                doctor_id=row["doctor_id"],
+                start_time=row["start_time"],
+                end_time=row["end_time"],
+                status=row["status"],
+            )
+
+    return results
+
+
+def _parse_batch_body(body: bytes, content_type: str) -> List[Tuple[int, Any]]:
+    """Devuelve (índice, objeto JSON o excepción) para un JSON array o un stream NDJSON."""
+    if "ndjson" in content_type or "jsonl" in content_type:
+        parsed = []
+        for index, line in enumerate(line for line in body.splitlines() if line.strip()):
+            try:
+                parsed.append((index, json.loads(line)))
+            except ValueError as e:
+                parsed.append((index, e))
+        return parsed
+
+    try:
+        data = json.loads(body or b"[]")
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="El cuerpo no es un JSON válido.")
+    if not isinstance(data, list):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Se esperaba una lista de citas.")
+    return list(enumerate(data))
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in error.errors())
 
 # ----------------------------------------------------------------------
 # ENDPOINTS
 # ----------------------------------------------------------------------
 
 @router.post("/", response_model=AppointmentResponse, status_code=status.HTTP_201_CREATED)
-def request_appointment(
+async def request_appointment(
     appointment_data: AppointmentCreate, 
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: PrincipalSnapshot = Depends(get_current_user)
 ):
     """
     Permite a un paciente solicitar una nueva cita. 
@@ -80,47 +342,361 @@ def request_appointment(
             detail="Solo los pacientes pueden solicitar citas."
         )
 
-    # Crear la nueva cita en la base de datos
-    db_appointment = Appointment(
-        patient_id=current_user.id,
-        reason=appointment_data.reason,
-        urgency_level=appointment_data.urgency_level,
-        is_telemedicine=appointment_data.is_telemedicine,
-        status=AppointmentStatus.PENDING # Inicia siempre pendiente
-    )
-    
-    # Ejecutar la lógica de asignación (incluso si es la primera vez)
-    db_appointment = assign_priority_and_schedule(db, db_appointment)
+    def build_appointment() -> Appointment:
+        return Appointment(
+            patient_id=current_user.id,
+            doctor_id=appointment_data.doctor_id,
+            start_time=appointment_data.start_time,
+            end_time=appointment_data.end_time,
+            is_virtual=appointment_data.is_virtual,
+            priority_level=PriorityLevel(appointment_data.priority_level),
+            notes=appointment_data.notes,
+            status=AppointmentStatus.REQUESTED # Inicia siempre solicitada
+        )
 
-    db.add(db_appointment)
-    db.commit()
-    db.refresh(db_appointment)
+    # Concurrencia optimista: no se bloquea al doctor. Si la base de datos rechaza la
+    # cita porque otra petición ocupó el horario entretanto, se recarga la agenda de
+    # ese doctor en el motor y se vuelve a asignar.
+    for attempt in range(1, settings.SCHEDULING_MAX_ATTEMPTS + 1):
+        # La lógica de asignación es síncrona: se ejecuta con la sesión síncrona subyacente
+        db_appointment = await db.run_sync(assign_priority_and_schedule, build_appointment())
+        db.add(db_appointment)
+        try:
+            await db.commit()
+            break
+        except Exception as e:
+            await db.rollback()
+            # La reserva en memoria no llegó a persistirse
+            if db_appointment.status == AppointmentStatus.CONFIRMED:
+                scheduling_engine.release(Assignment(
+                    db_appointment.doctor_id, db_appointment.start_time, db_appointment.end_time
+                ))
+            if not is_booking_conflict(e):
+                raise
+            if db_appointment.doctor_id is not None:
+                await db.run_sync(scheduling_engine.reload_doctor, db_appointment.doctor_id)
+            if attempt == settings.SCHEDULING_MAX_ATTEMPTS:
+                raise SlotConflictError()
+            # Espera breve y aleatoria para no volver a chocar con la misma petición
+            await asyncio.sleep(random.uniform(0, 0.05 * attempt))
+    await db.refresh(db_appointment)
     
     return db_appointment
 
+# Columnas que devuelve el listado: proyección directa, sin cargar los User relacionados
+APPOINTMENT_LIST_COLUMNS = (
+    Appointment.id,
+    Appointment.patient_id,
+    Appointment.doctor_id,
+    Appointment.start_time,
+    Appointment.end_time,
+    Appointment.status,
+    Appointment.priority_level,
+    Appointment.video_url,
+    Appointment.created_at,
+)
+
+# Codifica las filas de APPOINTMENT_LIST_COLUMNS sin pasar por AppointmentResponse
+APPOINTMENT_ROW_SERIALIZER = RowSerializer(APPOINTMENT_LIST_COLUMNS)
+
 @router.get("/my", response_model=List[AppointmentResponse])
-def get_my_appointments(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def get_my_appointments(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: PrincipalSnapshot = Depends(get_current_user),
+    limit: int = Query(settings.APPOINTMENTS_PAGE_DEFAULT, ge=1, le=settings.APPOINTMENTS_PAGE_MAX),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en la cabecera X-Next-Cursor"),
+    status_filter: Optional[AppointmentStatus] = Query(None, alias="status"),
+    priority: Optional[PriorityLevel] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    format: Literal["json", "ndjson"] = "json",
 ):
     """
-    Obtiene todas las citas solicitadas por el usuario autenticado (paciente o doctor).
+    Obtiene las citas del usuario autenticado (paciente o doctor), ordenadas por
+    (start_time, id) y paginadas por cursor: si hay más resultados, la cabecera
+    X-Next-Cursor trae el cursor de la página siguiente.
+    Filtros opcionales por estado, prioridad y rango de fechas de inicio. Las citas
+    sin fecha de inicio no se listan.
+    Con format=ndjson la página se envía como stream NDJSON.
+    Responde con ETag y Last-Modified de la versión de la agenda; un If-None-Match
+    vigente recibe 304 sin consultar las citas.
     """
     if current_user.role == UserRole.PATIENT:
         # Si es paciente, listar sus citas como paciente
-        appointments = db.query(Appointment).filter(
-            Appointment.patient_id == current_user.id
-        ).all()
+        owner_filter = Appointment.patient_id == current_user.id
     elif current_user.role == UserRole.DOCTOR:
         # Si es doctor, listar las citas que tiene asignadas
-        appointments = db.query(Appointment).filter(
-            Appointment.doctor_id == current_user.id
-        ).all()
+        owner_filter = Appointment.doctor_id == current_user.id
     else:
         # Si es ADMIN, podría listar todas, pero por ahora solo le mostramos un error para simplificar
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Acceso no autorizado para este rol. Por favor use una ruta específica de administrador."
         )
-        
-    return appointments
+
+    # La versión se lee antes que las citas: si un cambio se confirma entre ambas
+    # lecturas, el ETag queda atrasado y el siguiente sondeo descarga de nuevo.
+    version, last_modified = await get_agenda_version(db, current_user.id)
+    etag = agenda_etag(current_user.id, version, request)
+    headers = cache_headers(etag, last_modified)
+    if is_not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    # Las filas sin start_time no tienen posición en el orden (start_time, id) ni
+    # pueden codificarse en un cursor: quedan fuera del listado paginado.
+    query = select(*APPOINTMENT_LIST_COLUMNS).where(owner_filter, Appointment.start_time.is_not(None))
+    if status_filter is not None:
+        query = query.where(Appointment.status == status_filter)
+    if priority is not None:
+        query = query.where(Appointment.priority_level == priority)
+    if date_from is not None:
+        query = query.where(Appointment.start_time >= date_from)
+    if date_to is not None:
+        query = query.where(Appointment.start_time < date_to)
+    if cursor:
+        cursor_start, cursor_id = decode_cursor(cursor)
+        query = query.where(or_(
+            Appointment.start_time > cursor_start,
+            and_(Appointment.start_time == cursor_start, Appointment.id > cursor_id),
+        ))
+
+    # Se pide una fila extra para saber si existe una página siguiente
+    query = query.order_by(Appointment.start_time, Appointment.id).limit(limit + 1)
+    rows = (await db.execute(query)).all()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1].start_time, rows[-1].id)
+
+    # Las filas de Core se codifican directamente (mismo JSON que AppointmentResponse)
+    if format == "ndjson":
+        lines = (APPOINTMENT_ROW_SERIALIZER.dumps_line(row) for row in rows)
+        return StreamingResponse(lines, media_type="application/x-ndjson", headers=headers)
+
+    return RawJSONResponse(APPOINTMENT_ROW_SERIALIZER.dumps(rows), headers=headers)
+
+@router.get("/my/events")
+async def stream_my_appointment_events(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: PrincipalSnapshot = Depends(get_current_user),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    """
+    Stream SSE (text/event-stream) con los cambios de las citas del usuario
+    autenticado: created, confirmed, rescheduled, cancelled, video_url, etc.
+    Al reconectar con la cabecera Last-Event-ID se reenvían los eventos perdidos;
+    si ya no están en el historial llega un evento `resync` y el cliente debe
+    volver a cargar /citas/my.
+    """
+    if current_user.role not in (UserRole.PATIENT, UserRole.DOCTOR):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Acceso no autorizado para este rol. Por favor use una ruta específica de administrador."
+        )
+    # La conexión puede durar horas: no debe retener una conexión del pool
+    await db.close()
+    agenda_events.ensure_capacity()
+    return StreamingResponse(
+        agenda_events.stream(current_user.id, last_event_id),
+        media_type="text/event-stream",
+        # Sin buffering en proxies (nginx) para que cada evento llegue al momento
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/disponibilidad/primer-hueco", response_model=EarliestSlotResponse)
+async def find_earliest_available_slot(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: PrincipalSnapshot = Depends(get_current_user),
+    duration_minutes: int = Query(30, ge=1, le=8 * 60),
+    not_before: Optional[datetime] = None,
+    days: int = Query(14, ge=1, le=settings.AVAILABILITY_MAX_DAYS),
+):
+    """
+    Busca el primer hueco libre de `duration_minutes` entre todos los doctores,
+    desde `not_before` (por defecto, ahora) y dentro de los próximos `days` días.
+    Un `not_before` con zona horaria se convierte a UTC (las citas se guardan en
+    UTC sin zona).
+    """
+    if not_before is not None and not_before.tzinfo is not None:
+        not_before = not_before.astimezone(timezone.utc).replace(tzinfo=None)
+    slot = await db.run_sync(
+        find_earliest_slot_cached,
+        timedelta(minutes=duration_minutes),
+        not_before or datetime.utcnow(),
+        days,
+    )
+    if slot is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No hay huecos libres en el rango solicitado."
+        )
+    doctor_id, start_time, end_time = slot
+    return EarliestSlotResponse(doctor_id=doctor_id, start_time=start_time, end_time=end_time)
+
+@router.get("/disponibilidad/horario", response_model=List[WorkingHoursRange])
+async def get_my_working_hours(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: PrincipalSnapshot = Depends(get_current_user),
+):
+    """Horario laboral semanal del doctor autenticado (el horario por defecto si no guardó ninguno)."""
+    if current_user.role != UserRole.DOCTOR:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los doctores tienen horario laboral."
+        )
+    templates = await db.run_sync(load_working_hours, [current_user.id])
+    template = templates.get(current_user.id, DEFAULT_WORKING_HOURS)
+    return [
+        WorkingHoursRange(weekday=weekday, start_time=start, end_time=end)
+        for weekday, ranges in sorted(template.items()) for start, end in ranges
+    ]
+
+@router.put("/disponibilidad/horario", response_model=List[WorkingHoursRange])
+async def set_my_working_hours(
+    ranges: List[WorkingHoursRange],
+    db: AsyncSession = Depends(get_async_db),
+    current_user: PrincipalSnapshot = Depends(get_current_user),
+):
+    """
+    Reemplaza el horario laboral semanal del doctor autenticado. Una lista vacía
+    vuelve al horario por defecto. La disponibilidad cacheada del doctor se
+    recalcula en la siguiente consulta.
+    """
+    if current_user.role != UserRole.DOCTOR:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los doctores tienen horario laboral."
+        )
+    for item in ranges:
+        if item.end_time != time.min and item.end_time <= item.start_time:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cada franja debe terminar después de empezar."
+            )
+
+    await db.execute(delete(DoctorWorkingHours).where(DoctorWorkingHours.doctor_id == current_user.id))
+    db.add_all([
+        DoctorWorkingHours(
+            doctor_id=current_user.id, weekday=item.weekday, start_time=item.start_time, end_time=item.end_time,
+        )
+        for item in ranges
+    ])
+    await db.commit()
+    availability_cache.invalidate(current_user.id)
+    return await get_my_working_hours(db, current_user)
+
+@router.post("/batch", response_model=AppointmentBatchResponse)
+async def request_appointments_batch(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: PrincipalSnapshot = Depends(get_current_user)
+):
+    """
+    Carga masiva de solicitudes de cita (JSON array o NDJSON con
+    Content-Type application/x-ndjson). Cada elemento es un AppointmentCreate;
+    los administradores deben indicar además patient_id.
+    Devuelve el resultado de cada elemento en el orden recibido.
+    """
+    if current_user.role not in (UserRole.PATIENT, UserRole.ADMIN):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo pacientes y administradores pueden cargar citas."
+        )
+
+    raw_items = _parse_batch_body(await request.body(), request.headers.get("content-type", ""))
+    if len(raw_items) > settings.APPOINTMENT_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Máximo {settings.APPOINTMENT_BATCH_MAX_ITEMS} citas por carga."
+        )
+
+    # 1. Validación individual de cada elemento
+    results: Dict[int, AppointmentBatchItemResult] = {}
+    valid: List[Tuple[int, AppointmentBatchItem]] = []
+    for index, raw in raw_items:
+        if isinstance(raw, Exception):
+            results[index] = AppointmentBatchItemResult(index=index, ok=False, error="Línea JSON inválida.")
+            continue
+        try:
+            valid.append((index, AppointmentBatchItem.model_validate(raw)))
+        except ValidationError as e:
+            results[index] = AppointmentBatchItemResult(index=index, ok=False, error=_validation_message(e))
+
+    # 2. Resolución del paciente de cada cita
+    items: List[Tuple[int, AppointmentBatchItem, int]] = []
+    if current_user.role == UserRole.PATIENT:
+        items = [(index, item, current_user.id) for index, item in valid]
+    else:
+        requested_patients = {item.patient_id for _, item in valid if item.patient_id is not None}
+        existing = set((await db.execute(
+            select(User.id).where(User.id.in_(requested_patients), User.role == UserRole.PATIENT)
+        )).scalars().all()) if requested_patients else set()
+        for index, item in valid:
+            if item.patient_id in existing:
+                items.append((index, item, item.patient_id))
+            else:
+                results[index] = AppointmentBatchItemResult(
+                    index=index, ok=False, error="patient_id ausente o no corresponde a un paciente."
+                )
+
+    # 3. Asignación y guardado masivo
+    if items:
+        results.update(await db.run_sync(schedule_and_persist_batch, items))
+
+    ordered = [results[index] for index in sorted(results)]
+    created = sum(1 for result in ordered if result.ok)
+    return AppointmentBatchResponse(
+        total=len(ordered), created=created, failed=len(ordered) - created, results=ordered
+    )
+
+@router.post("/batch/status", response_model=AppointmentBulkTransitionResponse)
+async def bulk_transition_appointments(
+    transition: AppointmentBulkTransition,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: PrincipalSnapshot = Depends(get_current_user)
+):
+    """
+    Cambia el estado de todas las citas que cumplen los criterios con un UPDATE
+    por estado de origen (ver app/utils/appointment_lifecycle.py). Las citas cuya
+    transición no es válida (p. ej. una ya cancelada) no se modifican.
+    Los doctores solo pueden afectar a sus citas y los pacientes solo cancelar las suyas.
+    """
+    criteria = TransitionCriteria(
+        appointment_ids=transition.appointment_ids,
+        doctor_id=transition.doctor_id,
+        patient_id=transition.patient_id,
+        from_statuses=transition.from_statuses,
+        start_from=transition.start_from,
+        start_to=transition.start_to,
+        end_before=transition.end_before,
+    )
+    # Se valida antes de restringir por rol: sin criterios no se toca toda la agenda del usuario
+    if criteria.is_empty():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Indique al menos un criterio (ids, doctor, paciente o rango de fechas)."
+        )
+    if current_user.role == UserRole.DOCTOR:
+        if transition.doctor_id not in (None, current_user.id):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo puede modificar sus propias citas.")
+        criteria = dataclasses.replace(criteria, doctor_id=current_user.id)
+    elif current_user.role == UserRole.PATIENT:
+        if transition.target_status != AppointmentStatus.CANCELLED or transition.patient_id not in (None, current_user.id):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Los pacientes solo pueden cancelar sus propias citas.")
+        criteria = dataclasses.replace(criteria, patient_id=current_user.id)
+
+    if transition.appointment_ids is not None and len(transition.appointment_ids) > settings.APPOINTMENT_TRANSITION_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Máximo {settings.APPOINTMENT_TRANSITION_MAX_ITEMS} citas por petición."
+        )
+
+    changes = await db.run_sync(bulk_transition, transition.target_status, criteria)
+    await db.commit()
+    return AppointmentBulkTransitionResponse(
+        target_status=transition.target_status,
+        updated=len(changes),
+        appointment_ids=sorted(change.appointment_id for change in changes),
+    )
+
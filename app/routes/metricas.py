@@ -0,0 +1,95 @@
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.orm import Session
+
+# Importaciones del proyecto
+from app.config import settings
+from app.database import POOL_CHECKOUT_WAIT, get_db, get_pool_metrics
+from app.utils.metrics import render_histogram, render_metric_header
+from app.utils.request_metrics import request_metrics
+from app.utils.calendar_outbox import calendar_outbox_worker
+from app.utils.agenda_events import agenda_events
+from app.utils.availability_cache import availability_cache
+from app.utils.google_tokens import credentials_cache, token_refresh_breaker
+from app.utils.servicios_meet_calendar import calendar_breaker, calendar_rate_limiter
+from app.utils.password_pool import password_pool
+from app.utils.principal_cache import principal_cache
+
+LOOPBACK_HOSTS = frozenset({"127.0.0.1", "::1"})
+
+
+def require_metrics_access(request: Request, authorization: Optional[str] = Header(None)) -> None:
+    """
+    Restringe las rutas de monitoreo: con METRICS_TOKEN configurado se exige
+    `Authorization: Bearer <token>`; sin él, solo se atiende a clientes locales.
+    """
+    if settings.METRICS_TOKEN:
+        scheme, _, token = (authorization or "").partition(" ")
+        if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token de métricas inválido.",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+    elif request.client is None or request.client.host not in LOOPBACK_HOSTS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Las métricas solo están disponibles localmente. Configure METRICS_TOKEN.",
+        )
+
+
+# Rutas de monitoreo interno (estado de pools y cachés)
+router = APIRouter(prefix="/metrics", tags=["Monitoreo"], dependencies=[Depends(require_metrics_access)])
+
+
+@router.get("", response_class=PlainTextResponse)
+def get_prometheus_metrics():
+    """
+    Métricas en formato de texto de Prometheus: latencia, consultas SQL, tiempo en DB
+    y en Google y tamaño de respuesta por ruta, más la espera en el pool de conexiones.
+    """
+    lines = request_metrics.render_prometheus()
+    lines += render_metric_header("db_pool_checkout_wait_seconds", "histogram", "Espera para obtener una conexión del pool.")
+    for pool_name, histogram in POOL_CHECKOUT_WAIT.items():
+        lines += render_histogram("db_pool_checkout_wait_seconds", {"pool": pool_name}, histogram.snapshot())
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
+@router.get("/pool")
+def get_pool_status():
+    """
+    Estado del pool de conexiones: conexiones en uso, ociosas y en overflow,
+    e histogramas del tiempo de espera en el checkout.
+    """
+    return get_pool_metrics()
+
+
+@router.get("/app")
+def get_app_status():
+    """Contadores de las cachés, del pool de hashing de contraseñas y de los eventos de agenda."""
+    return {
+        "principal_cache": principal_cache.stats(),
+        "availability_cache": availability_cache.stats(),
+        "google_credentials_cache": credentials_cache.stats(),
+        "password_pool": password_pool.stats(),
+        "agenda_events": agenda_events.stats(),
+    }
+
+
+@router.get("/calendar-outbox")
+def get_calendar_outbox_status(db: Session = Depends(get_db)):
+    """Entradas del outbox de Google Calendar por estado y contadores del worker."""
+    return calendar_outbox_worker.stats(db)
+
+
+@router.get("/google")
+def get_google_status():
+    """Estado de los circuit breakers y contadores del limitador de llamadas a Google."""
+    return {
+        "token_refresh_breaker": token_refresh_breaker.stats(),
+        "calendar_breaker": calendar_breaker.stats(),
+        "calendar_rate_limiter": calendar_rate_limiter.stats(),
+    }
@@ -1,18 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Header
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta, datetime
 from typing import Annotated, Optional
 
 # Importaciones de módulos locales
-from app.database import get_db
+from app.database import get_async_db
 from app.models.user import User, UserRole
+from app.models.appointment import Appointment, AppointmentStatus, PriorityLevel
+from app.models.calendar_outbox import CalendarOutbox, CalendarOutboxStatus
 # CORRECCIÓN DE IMPORTACIÓN: Importamos las clases específicas de Pydantic, incluyendo AppointmentCreate
 from app.utils.schemas import BaseModel, UserOut, UserCreate, UserLogin, Token, AppointmentCreate 
 from app.utils import security 
+from app.utils.loading_profiles import loading_options
 from app.config import settings
-from app.utils.google_tokens import get_google_auth_flow, exchange_code_for_tokens
-from app.utils.servicios_meet_calendar import create_google_calendar_event # <-- Servicio de Meet/Calendar
-from app.excepciones import GoogleCalendarError 
+from app.utils.google_tokens import build_authorization_url, exchange_code_for_tokens_async
+from app.utils.calendar_outbox import calendar_outbox_worker, enqueue_calendar_event # <-- Outbox de Meet/Calendar
+from app.utils.scheduling import is_booking_conflict
+from app.excepciones import SlotConflictError
 from starlette.responses import RedirectResponse
 
 # Crea el router para las rutas de autenticación
@@ -21,29 +26,13 @@ router = APIRouter(
     tags=["Autenticación"],
 )
 
-# Dependencia de inyección para la sesión de base de datos
-SessionDep = Annotated[Session, Depends(get_db)]
+# Dependencia de inyección para la sesión de base de datos (async)
+SessionDep = Annotated[AsyncSession, Depends(get_async_db)]
 
-# --- Utilidad para obtener el usuario autenticado ---
-def get_current_user(db: Session = Depends(get_db), token: str = Header(..., alias="Authorization")):
-    """
-    Decodifica el token JWT y obtiene el usuario autenticado.
-    """
-    token = token.replace("Bearer ", "")
-    payload = security.decode_access_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token inválido o expirado",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    user_id = payload.get("user_id")
-    db_user = db.query(User).filter(User.id == user_id).first()
-    if db_user is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado")
-    return db_user
-
-CurrentUserDep = Annotated[User, Depends(get_current_user)]
+# --- Usuario autenticado ---
+# Se reutiliza la dependencia de app.utils.security (con caché de principales).
+get_current_user = security.get_current_user
+CurrentUserDep = security.CurrentUserDep
 
 # --- Esquema Específico para Citas con Meet (usa email, no IDs) ---
 class GoogleAppointmentCreate(BaseModel):
@@ -60,13 +49,20 @@ class GoogleAppointmentCreate(BaseModel):
 
 # --- Rutas de Autenticación Estándar (Existentes) ---
 
+async def _get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
+    result = await db.execute(select(User).options(*loading_options("auth")).where(User.email == email))
+    return result.scalar_one_or_none()
+
+
+# El hashing de bcrypt corre en el pool dedicado (security.*_async).
+
 @router.post("/register", response_model=UserOut, status_code=status.HTTP_201_CREATED) # <--- CORREGIDO: Usamos UserOut
-def register_user(user_data: UserCreate, db: SessionDep): # <--- Usa UserCreate importado directamente
+async def register_user(user_data: UserCreate, db: SessionDep): # <--- Usa UserCreate importado directamente
     """
     Registra un nuevo usuario en el sistema.
     """
     # 1. Verificar si el email ya existe
-    db_user = db.query(User).filter(User.email == user_data.email).first()
+    db_user = await _get_user_by_email(db, user_data.email)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -74,51 +70,72 @@ def register_user(user_data: UserCreate, db: SessionDep): # <--- Usa UserCreate
         )
 
     # 2. Hashear la contraseña
-    hashed_password = security.get_password_hash(user_data.password)
+    hashed_password = await security.get_password_hash_async(user_data.password)
 
     # 3. Crear el nuevo objeto User del ORM
     new_user = User(
         email=user_data.email,
         hashed_password=hashed_password,
         full_name=user_data.full_name,
-        role=user_data.role # El rol por defecto es 'patient' según el esquema
+        role=UserRole(user_data.role) # El rol por defecto es 'patient' según el esquema (llega como valor)
     )
 
     # 4. Guardar en la base de datos
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     return new_user
 
 
 @router.post("/login", response_model=Token) # <--- Usa Token importado directamente
-def login_for_access_token(user_data: UserLogin, db: SessionDep): # <--- Usa UserLogin importado directamente
+async def login_for_access_token(user_data: UserLogin, db: SessionDep): # <--- Usa UserLogin importado directamente
     """
     Verifica las credenciales y devuelve un token JWT si son válidas.
+    Si el hash guardado está obsoleto, se rehashea de forma transparente.
     """
     # 1. Buscar el usuario por email
-    db_user = db.query(User).filter(User.email == user_data.email).first()
+    db_user = await _get_user_by_email(db, user_data.email)
     
     # 2. Verificar existencia y contraseña
-    if not db_user or not security.verify_password(user_data.password, db_user.hashed_password):
+    is_valid, new_hash = False, None
+    if db_user:
+        is_valid, new_hash = await security.verify_password_async(user_data.password, db_user.hashed_password)
+    if not is_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Credenciales de acceso inválidas",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    # 3. Crear el token de acceso
+    # 3. Rehash transparente si cambió el esquema o el coste de bcrypt
+    if new_hash:
+        db_user.hashed_password = new_hash
+        await db.commit()
+
+    # 4. Crear el token de acceso
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = security.create_access_token(
         data={"user_id": db_user.id, "role": db_user.role.value},
         expires_delta=access_token_expires
     )
     
-    # 4. Devolver el token
+    # 5. Devolver el token
     return {"access_token": access_token}
 
 
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    current_user: CurrentUserDep,
+    authorization: Annotated[str, Header(alias="Authorization")],
+):
+    """
+    Cierra la sesión: el token usado deja de aceptarse aunque no haya expirado
+    (en todos los workers si TOKEN_REVOCATION_REDIS_URL está configurado).
+    """
+    await security.revoke_access_token_async(authorization.replace("Bearer ", ""))
+
+
 # --- Rutas de Google OAuth (Nuevas) ---
 
 @router.get("/google/login")
@@ -127,27 +144,22 @@ def google_login():
     Inicia el flujo de autenticación de Google OAuth 2.0.
     Redirige al usuario a la página de consentimiento de Google.
     """
-    flow = get_google_auth_flow()
-    authorization_url, state = flow.authorization_url(
-        access_type='offline',
-        include_granted_scopes='true',
-        # Solicita el refresh_token para poder usarlo después
-        prompt='consent' 
-    )
+    # URL construida con la configuración precalculada (sin crear un Flow por petición)
+    authorization_url, state = build_authorization_url()
     # Guarda el state en la sesión si estuvieras usando sesiones reales. 
     # Por simplicidad aquí, confiamos en la validez del estado.
     return RedirectResponse(authorization_url)
 
 
 @router.get("/google/callback")
-def google_callback(code: str, db: SessionDep):
+async def google_callback(code: str, db: SessionDep):
     """
     Maneja la respuesta del servidor de Google (callback).
     Intercambia el código por tokens y guarda el refresh_token del doctor.
     """
     try:
         # 1. Intercambiar el código por tokens de Google
-        tokens = exchange_code_for_tokens(code)
+        tokens = await exchange_code_for_tokens_async(code)
         refresh_token = tokens.get('refresh_token')
         google_email = tokens.get('email')
 
@@ -161,7 +173,7 @@ def google_callback(code: str, db: SessionDep):
         # 2. Encontrar el usuario por email
         # NOTA: En un sistema real, el usuario debe estar logueado para vincular su cuenta.
         # Aquí, por simplicidad, asumimos que el email de Google es el mismo que el de registro.
-        db_user = db.query(User).filter(User.email == google_email).first()
+        db_user = await _get_user_by_email(db, google_email)
 
         if not db_user:
             raise HTTPException(
@@ -170,8 +182,9 @@ def google_callback(code: str, db: SessionDep):
             )
 
         # 3. Guardar el refresh token en la base de datos
+        # (el commit invalida la entrada del usuario en la caché de principales)
         db_user.google_refresh_token = refresh_token
-        db.commit()
+        await db.commit()
 
         # 4. Redirigir a una página de éxito (debe ser una URL de tu frontend)
         return RedirectResponse(
@@ -193,15 +206,18 @@ def google_callback(code: str, db: SessionDep):
 
 # --- Ruta de Creación de Citas con Meet (Ejemplo) ---
 
-@router.post("/appointments/create", status_code=status.HTTP_201_CREATED)
-def create_appointment_with_meet(
+@router.post("/appointments/create", status_code=status.HTTP_202_ACCEPTED)
+async def create_appointment_with_meet(
     appointment_data: GoogleAppointmentCreate,
+    request: Request,
     db: SessionDep,
     current_user: CurrentUserDep
 ):
     """
-    Crea una nueva cita. Si el usuario actual es un Doctor,
-    intenta crear un evento de Google Calendar con un enlace de Meet.
+    Crea una nueva cita virtual del doctor actual y encola la creación del evento
+    de Google Calendar con enlace de Meet. La respuesta no espera a Google: el
+    enlace se escribe en la cita cuando el worker del outbox crea el evento
+    (ver GET /appointments/{appointment_id}/calendar).
     """
     if current_user.role != UserRole.DOCTOR:
         raise HTTPException(
@@ -210,41 +226,80 @@ def create_appointment_with_meet(
         )
 
     # 1. Verificar si el doctor tiene el token de Google
-    if not current_user.google_refresh_token:
+    if not current_user.has_google_token:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="El doctor debe conectar su calendario de Google a través de /auth/google/login primero."
         )
 
-    # 2. Crear el evento de Google Calendar
+    # 2. Guardar la cita y la entrada del outbox en la misma transacción
+    patient = await _get_user_by_email(db, appointment_data.patient_email)
+    appointment = Appointment(
+        patient_id=patient.id if patient else None,
+        doctor_id=current_user.id,
+        start_time=appointment_data.start_time,
+        end_time=appointment_data.end_time,
+        is_virtual=True,
+        priority_level=PriorityLevel.MEDIUM,
+        status=AppointmentStatus.CONFIRMED,
+    )
+    db.add(appointment)
+    enqueue_calendar_event(
+        db,
+        appointment,
+        summary=appointment_data.summary,
+        description=appointment_data.description,
+        patient_email=appointment_data.patient_email,
+    )
     try:
-        # Simular la creación de la cita en tu DB (aquí solo se crea el evento de Google)
-        
-        # Llama al servicio de Google
-        meet_info = create_google_calendar_event(
-            doctor=current_user,
-            summary=appointment_data.summary,
-            description=appointment_data.description,
-            start_time=appointment_data.start_time,
-            end_time=appointment_data.end_time,
-            patient_email=appointment_data.patient_email
-        )
-        
-        # En un escenario real, aquí se guardaría la cita en la DB local
-        # appointment = Appointment(
-        #     doctor_id=current_user.id,
-        #     video_url=meet_info['meet_url'],
-        #     ...
-        # )
-
-        return {
-            "message": "Cita agendada y evento de Google Calendar/Meet creado con éxito.",
-            "meet_url": meet_info['meet_url'],
-            "calendar_url": meet_info['event_url']
-        }
-
-    except GoogleCalendarError as e:
+        await db.commit()
+    except Exception as e:
+        # La restricción de solapamiento rechaza una segunda cita del doctor en ese horario
+        if is_booking_conflict(e):
+            await db.rollback()
+            raise SlotConflictError()
+        raise
+
+    # 3. Avisar al worker para que no espere al siguiente sondeo
+    calendar_outbox_worker.wake()
+
+    return {
+        "message": "Cita agendada. El evento de Google Calendar/Meet se está creando.",
+        "appointment_id": appointment.id,
+        "calendar_status": CalendarOutboxStatus.PENDING.value,
+        "status_url": str(request.url_for("get_appointment_calendar_status", appointment_id=appointment.id)),
+    }
+
+
+@router.get("/appointments/{appointment_id}/calendar")
+async def get_appointment_calendar_status(
+    appointment_id: int,
+    db: SessionDep,
+    current_user: CurrentUserDep
+):
+    """
+    Estado de la creación del evento de Google Calendar de una cita:
+    pendiente, en proceso, completado (con el enlace de Meet) o fallido.
+    """
+    result = await db.execute(
+        select(CalendarOutbox, Appointment.video_url, Appointment.patient_id)
+        .join(Appointment, Appointment.id == CalendarOutbox.appointment_id)
+        .where(CalendarOutbox.appointment_id == appointment_id)
+    )
+    row = result.first()
+    if row is None or current_user.id not in (row.CalendarOutbox.doctor_id, row.patient_id):
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error al crear el evento de Google: {e.detail}"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No hay un evento de calendario para esta cita."
         )
+
+    entry = row.CalendarOutbox
+    return {
+        "appointment_id": appointment_id,
+        "calendar_status": entry.status.value,
+        "attempts": entry.attempts,
+        "next_attempt_at": entry.next_attempt_at if entry.status == CalendarOutboxStatus.PENDING else None,
+        "last_error": entry.last_error,
+        "meet_url": row.video_url,
+        "calendar_url": entry.event_url,
+    }
@@ -0,0 +1,368 @@
+import asyncio
+import dataclasses
+import itertools
+import json
+import logging
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException, status
+
+from app.config import settings
+from app.models.appointment import AppointmentStatus
+from app.utils.appointment_changes import AppointmentChange, AppointmentState, register_listener
+from app.utils.fast_json import dumps
+
+# Eventos de agenda en tiempo real (Server-Sent Events).
+#
+# El hub de cambios de citas notifica cada transacción confirmada; aquí se
+# traducen los cambios en eventos (created, confirmed, rescheduled, cancelled,
+# video_url...) dirigidos al paciente y al doctor de la cita. El broker los
+# numera y los entrega a las conexiones abiertas a través de un backend
+# intercambiable: en memoria para un solo worker o Redis Streams para varios.
+# Cada conexión es una cola asyncio acotada, sin hilos, así que miles de
+# conexiones inactivas solo cuestan memoria. Con Last-Event-ID el cliente
+# recibe los eventos que se perdió mientras estaba desconectado.
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class AgendaEvent:
+    """Evento para los usuarios de `user_ids`; `id` lo asigna el backend al publicarlo."""
+    type: str
+    appointment_id: int
+    user_ids: Tuple[int, ...]
+    data: dict
+    id: Optional[str] = None
+
+    def to_sse(self) -> bytes:
+        return b"id: %s\nevent: %s\ndata: %s\n\n" % (self.id.encode(), self.type.encode(), dumps(self.data))
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "type": self.type, "appointment_id": self.appointment_id,
+            "user_ids": list(self.user_ids), "data": self.data,
+        })
+
+    @classmethod
+    def from_json(cls, event_id: str, raw: str) -> "AgendaEvent":
+        values = json.loads(raw)
+        return cls(values["type"], values["appointment_id"], tuple(values["user_ids"]), values["data"], event_id)
+
+
+# --- Cambios de citas -> eventos ---
+
+def classify_change(change: AppointmentChange) -> Optional[str]:
+    """Tipo de evento de un cambio; None si no cambia nada visible en la agenda."""
+    before, after = change.before, change.after
+    if after is None:
+        return "deleted"
+    if before is None:
+        return "created"
+    if before == after:
+        return None
+    if after.status != before.status:
+        if after.status == AppointmentStatus.CANCELLED:
+            return "cancelled"
+        if after.status == AppointmentStatus.CONFIRMED:
+            return "confirmed"
+        return "status_changed"
+    if (after.doctor_id, after.start_time, after.end_time) != (before.doctor_id, before.start_time, before.end_time):
+        return "rescheduled"
+    if after.video_url and after.video_url != before.video_url:
+        return "video_url"
+    return "updated"
+
+
+def _state_payload(state: AppointmentState) -> dict:
+    return {
+        "patient_id": state.patient_id,
+        "doctor_id": state.doctor_id,
+        "start_time": state.start_time.isoformat() if state.start_time else None,
+        "end_time": state.end_time.isoformat() if state.end_time else None,
+        "status": state.status.value if state.status else None,
+        "video_url": state.video_url,
+    }
+
+
+def events_from_changes(changes: List[AppointmentChange]) -> List[AgendaEvent]:
+    events = []
+    for change in changes:
+        event_type = classify_change(change)
+        if event_type is None:
+            continue
+        # En un cambio de doctor, el anterior también recibe el evento
+        user_ids = {
+            user_id
+            for state in (change.before, change.after) if state is not None
+            for user_id in (state.patient_id, state.doctor_id) if user_id is not None
+        }
+        current = change.after or change.before
+        data = {"type": event_type, "appointment_id": change.appointment_id, **_state_payload(current)}
+        events.append(AgendaEvent(event_type, change.appointment_id, tuple(sorted(user_ids)), data))
+    return events
+
+
+# --- Backends ---
+
+Deliver = Callable[[AgendaEvent], None]
+
+
+class LocalAgendaBackend:
+    """
+    Un solo worker: ids secuenciales y un historial en memoria. Los ids llevan
+    el instante de arranque del proceso para detectar reanudaciones tras un reinicio.
+    """
+
+    def __init__(self, history_size: int):
+        self._epoch = str(int(time.time() * 1000))
+        self._sequence = itertools.count(1)
+        self._history: Deque[AgendaEvent] = deque(maxlen=history_size)
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    async def publish(self, events: List[AgendaEvent]) -> None:
+        for event in events:
+            event = dataclasses.replace(event, id=f"{self._epoch}-{next(self._sequence)}")
+            self._history.append(event)
+            self._deliver(event)
+
+    def _sequence_of(self, event_id: str) -> Optional[int]:
+        epoch, _, sequence = event_id.partition("-")
+        return int(sequence) if epoch == self._epoch and sequence.isdigit() else None
+
+    async def replay(self, last_event_id: str) -> Optional[List[AgendaEvent]]:
+        """Eventos posteriores a `last_event_id`; None si no se puede garantizar que estén todos."""
+        last = self._sequence_of(last_event_id)
+        if last is None:
+            return None
+        history = list(self._history)
+        if history and self._sequence_of(history[0].id) > last + 1:
+            return None
+        return [event for event in history if self._sequence_of(event.id) > last]
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisAgendaBackend:
+    """
+    Varios workers: los eventos se escriben en un Redis Stream (XADD) y cada worker
+    lo lee (XREAD) y los entrega a sus conexiones. El id del evento es el del
+    stream, así que un cliente puede reanudar en cualquier worker.
+    """
+
+    def __init__(self, url: str, stream: str, history_size: int):
+        self.url = url
+        self.stream = stream
+        self.history_size = history_size
+        self._client = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        import redis.asyncio  # Dependencia opcional: solo se importa si se configura la URL
+        self._client = redis.asyncio.from_url(self.url, decode_responses=True)
+        self._reader = asyncio.create_task(self._read(deliver))
+
+    async def publish(self, events: List[AgendaEvent]) -> None:
+        pipeline = self._client.pipeline(transaction=False)
+        for event in events:
+            pipeline.xadd(self.stream, {"event": event.to_json()}, maxlen=self.history_size, approximate=True)
+        await pipeline.execute()
+
+    async def _read(self, deliver: Deliver) -> None:
+        last_id = "$"
+        while True:
+            try:
+                response = await self._client.xread({self.stream: last_id}, block=5000, count=500)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"⚠️ Error leyendo eventos de agenda de Redis: {e}")
+                await asyncio.sleep(1)
+                continue
+            for _, entries in response or ():
+                for entry_id, fields in entries:
+                    last_id = entry_id
+                    deliver(AgendaEvent.from_json(entry_id, fields["event"]))
+
+    @staticmethod
+    def _stream_id(event_id: str) -> Optional[Tuple[int, int]]:
+        milliseconds, _, sequence = event_id.partition("-")
+        if not (milliseconds.isdigit() and sequence.isdigit()):
+            return None
+        return int(milliseconds), int(sequence)
+
+    async def replay(self, last_event_id: str) -> Optional[List[AgendaEvent]]:
+        last = self._stream_id(last_event_id)
+        if last is None:
+            return None
+        oldest = await self._client.xrange(self.stream, min="-", max="+", count=1)
+        # El stream se recorta (MAXLEN): si el evento ya no está, pudo perderse alguno
+        if oldest and self._stream_id(oldest[0][0]) > last:
+            return None
+        entries = await self._client.xrange(self.stream, min=f"({last_event_id}", max="+", count=self.history_size)
+        return [AgendaEvent.from_json(entry_id, fields["event"]) for entry_id, fields in entries]
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+
+
+# --- Broker ---
+
+class Subscription:
+    """Conexión SSE de un usuario: cola acotada de eventos pendientes de enviar."""
+
+    def __init__(self, user_id: int, queue_size: int):
+        self.user_id = user_id
+        self.queue: "asyncio.Queue[Optional[AgendaEvent]]" = asyncio.Queue(queue_size)
+
+
+class AgendaEventBroker:
+    def __init__(self, backend, queue_size: int, max_connections: int, heartbeat_seconds: float):
+        self.backend = backend
+        self.queue_size = queue_size
+        self.max_connections = max_connections
+        self.heartbeat_seconds = heartbeat_seconds
+        self._subscriptions: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._connections = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Set[asyncio.Task] = set()
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        await self.backend.start(self._deliver)
+
+    async def close(self) -> None:
+        self._loop = None
+        await self.backend.close()
+
+    # Listener del hub de cambios: se ejecuta en el hilo que confirmó la transacción
+    def publish_changes(self, changes: List[AppointmentChange]) -> None:
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        events = events_from_changes(changes)
+        if events:
+            loop.call_soon_threadsafe(self._spawn_publish, events)
+
+    def _spawn_publish(self, events: List[AgendaEvent]) -> None:
+        task = asyncio.create_task(self.backend.publish(events))
+        self._pending.add(task)
+        task.add_done_callback(self._publish_done)
+        self.published += len(events)
+
+    def _publish_done(self, task: asyncio.Task) -> None:
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"⚠️ No se pudieron publicar eventos de agenda: {task.exception()}")
+
+    def _deliver(self, event: AgendaEvent) -> None:
+        for user_id in event.user_ids:
+            for subscription in tuple(self._subscriptions.get(user_id, ())):
+                try:
+                    subscription.queue.put_nowait(event)
+                    self.delivered += 1
+                except asyncio.QueueFull:
+                    # Cliente lento: se vacía su cola y se cierra el stream; al reconectar
+                    # con Last-Event-ID recupera lo pendiente desde el historial.
+                    self.overflows += 1
+                    while not subscription.queue.empty():
+                        subscription.queue.get_nowait()
+                    subscription.queue.put_nowait(None)
+
+    def ensure_capacity(self) -> None:
+        """503 si este servidor ya tiene abiertas todas las conexiones de eventos admitidas."""
+        if self._connections >= self.max_connections:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Demasiadas conexiones de eventos abiertas en este servidor. Intente más tarde.",
+                headers={"Retry-After": "30"},
+            )
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(user_id, self.queue_size)
+        self._subscriptions[user_id].add(subscription)
+        self._connections += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions is not None and subscription in subscriptions:
+            subscriptions.discard(subscription)
+            self._connections -= 1
+            if not subscriptions:
+                del self._subscriptions[subscription.user_id]
+
+    async def stream(self, user_id: int, last_event_id: Optional[str]) -> AsyncIterator[bytes]:
+        """
+        Cuerpo SSE de una conexión: eventos perdidos (si se reanuda), eventos nuevos y
+        heartbeats. La suscripción se crea al empezar a iterar, dentro del try/finally
+        que la libera: un stream que nunca llega a enviarse no deja nada registrado.
+        """
+        subscription = self.subscribe(user_id)
+        try:
+            yield b"retry: 3000\n\n"
+            replayed: Set[str] = set()
+            if last_event_id:
+                events = await self.backend.replay(last_event_id)
+                if events is None:
+                    # No se puede garantizar la continuidad: el cliente debe recargar el listado
+                    yield b"event: resync\ndata: {}\n\n"
+                else:
+                    for event in events:
+                        if subscription.user_id in event.user_ids:
+                            replayed.add(event.id)
+                            yield event.to_sse()
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), self.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    # Comentario SSE: mantiene viva la conexión en proxies y detecta clientes caídos
+                    yield b": ping\n\n"
+                    continue
+                if event is None:
+                    break
+                if event.id not in replayed:
+                    yield event.to_sse()
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "connections": self._connections,
+            "users": len(self._subscriptions),
+            "published": self.published,
+            "delivered": self.delivered,
+            "overflows": self.overflows,
+        }
+
+
+def _build_backend():
+    if settings.AGENDA_EVENTS_REDIS_URL:
+        return RedisAgendaBackend(
+            settings.AGENDA_EVENTS_REDIS_URL,
+            stream=settings.AGENDA_EVENTS_REDIS_STREAM,
+            history_size=settings.AGENDA_EVENTS_HISTORY_SIZE,
+        )
+    return LocalAgendaBackend(history_size=settings.AGENDA_EVENTS_HISTORY_SIZE)
+
+
+agenda_events = AgendaEventBroker(
+    _build_backend(),
+    queue_size=settings.AGENDA_EVENTS_QUEUE_SIZE,
+    max_connections=settings.AGENDA_EVENTS_MAX_CONNECTIONS,
+    heartbeat_seconds=settings.AGENDA_EVENTS_HEARTBEAT_SECONDS,
+)
+register_listener(agenda_events.publish_changes)
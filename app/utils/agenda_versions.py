@@ -0,0 +1,138 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from fastapi import Request
+from sqlalchemy import event, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.agenda_version import AgendaVersion
+from app.utils.appointment_changes import AppointmentChange, pending_changes
+
+# Versiones de agenda por usuario para las peticiones condicionales del listado.
+#
+# Cada cambio de cita registrado en el hub (ORM o record_changes) incrementa, en la
+# misma transacción, la versión de los pacientes y doctores afectados (antes y
+# después del cambio). El listado responde con un ETag fuerte derivado de esa
+# versión y de los parámetros de la consulta; un If-None-Match que coincide se
+# contesta con 304 tras una única lectura por clave primaria, sin consultar citas.
+
+# Cuántos cambios pendientes de la transacción ya incrementaron versiones
+_VERSIONED_KEY = "agenda_versions_applied"
+
+_UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def affected_users(changes: Iterable[AppointmentChange]) -> Set[int]:
+    """Pacientes y doctores cuya agenda cambia con `changes`."""
+    user_ids = set()
+    for change in changes:
+        for state in (change.before, change.after):
+            if state is not None:
+                user_ids.update(uid for uid in (state.patient_id, state.doctor_id) if uid is not None)
+    return user_ids
+
+
+def bump_versions(connection: Connection, user_ids: Iterable[int]) -> None:
+    """Incrementa la versión de agenda de cada usuario (creando la fila si no existe)."""
+    # Orden fijo: dos transacciones concurrentes bloquean las filas en el mismo orden
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return
+    now = datetime.utcnow()
+    dialect_insert = _UPSERT_DIALECTS.get(connection.dialect.name)
+    if dialect_insert is not None:
+        statement = dialect_insert(AgendaVersion).values(
+            [{"user_id": user_id, "version": 1, "updated_at": now} for user_id in user_ids]
+        )
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[AgendaVersion.user_id],
+            set_={"version": AgendaVersion.version + 1, "updated_at": statement.excluded.updated_at},
+        ))
+        return
+    # Otros motores: UPDATE de las existentes e INSERT de las que faltan
+    connection.execute(
+        update(AgendaVersion)
+        .where(AgendaVersion.user_id.in_(user_ids))
+        .values(version=AgendaVersion.version + 1, updated_at=now)
+    )
+    existing = set(connection.scalars(select(AgendaVersion.user_id).where(AgendaVersion.user_id.in_(user_ids))))
+    missing = [user_id for user_id in user_ids if user_id not in existing]
+    if missing:
+        connection.execute(
+            AgendaVersion.__table__.insert(),
+            [{"user_id": user_id, "version": 1, "updated_at": now} for user_id in missing],
+        )
+
+
+def _apply_pending(session: Session) -> None:
+    changes = pending_changes(session)
+    applied = session.info.get(_VERSIONED_KEY, 0)
+    if len(changes) <= applied:
+        return
+    session.info[_VERSIONED_KEY] = len(changes)
+    bump_versions(session.connection(), affected_users(changes[applied:]))
+
+
+# after_flush cubre los cambios del ORM y before_commit los de Core registrados
+# con record_changes después del último flush.
+@event.listens_for(Session, "after_flush")
+def _on_flush(session: Session, flush_context) -> None:
+    _apply_pending(session)
+
+
+@event.listens_for(Session, "before_commit")
+def _on_before_commit(session: Session) -> None:
+    _apply_pending(session)
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _reset(session: Session) -> None:
+    session.info.pop(_VERSIONED_KEY, None)
+
+
+# --- Peticiones condicionales ---
+
+async def get_agenda_version(db: AsyncSession, user_id: int) -> Tuple[int, Optional[datetime]]:
+    """(versión, fecha del último cambio) de la agenda; (0, None) si nunca cambió."""
+    row = (await db.execute(
+        select(AgendaVersion.version, AgendaVersion.updated_at).where(AgendaVersion.user_id == user_id)
+    )).first()
+    return (row.version, row.updated_at) if row else (0, None)
+
+
+def agenda_etag(user_id: int, version: int, request: Request) -> str:
+    """
+    ETag fuerte: versión de la agenda + parámetros de la consulta (filtros, cursor,
+    límite y formato cambian la representación aunque la versión sea la misma).
+    """
+    query = "&".join(sorted(f"{key}={value}" for key, value in request.query_params.multi_items()))
+    digest = hashlib.sha256(query.encode()).hexdigest()[:16]
+    return f'"{user_id}-{version}-{digest}"'
+
+
+def cache_headers(etag: str, last_modified: Optional[datetime]) -> Dict[str, str]:
+    # no-cache: el cliente puede guardar la respuesta pero debe revalidarla siempre
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=timezone.utc), usegmt=True)
+    return headers
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """
+    Evalúa If-None-Match según RFC 9110. If-Modified-Since no se usa: Last-Modified
+    tiene resolución de segundos (un segundo cambio en el mismo segundo pasaría por
+    no modificado) y es común a todas las páginas y filtros del usuario; solo el
+    ETag identifica la representación exacta.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
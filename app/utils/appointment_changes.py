@@ -0,0 +1,122 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Iterable, List, Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from app.models.appointment import ACTIVE_STATUSES, Appointment, AppointmentStatus
+
+# Cambios de citas confirmados.
+# Los eventos del ORM acumulan en la sesión el estado anterior y posterior de cada
+# cita modificada; al confirmarse la transacción se notifican a los listeners
+# registrados (caché de disponibilidad, motor de asignación...). Las operaciones
+# masivas de Core, que no pasan por el ORM, los registran con record_changes.
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class AppointmentState:
+    """Campos de una cita relevantes para agenda y notificaciones."""
+    patient_id: Optional[int]
+    doctor_id: Optional[int]
+    start_time: Optional[datetime]
+    end_time: Optional[datetime]
+    status: Optional[AppointmentStatus]
+    video_url: Optional[str] = None
+
+    @property
+    def occupies_agenda(self) -> bool:
+        return (
+            self.doctor_id is not None
+            and self.start_time is not None
+            and self.end_time is not None
+            and self.status in ACTIVE_STATUSES
+        )
+
+
+@dataclass(frozen=True)
+class AppointmentChange:
+    """Cambio de una cita: before es None al crearla y after es None al borrarla."""
+    appointment_id: int
+    before: Optional[AppointmentState]
+    after: Optional[AppointmentState]
+
+
+AppointmentChangeListener = Callable[[List[AppointmentChange]], None]
+
+_listeners: List[AppointmentChangeListener] = []
+_PENDING_KEY = "appointment_changes_pending"
+
+
+def register_listener(listener: AppointmentChangeListener) -> AppointmentChangeListener:
+    """Registra una función que recibe los cambios de cada transacción confirmada."""
+    _listeners.append(listener)
+    return listener
+
+
+def record_changes(session: Session, changes: Iterable[AppointmentChange]) -> None:
+    """Registra cambios hechos fuera del ORM (INSERT/UPDATE masivos de Core)."""
+    session.info.setdefault(_PENDING_KEY, []).extend(changes)
+
+
+def pending_changes(session: Session) -> List[AppointmentChange]:
+    """Cambios registrados en la transacción en curso que aún no se han notificado."""
+    return session.info.get(_PENDING_KEY, [])
+
+
+_STATE_FIELDS = ("patient_id", "doctor_id", "start_time", "end_time", "status", "video_url")
+
+
+def _current_state(target: Appointment) -> AppointmentState:
+    return AppointmentState(**{name: getattr(target, name) for name in _STATE_FIELDS})
+
+
+def _previous_state(target: Appointment) -> AppointmentState:
+    attrs = inspect(target).attrs
+    values = {}
+    for name in _STATE_FIELDS:
+        history = attrs[name].history
+        values[name] = history.deleted[0] if history.deleted else getattr(target, name)
+    return AppointmentState(**values)
+
+
+def _record(target: Appointment, before, after) -> None:
+    session = object_session(target)
+    if session is not None:
+        record_changes(session, [AppointmentChange(target.id, before, after)])
+
+
+@event.listens_for(Appointment, "after_insert")
+def _on_insert(mapper, connection, target: Appointment) -> None:
+    _record(target, None, _current_state(target))
+
+
+@event.listens_for(Appointment, "after_update")
+def _on_update(mapper, connection, target: Appointment) -> None:
+    _record(target, _previous_state(target), _current_state(target))
+
+
+@event.listens_for(Appointment, "after_delete")
+def _on_delete(mapper, connection, target: Appointment) -> None:
+    _record(target, _previous_state(target), None)
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_after_commit(session: Session) -> None:
+    changes = session.info.pop(_PENDING_KEY, None)
+    if not changes:
+        return
+    for listener in _listeners:
+        try:
+            listener(changes)
+        except Exception as e:
+            # Un listener defectuoso no debe afectar a la transacción ya confirmada
+            logger.exception(f"Error al notificar cambios de citas a {listener!r}: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
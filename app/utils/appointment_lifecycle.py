@@ -0,0 +1,218 @@
+import asyncio
+import logging
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from types import MappingProxyType
+from typing import FrozenSet, List, Mapping, Optional, Sequence
+
+from fastapi import HTTPException, status
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.appointment import Appointment, AppointmentStatus
+from app.utils.appointment_changes import AppointmentChange, AppointmentState, record_changes
+
+# Ciclo de vida de las citas.
+#
+# ALLOWED_TRANSITIONS es la tabla de transiciones válidas entre estados.
+# bulk_transition aplica una transición a todas las citas que cumplen unos
+# criterios con un UPDATE ... RETURNING por estado de origen (a lo sumo dos),
+# sin cargar las filas en el ORM; los cambios se registran en el hub para que
+# cachés, motor de asignación, versiones de agenda y eventos SSE se actualicen.
+# run_no_show_sweeper marca cada noche como NO_SHOW las citas confirmadas que
+# ya terminaron.
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_TRANSITIONS: Mapping[AppointmentStatus, FrozenSet[AppointmentStatus]] = MappingProxyType({
+    AppointmentStatus.REQUESTED: frozenset({AppointmentStatus.CONFIRMED, AppointmentStatus.CANCELLED}),
+    AppointmentStatus.CONFIRMED: frozenset({
+        AppointmentStatus.COMPLETED, AppointmentStatus.CANCELLED, AppointmentStatus.NO_SHOW,
+    }),
+    # Estados finales
+    AppointmentStatus.CANCELLED: frozenset(),
+    AppointmentStatus.COMPLETED: frozenset(),
+    AppointmentStatus.NO_SHOW: frozenset(),
+})
+
+# Estados que solo tienen sentido una vez empezada (o terminada) la cita
+_STARTED_TARGETS = {AppointmentStatus.COMPLETED}
+_FINISHED_TARGETS = {AppointmentStatus.NO_SHOW}
+
+
+def can_transition(source: AppointmentStatus, target: AppointmentStatus) -> bool:
+    return target in ALLOWED_TRANSITIONS[source]
+
+
+def sources_for(target: AppointmentStatus) -> List[AppointmentStatus]:
+    """Estados desde los que se puede pasar a `target`, en orden de declaración."""
+    return [source for source in AppointmentStatus if can_transition(source, target)]
+
+
+@dataclass(frozen=True)
+class TransitionCriteria:
+    """Citas afectadas por una transición masiva (los criterios se combinan con AND)."""
+    appointment_ids: Optional[Sequence[int]] = None
+    doctor_id: Optional[int] = None
+    patient_id: Optional[int] = None
+    from_statuses: Optional[Sequence[AppointmentStatus]] = None
+    start_from: Optional[datetime] = None
+    start_to: Optional[datetime] = None
+    end_before: Optional[datetime] = None
+    # Cursor por id para recorrer la tabla en bloques (ver sweep_no_shows)
+    after_id: Optional[int] = None
+
+    def is_empty(self) -> bool:
+        return all(value is None for value in (
+            self.appointment_ids, self.doctor_id, self.patient_id,
+            self.start_from, self.start_to, self.end_before,
+        ))
+
+
+def _validated_sources(target: AppointmentStatus, criteria: TransitionCriteria) -> List[AppointmentStatus]:
+    if criteria.is_empty():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Indique al menos un criterio (ids, doctor, paciente o rango de fechas)."
+        )
+    sources = sources_for(target)
+    if criteria.from_statuses is not None:
+        invalid = [source for source in criteria.from_statuses if source not in sources]
+        if invalid:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Transición no permitida: {', '.join(s.value for s in invalid)} -> {target.value}."
+            )
+        sources = [source for source in sources if source in criteria.from_statuses]
+    if not sources:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Ningún estado puede pasar a {target.value}."
+        )
+    return sources
+
+
+def _where_clauses(target: AppointmentStatus, criteria: TransitionCriteria, now: datetime) -> list:
+    clauses = []
+    if criteria.appointment_ids is not None:
+        clauses.append(Appointment.id.in_(criteria.appointment_ids))
+    if criteria.doctor_id is not None:
+        clauses.append(Appointment.doctor_id == criteria.doctor_id)
+    if criteria.patient_id is not None:
+        clauses.append(Appointment.patient_id == criteria.patient_id)
+    if criteria.start_from is not None:
+        clauses.append(Appointment.start_time >= criteria.start_from)
+    if criteria.start_to is not None:
+        clauses.append(Appointment.start_time < criteria.start_to)
+    if criteria.end_before is not None:
+        clauses.append(Appointment.end_time <= criteria.end_before)
+    if criteria.after_id is not None:
+        clauses.append(Appointment.id > criteria.after_id)
+    # Reglas de la transición: no se completa una cita futura ni se marca ausencia antes del fin
+    if target in _STARTED_TARGETS:
+        clauses.append(Appointment.start_time <= now)
+    if target in _FINISHED_TARGETS:
+        clauses.append(Appointment.end_time <= now)
+    return clauses
+
+
+def bulk_transition(
+    db: Session,
+    target: AppointmentStatus,
+    criteria: TransitionCriteria,
+    now: Optional[datetime] = None,
+    limit: Optional[int] = None,
+) -> List[AppointmentChange]:
+    """
+    Pasa a `target` todas las citas que cumplen `criteria` y cuya transición es
+    válida, con un UPDATE ... RETURNING por estado de origen. Incrementa la versión
+    optimista de cada fila y registra los cambios en la sesión; no confirma la
+    transacción. Con `limit`, actualiza como mucho ese número de citas por estado
+    (las de menor id).
+    """
+    now = now or datetime.utcnow()
+    sources = _validated_sources(target, criteria)
+    clauses = _where_clauses(target, criteria, now)
+    changes: List[AppointmentChange] = []
+
+    for source in sources:
+        condition = [Appointment.status == source, *clauses]
+        if limit is not None:
+            # Subconsulta por id: UPDATE ... LIMIT no es portable
+            condition = [Appointment.id.in_(
+                select(Appointment.id).where(*condition).order_by(Appointment.id).limit(limit)
+            )]
+        rows = db.execute(
+            update(Appointment)
+            .where(*condition)
+            .values(status=target, version=Appointment.version + 1)
+            .returning(
+                Appointment.id, Appointment.patient_id, Appointment.doctor_id,
+                Appointment.start_time, Appointment.end_time, Appointment.video_url,
+            )
+            .execution_options(synchronize_session=False)
+        ).tuples().all()
+        # Desempaquetar la tupla evita el acceso por nombre, que domina con cientos de miles de filas
+        for appointment_id, patient_id, doctor_id, start_time, end_time, video_url in rows:
+            changes.append(AppointmentChange(
+                appointment_id,
+                AppointmentState(patient_id, doctor_id, start_time, end_time, source, video_url),
+                AppointmentState(patient_id, doctor_id, start_time, end_time, target, video_url),
+            ))
+
+    # El UPDATE masivo no pasa por los eventos del ORM: se notifican los cambios a mano
+    record_changes(db, changes)
+    return changes
+
+
+# --- Barrido nocturno de ausencias ---
+
+def sweep_no_shows(now: Optional[datetime] = None) -> int:
+    """
+    Marca NO_SHOW las citas confirmadas que terminaron hace más de
+    NO_SHOW_GRACE_MINUTES, en bloques de APPOINTMENT_TRANSITION_CHUNK_SIZE filas
+    (una transacción por bloque). Cada bloque continúa por id donde terminó el
+    anterior, así que la tabla se recorre una sola vez. Devuelve cuántas citas cambiaron.
+    """
+    now = now or datetime.utcnow()
+    criteria = TransitionCriteria(
+        from_statuses=[AppointmentStatus.CONFIRMED],
+        end_before=now - timedelta(minutes=settings.NO_SHOW_GRACE_MINUTES),
+    )
+    total = 0
+    with SessionLocal() as db:
+        while True:
+            changes = bulk_transition(
+                db, AppointmentStatus.NO_SHOW, criteria, now=now, limit=settings.APPOINTMENT_TRANSITION_CHUNK_SIZE
+            )
+            db.commit()
+            total += len(changes)
+            if len(changes) < settings.APPOINTMENT_TRANSITION_CHUNK_SIZE:
+                return total
+            criteria = replace(criteria, after_id=max(change.appointment_id for change in changes))
+
+
+def _seconds_until_next_sweep(now: datetime) -> float:
+    next_run = now.replace(hour=settings.NO_SHOW_SWEEP_HOUR_UTC, minute=0, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+
+async def run_no_show_sweeper() -> None:
+    """
+    Tarea del lifespan: ejecuta sweep_no_shows cada día a NO_SHOW_SWEEP_HOUR_UTC.
+    Con varios workers cada uno lanza su barrido; es idempotente (solo toca CONFIRMED).
+    """
+    while True:
+        await asyncio.sleep(_seconds_until_next_sweep(datetime.utcnow()))
+        try:
+            marked = await run_in_threadpool(sweep_no_shows)
+            logger.info(f"Barrido de ausencias: {marked} citas marcadas como NO_SHOW.")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"⚠️ Error en el barrido nocturno de ausencias: {e}")
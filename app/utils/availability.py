@@ -0,0 +1,231 @@
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.appointment import ACTIVE_STATUS_FILTER, Appointment
+from app.models.user import User, UserRole
+from app.models.working_hours import DoctorWorkingHours
+
+# Motor de disponibilidad de doctores.
+#
+# La agenda se discretiza en slots de AVAILABILITY_SLOT_MINUTES. Para N doctores y
+# D días se construye una matriz booleana (N, D, slots_por_día):
+#   libre = horario_laboral & ~ocupado
+# donde 'ocupado' combina las citas de la DB y los bloques externos (free/busy de
+# Google Calendar, por ejemplo). Todo el cálculo es vectorizado con NumPy: las
+# ocupaciones se marcan con un array de diferencias + cumsum, sin bucles por slot.
+
+SLOT_MINUTES = settings.AVAILABILITY_SLOT_MINUTES
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+# Plantilla de horario laboral: día de la semana (0 = lunes) -> franjas [inicio, fin).
+# Se guardan por doctor en doctor_working_hours (ver load_working_hours).
+WorkingHoursTemplate = Mapping[int, Sequence[Tuple[time, time]]]
+
+# Para los doctores sin horario guardado: de lunes a viernes de 9:00 a 12:00
+DEFAULT_WORKING_HOURS: WorkingHoursTemplate = {
+    weekday: [(time(9, 0), time(12, 0))] for weekday in range(5)
+}
+
+# Intervalo ocupado: (doctor_id, inicio, fin)
+BusyBlock = Tuple[int, datetime, datetime]
+
+
+def _slot_of(value: time) -> int:
+    return (value.hour * 60 + value.minute) // SLOT_MINUTES
+
+
+def template_mask(template: WorkingHoursTemplate) -> np.ndarray:
+    """Máscara (7, SLOTS_PER_DAY) con los slots laborables de cada día de la semana."""
+    mask = np.zeros((7, SLOTS_PER_DAY), dtype=bool)
+    for weekday, ranges in template.items():
+        for start, end in ranges:
+            mask[weekday, _slot_of(start):_slot_of(end) or SLOTS_PER_DAY] = True
+    return mask
+
+
+def _to_slot_offsets(range_start: datetime, starts: Sequence[datetime], ends: Sequence[datetime]):
+    """Convierte intervalos a índices de slot [inicio redondeado abajo, fin redondeado arriba)."""
+    origin = np.datetime64(range_start, "s")
+    slot_seconds = SLOT_MINUTES * 60
+    start_seconds = (np.array(starts, dtype="datetime64[s]") - origin).astype(np.int64)
+    end_seconds = (np.array(ends, dtype="datetime64[s]") - origin).astype(np.int64)
+    return np.floor_divide(start_seconds, slot_seconds), -np.floor_divide(-end_seconds, slot_seconds)
+
+
+@dataclass
+class AvailabilityGrid:
+    """Slots libres de varios doctores en un rango de días consecutivos."""
+    doctor_ids: List[int]
+    start_date: date
+    free: np.ndarray  # (doctores, días, SLOTS_PER_DAY)
+
+    @property
+    def range_start(self) -> datetime:
+        return datetime.combine(self.start_date, time.min)
+
+    def slot_datetime(self, flat_index: int) -> datetime:
+        return self.range_start + timedelta(minutes=int(flat_index) * SLOT_MINUTES)
+
+    def slots_for(self, doctor_id: int, day: date) -> List[datetime]:
+        """Inicios de los slots libres de un doctor en un día."""
+        row = self.doctor_ids.index(doctor_id)
+        day_offset = (day - self.start_date).days
+        base = datetime.combine(day, time.min)
+        return [
+            base + timedelta(minutes=int(slot) * SLOT_MINUTES)
+            for slot in np.flatnonzero(self.free[row, day_offset])
+        ]
+
+    def earliest(self, duration: timedelta, not_before: Optional[datetime] = None) -> Optional[Tuple[int, datetime, datetime]]:
+        """
+        Primer hueco de `duration` (slots consecutivos libres) entre todos los doctores.
+        Devuelve (doctor_id, inicio, fin) o None si no hay hueco en el rango.
+        """
+        needed = max(1, -(-int(duration.total_seconds()) // (SLOT_MINUTES * 60)))
+        flat = self.free.reshape(len(self.doctor_ids), -1)
+        total = flat.shape[1]
+        if needed > total:
+            return None
+
+        # Suma deslizante de slots libres: una ventana vale `needed` si está toda libre
+        cumulative = np.zeros((flat.shape[0], total + 1), dtype=np.int32)
+        np.cumsum(flat, axis=1, out=cumulative[:, 1:])
+        fits = (cumulative[:, needed:] - cumulative[:, :-needed]) == needed
+
+        if not_before is not None:
+            first_allowed = -(-int((not_before - self.range_start).total_seconds()) // (SLOT_MINUTES * 60))
+            fits[:, :max(0, min(first_allowed, fits.shape[1]))] = False
+
+        has_fit = fits.any(axis=1)
+        if not has_fit.any():
+            return None
+        first = np.where(has_fit, fits.argmax(axis=1), np.iinfo(np.int64).max)
+        row = int(first.argmin())
+        start = self.slot_datetime(first[row])
+        return self.doctor_ids[row], start, start + timedelta(minutes=needed * SLOT_MINUTES)
+
+
+def compute_free_slots(
+    doctor_ids: Sequence[int],
+    start_date: date,
+    days: int,
+    busy: Iterable[BusyBlock] = (),
+    templates: Optional[Mapping[int, WorkingHoursTemplate]] = None,
+) -> AvailabilityGrid:
+    """
+    Calcula la matriz de slots libres para `doctor_ids` en [start_date, start_date + days).
+    `busy` son los intervalos ocupados (citas y bloques externos) de esos doctores.
+    """
+    doctor_ids = list(doctor_ids)
+    templates = templates or {}
+    total_slots = days * SLOTS_PER_DAY
+    range_start = datetime.combine(start_date, time.min)
+
+    # 1. Horario laboral: máscara semanal indexada por el día de la semana de cada fecha
+    weekdays = (start_date.weekday() + np.arange(days)) % 7
+    default_days = template_mask(DEFAULT_WORKING_HOURS)[weekdays]
+    working = np.empty((len(doctor_ids), days, SLOTS_PER_DAY), dtype=bool)
+    for row, doctor_id in enumerate(doctor_ids):
+        template = templates.get(doctor_id)
+        working[row] = default_days if template is None else template_mask(template)[weekdays]
+
+    # 2. Ocupación: +1 al inicio y -1 al fin de cada intervalo sobre la línea de tiempo
+    #    aplanada de todos los doctores; cumsum > 0 marca los slots ocupados.
+    row_of = {doctor_id: row for row, doctor_id in enumerate(doctor_ids)}
+    blocks = [(row_of[doctor_id], start, end) for doctor_id, start, end in busy if doctor_id in row_of]
+    busy_mask = np.zeros(len(doctor_ids) * total_slots, dtype=bool)
+    if blocks:
+        rows, starts, ends = zip(*blocks)
+        start_slots, end_slots = _to_slot_offsets(range_start, starts, ends)
+        start_slots = np.clip(start_slots, 0, total_slots)
+        end_slots = np.clip(end_slots, 0, total_slots)
+        valid = end_slots > start_slots
+        offsets = np.array(rows, dtype=np.int64)[valid] * total_slots
+        diff = np.zeros(len(doctor_ids) * total_slots + 1, dtype=np.int32)
+        np.add.at(diff, offsets + start_slots[valid], 1)
+        np.add.at(diff, offsets + end_slots[valid], -1)
+        busy_mask = np.cumsum(diff[:-1]) > 0
+
+    free = working & ~busy_mask.reshape(working.shape)
+    return AvailabilityGrid(doctor_ids=doctor_ids, start_date=start_date, free=free)
+
+
+# --- Acceso a datos ---
+
+def load_booked_appointments(
+    db: Session, doctor_ids: Sequence[int], start: datetime, end: datetime,
+) -> List[Tuple[int, int, datetime, datetime]]:
+    """(id, doctor_id, inicio, fin) de las citas que ocupan agenda de esos doctores en [start, end)."""
+    if not doctor_ids:
+        return []
+    return [tuple(row) for row in db.execute(
+        select(Appointment.id, Appointment.doctor_id, Appointment.start_time, Appointment.end_time).where(
+            Appointment.doctor_id.in_(doctor_ids),
+            ACTIVE_STATUS_FILTER,
+            Appointment.start_time < end,
+            Appointment.end_time > start,
+        )
+    ).all()]
+
+
+def load_working_hours(db: Session, doctor_ids: Sequence[int]) -> Dict[int, WorkingHoursTemplate]:
+    """Plantillas guardadas de esos doctores; los que no tienen ninguna no aparecen (horario por defecto)."""
+    if not doctor_ids:
+        return {}
+    templates: Dict[int, Dict[int, List[Tuple[time, time]]]] = {}
+    rows = db.execute(
+        select(
+            DoctorWorkingHours.doctor_id, DoctorWorkingHours.weekday,
+            DoctorWorkingHours.start_time, DoctorWorkingHours.end_time,
+        ).where(DoctorWorkingHours.doctor_id.in_(doctor_ids))
+        .order_by(DoctorWorkingHours.doctor_id, DoctorWorkingHours.weekday, DoctorWorkingHours.start_time)
+    ).all()
+    for doctor_id, weekday, start, end in rows:
+        templates.setdefault(doctor_id, {}).setdefault(weekday, []).append((start, end))
+    return templates
+
+
+def load_booked_intervals(db: Session, doctor_ids: Sequence[int], start: datetime, end: datetime) -> List[BusyBlock]:
+    """Citas que ocupan agenda (solicitadas o confirmadas) de esos doctores en [start, end)."""
+    return [row[1:] for row in load_booked_appointments(db, doctor_ids, start, end)]
+
+
+def compute_availability(
+    db: Session,
+    start_date: date,
+    days: int,
+    doctor_ids: Optional[Sequence[int]] = None,
+    external_busy: Iterable[BusyBlock] = (),
+    templates: Optional[Mapping[int, WorkingHoursTemplate]] = None,
+) -> AvailabilityGrid:
+    """
+    Disponibilidad de los doctores (todos los activos por defecto) restando sus
+    citas. Sin `templates`, se usa el horario guardado de cada doctor.
+    """
+    if doctor_ids is None:
+        doctor_ids = db.scalars(
+            select(User.id).where(User.role == UserRole.DOCTOR, User.is_active.is_not(False)).order_by(User.id)
+        ).all()
+    if templates is None:
+        templates = load_working_hours(db, doctor_ids)
+    range_start = datetime.combine(start_date, time.min)
+    booked = load_booked_intervals(db, doctor_ids, range_start, range_start + timedelta(days=days))
+    return compute_free_slots(doctor_ids, start_date, days, [*booked, *external_busy], templates)
+
+
+def find_earliest_slot(
+    db: Session,
+    duration: timedelta,
+    not_before: datetime,
+    days: int,
+    external_busy: Iterable[BusyBlock] = (),
+) -> Optional[Tuple[int, datetime, datetime]]:
+    """Primer hueco libre de `duration` entre todos los doctores desde `not_before`."""
+    grid = compute_availability(db, not_before.date(), days, external_busy=external_busy)
+    return grid.earliest(duration, not_before=not_before)
@@ -0,0 +1,311 @@
+import threading
+import time as time_module
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.user import User, UserRole
+from app.utils.appointment_changes import AppointmentChange, register_listener
+from app.utils.availability import (
+    DEFAULT_WORKING_HOURS, SLOT_MINUTES, SLOTS_PER_DAY, AvailabilityGrid, BusyBlock,
+    WorkingHoursTemplate, compute_free_slots, load_booked_appointments, load_booked_intervals,
+    load_working_hours, template_mask,
+)
+
+# Caché materializada de disponibilidad: un bitmap por doctor y día.
+#
+# Cada día guarda tres arrays de SLOTS_PER_DAY posiciones:
+#   - working: horario laboral según la plantilla guardada del doctor
+#     (doctor_working_hours; al cambiarla se invalidan sus días)
+#   - booked: cuántas citas activas cubren cada slot (contador, no booleano,
+#     para poder liberar un slot al cancelar sin recalcular el día)
+#   - external: bloques ocupados externos (p. ej. free/busy de Google)
+# libre = working & (booked == 0) & ~external
+#
+# Los cambios de citas confirmados (alta, reprogramación, cancelación, no
+# presentado) se aplican de forma incremental sobre los días ya cacheados; los
+# días que no están en caché se calculan al pedirlos.
+#
+# Cada día recuerda qué slots aporta cada cita, así que aplicar un cambio es
+# idempotente: si la carga del día ya leyó la cita de la DB, el cambio no se
+# vuelve a contar. Un día cuya carga coincide con un cambio se descarta (la
+# lectura pudo ser anterior al commit) y se recalcula en la siguiente consulta.
+
+
+@dataclass
+class DayAvailability:
+    working: np.ndarray
+    booked: np.ndarray
+    external: np.ndarray = field(default_factory=lambda: np.zeros(SLOTS_PER_DAY, dtype=bool))
+    # Slots [inicio, fin) que cada cita suma en booked
+    appointments: Dict[int, Tuple[int, int]] = field(default_factory=dict)
+    computed_at: float = field(default_factory=time_module.monotonic)
+
+    @property
+    def free(self) -> np.ndarray:
+        return self.working & (self.booked == 0) & ~self.external
+
+    def set_appointment(self, appointment_id: int, slots: Optional[Tuple[int, int]]) -> None:
+        """Sustituye lo que aporta la cita al día (None: ya no ocupa este día)."""
+        previous = self.appointments.pop(appointment_id, None)
+        if previous is not None:
+            self.booked[previous[0]:previous[1]] -= 1
+        if slots is not None and slots[1] > slots[0]:
+            self.booked[slots[0]:slots[1]] += 1
+            self.appointments[appointment_id] = slots
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+def _slot_range(day: date, start: datetime, end: datetime) -> Tuple[int, int]:
+    """Slots [inicio, fin) del día cubiertos por el intervalo (mismo redondeo que compute_free_slots)."""
+    slot_seconds = SLOT_MINUTES * 60
+    start_offset = int((start - _day_start(day)).total_seconds())
+    end_offset = int((end - _day_start(day)).total_seconds())
+    first = max(0, start_offset // slot_seconds)
+    last = min(SLOTS_PER_DAY, -(-end_offset // slot_seconds))
+    return first, last
+
+
+def _days_covered(start: datetime, end: datetime) -> Iterable[date]:
+    day = start.date()
+    while _day_start(day) < end:
+        yield day
+        day += timedelta(days=1)
+
+
+def _range_counts(ranges: Iterable[Tuple[int, int]]) -> np.ndarray:
+    """Número de rangos de slots que cubren cada slot del día (array de diferencias + cumsum)."""
+    diff = np.zeros(SLOTS_PER_DAY + 1, dtype=np.int32)
+    for first, last in ranges:
+        if last > first:
+            diff[first] += 1
+            diff[last] -= 1
+    return np.cumsum(diff[:-1]).astype(np.int16)
+
+
+def _day_counts(day: date, intervals: Iterable[Tuple[datetime, datetime]]) -> np.ndarray:
+    """Número de intervalos que cubren cada slot del día."""
+    return _range_counts(_slot_range(day, start, end) for start, end in intervals)
+
+
+class AvailabilityCache:
+    """Bitmaps de disponibilidad por (doctor, día), acotados y seguros entre hilos."""
+
+    def __init__(self, max_entries: int, keep_past_days: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.keep_past_days = keep_past_days
+        # Red de seguridad frente a cambios de otros workers: los días se recalculan al expirar
+        self.ttl_seconds = ttl_seconds
+        self._last_eviction: Optional[date] = None
+        self._days: "OrderedDict[Tuple[int, date], DayAvailability]" = OrderedDict()
+        self._lock = threading.RLock()
+        # Días con una carga desde la DB en curso y cuántos cambios han recibido entretanto
+        self._loading: "Counter[Tuple[int, date]]" = Counter()
+        self._generations: "Counter[Tuple[int, date]]" = Counter()
+        self.hits = 0
+        self.misses = 0
+
+    # --- Construcción ---
+
+    @staticmethod
+    def _working_for(template: WorkingHoursTemplate, day: date) -> np.ndarray:
+        return template_mask(template)[day.weekday()].copy()
+
+    def _store(self, key: Tuple[int, date], entry: DayAvailability) -> None:
+        self._days[key] = entry
+        self._days.move_to_end(key)
+        while len(self._days) > self.max_entries:
+            self._days.popitem(last=False)
+
+    def _load_days(
+        self, db: Session, keys: Sequence[Tuple[int, date]],
+    ) -> Dict[Tuple[int, date], DayAvailability]:
+        """
+        Calcula de una vez todos los días pedidos que faltan en la caché y los
+        devuelve. Solo se guardan los días que no recibieron cambios mientras se
+        leía la DB: con un cambio entremedias no se sabe si la lectura lo incluye.
+        """
+        with self._lock:
+            self._loading.update(keys)
+            generations = {key: self._generations[key] for key in keys}
+        try:
+            doctor_ids = sorted({doctor_id for doctor_id, _ in keys})
+            first_day = min(day for _, day in keys)
+            last_day = max(day for _, day in keys)
+            booked = load_booked_appointments(
+                db, doctor_ids, _day_start(first_day), _day_start(last_day + timedelta(days=1)),
+            )
+            templates = load_working_hours(db, doctor_ids)
+
+            by_key: Dict[Tuple[int, date], Dict[int, Tuple[int, int]]] = {key: {} for key in keys}
+            for appointment_id, doctor_id, start, end in booked:
+                for day in _days_covered(start, end):
+                    ranges = by_key.get((doctor_id, day))
+                    if ranges is not None:
+                        first, last = _slot_range(day, start, end)
+                        if last > first:
+                            ranges[appointment_id] = (first, last)
+
+            loaded = {
+                (doctor_id, day): DayAvailability(
+                    working=self._working_for(templates.get(doctor_id, DEFAULT_WORKING_HOURS), day),
+                    booked=_range_counts(ranges.values()),
+                    appointments=ranges,
+                )
+                for (doctor_id, day), ranges in by_key.items()
+            }
+            with self._lock:
+                for key, entry in loaded.items():
+                    if self._generations[key] == generations[key]:
+                        self._store(key, entry)
+        finally:
+            with self._lock:
+                self._loading.subtract(keys)
+                for key in keys:
+                    if self._loading[key] <= 0:
+                        self._loading.pop(key, None)
+                        self._generations.pop(key, None)
+        return loaded
+
+    # --- Consulta ---
+
+    def get_grid(self, db: Session, doctor_ids: Sequence[int], start_date: date, days: int) -> AvailabilityGrid:
+        """Disponibilidad de varios doctores en un rango, calculando solo los días que faltan."""
+        if self._last_eviction != date.today():
+            self.evict_past()
+
+        keys = [(doctor_id, start_date + timedelta(days=offset)) for doctor_id in doctor_ids for offset in range(days)]
+        expired_before = time_module.monotonic() - self.ttl_seconds
+        with self._lock:
+            missing = [
+                key for key in keys
+                if key not in self._days or self._days[key].computed_at < expired_before
+            ]
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        loaded = self._load_days(db, missing) if missing else {}
+
+        free = np.zeros((len(doctor_ids), days, SLOTS_PER_DAY), dtype=bool)
+        with self._lock:
+            for row, doctor_id in enumerate(doctor_ids):
+                for offset in range(days):
+                    key = (doctor_id, start_date + timedelta(days=offset))
+                    # Lo recién leído sirve para esta consulta aunque no se guardara
+                    # (día expulsado por el límite de tamaño o con un cambio entremedias)
+                    entry = self._days.get(key) or loaded.get(key)
+                    if entry is None:
+                        entry = self._load_days(db, [key])[key]
+                    free[row, offset] = entry.free
+        return AvailabilityGrid(doctor_ids=list(doctor_ids), start_date=start_date, free=free)
+
+    def get_day(self, db: Session, doctor_id: int, day: date) -> np.ndarray:
+        return self.get_grid(db, [doctor_id], day, 1).free[0, 0]
+
+    # --- Actualización incremental ---
+
+    def apply_changes(self, changes: List[AppointmentChange]) -> None:
+        """Listener de cambios de citas: deja cada cita en los días cacheados con su estado nuevo."""
+        with self._lock:
+            for change in changes:
+                after = change.after if change.after is not None and change.after.occupies_agenda else None
+                keys = set()
+                for state in (change.before, after):
+                    if state is not None and state.occupies_agenda:
+                        keys.update((state.doctor_id, day) for day in _days_covered(state.start_time, state.end_time))
+                for doctor_id, day in keys:
+                    if (doctor_id, day) in self._loading:
+                        self._generations[(doctor_id, day)] += 1
+                    entry = self._days.get((doctor_id, day))
+                    if entry is not None:
+                        slots = None
+                        if after is not None and after.doctor_id == doctor_id:
+                            slots = _slot_range(day, after.start_time, after.end_time)
+                        entry.set_appointment(change.appointment_id, slots)
+
+    def set_external_busy(self, doctor_id: int, day: date, blocks: Iterable[Tuple[datetime, datetime]]) -> None:
+        """Reemplaza los bloques ocupados externos de un día cacheado."""
+        with self._lock:
+            entry = self._days.get((doctor_id, day))
+            if entry is not None:
+                entry.external = _day_counts(day, blocks) > 0
+
+    def invalidate(self, doctor_id: int, day: Optional[date] = None) -> None:
+        """Descarta un día (o todos los días) de un doctor; se recalculan al pedirlos."""
+        with self._lock:
+            keys = [key for key in self._days if key[0] == doctor_id and (day is None or key[1] == day)]
+            for key in keys:
+                del self._days[key]
+            # Una carga en curso pudo leer los datos anteriores: no debe guardarse
+            for key in self._loading:
+                if key[0] == doctor_id and (day is None or key[1] == day):
+                    self._generations[key] += 1
+
+    # --- Mantenimiento ---
+
+    def evict_past(self, today: Optional[date] = None) -> int:
+        """Elimina los días anteriores a hoy - keep_past_days. Devuelve cuántos se quitaron."""
+        today = today or date.today()
+        limit = today - timedelta(days=self.keep_past_days)
+        with self._lock:
+            old = [key for key in self._days if key[1] < limit]
+            for key in old:
+                del self._days[key]
+            self._last_eviction = today
+        return len(old)
+
+    def warm_up(self, db: Session, days: int, today: Optional[date] = None) -> None:
+        """Precalcula los próximos `days` días de todos los doctores activos."""
+        self.evict_past(today)
+        doctor_ids = db.scalars(
+            select(User.id).where(User.role == UserRole.DOCTOR, User.is_active.is_not(False)).order_by(User.id)
+        ).all()
+        if doctor_ids and days > 0:
+            self.get_grid(db, doctor_ids, today or date.today(), days)
+
+    def verify(self, db: Session, doctor_id: int, day: date, external_busy: Iterable[BusyBlock] = ()) -> bool:
+        """Compara el bitmap cacheado con un recálculo completo (verificación de consistencia)."""
+        cached = self.get_day(db, doctor_id, day)
+        booked = load_booked_intervals(db, [doctor_id], _day_start(day), _day_start(day + timedelta(days=1)))
+        expected = compute_free_slots(
+            [doctor_id], day, 1, [*booked, *external_busy], templates=load_working_hours(db, [doctor_id]),
+        ).free[0, 0]
+        return bool(np.array_equal(cached, expected))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._days.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"days": len(self._days), "hits": self.hits, "misses": self.misses}
+
+
+availability_cache = AvailabilityCache(
+    max_entries=settings.AVAILABILITY_CACHE_MAX_DAYS,
+    keep_past_days=settings.AVAILABILITY_CACHE_KEEP_PAST_DAYS,
+    ttl_seconds=settings.AVAILABILITY_CACHE_TTL_SECONDS,
+)
+register_listener(availability_cache.apply_changes)
+
+
+def find_earliest_slot_cached(
+    db: Session,
+    duration: timedelta,
+    not_before: datetime,
+    days: int,
+) -> Optional[Tuple[int, datetime, datetime]]:
+    """Como availability.find_earliest_slot, pero sobre los bitmaps cacheados."""
+    doctor_ids = db.scalars(
+        select(User.id).where(User.role == UserRole.DOCTOR, User.is_active.is_not(False)).order_by(User.id)
+    ).all()
+    grid = availability_cache.get_grid(db, doctor_ids, not_before.date(), days)
+    return grid.earliest(duration, not_before=not_before)
@@ -0,0 +1,113 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+# Utilidades de caché compartidas por la aplicación.
+# LRUTTLCache es la implementación en memoria del proceso; RedisCacheBackend
+# permite compartir los mismos datos entre varios workers usando cualquier
+# servidor compatible con Redis.
+
+
+class LRUTTLCache:
+    """
+    Caché LRU acotada y segura entre hilos, con expiración por entrada.
+    Cada entrada expira según el TTL por defecto o un instante absoluto
+    (`expires_at`, en segundos epoch) indicado al guardarla.
+    """
+    # Operaciones en memoria: se pueden llamar directamente desde el event loop
+    blocking = False
+
+    def __init__(self, max_entries: int, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and time.time() > expires_at:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None,
+            expires_at: Optional[float] = None) -> None:
+        if expires_at is None:
+            ttl = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+            expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RedisCacheBackend:
+    """
+    Backend con la misma interfaz que LRUTTLCache sobre un cliente compatible
+    con Redis (get/setex/delete). Los valores se serializan a JSON.
+    Cada operación es una llamada de red bloqueante: desde código async hay que
+    ejecutarla en el threadpool (ver PrincipalCache.get_async).
+    """
+    blocking = True
+
+    def __init__(self, client, prefix: str, ttl_seconds: float,
+                 dumps: Callable[[Any], Any] = lambda value: value,
+                 loads: Callable[[Any], Any] = lambda value: value):
+        self.client = client
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+        self._dumps = dumps
+        self._loads = loads
+
+    def _key(self, key: Hashable) -> str:
+        return f"{self.prefix}:{key}"
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        raw = self.client.get(self._key(key))
+        if raw is None:
+            return None
+        return self._loads(json.loads(raw))
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None,
+            expires_at: Optional[float] = None) -> None:
+        if expires_at is not None:
+            ttl_seconds = expires_at - time.time()
+        ttl = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        if ttl <= 0:
+            return
+        self.client.setex(self._key(key), max(1, int(ttl)), json.dumps(self._dumps(value)))
+
+    def delete(self, key: Hashable) -> None:
+        self.client.delete(self._key(key))
+
+    def clear(self) -> None:
+        for key in self.client.scan_iter(f"{self.prefix}:*"):
+            self.client.delete(key)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.client.scan_iter(f"{self.prefix}:*"))
+
+
+def redis_client_from_url(url: str):
+    """Crea un cliente Redis a partir de una URL (importa redis solo si se usa)."""
+    import redis
+    return redis.Redis.from_url(url)
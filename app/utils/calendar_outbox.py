@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.database import SessionLocal
+from app.excepciones import GoogleCalendarError, GoogleThrottledError, GoogleUnavailableError
+from app.models.appointment import Appointment
+from app.models.calendar_outbox import CalendarOutbox, CalendarOutboxStatus
+from app.models.user import User
+from app.utils.loading_profiles import loading_options
+from app.utils.servicios_meet_calendar import (
+    CalendarOperation, batch_calendar_operations, build_event_body,
+    create_google_calendar_event, extract_meet_info
+)
+
+# Worker del outbox de Google Calendar/Meet.
+# Las rutas confirman la cita junto con una fila de CalendarOutbox y responden sin
+# esperar a Google. El worker toma las filas pendientes, crea los eventos con un
+# límite de concurrencia (agrupando por doctor en lotes HTTP), reintenta con backoff exponencial los errores
+# transitorios y escribe el enlace de Meet en la cita. Si el limitador o el circuit
+# breaker no dejan llamar a Google, la entrada se reprograma según su Retry-After
+# sin gastar un intento.
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_calendar_event(db, appointment: Appointment, summary: str, description: Optional[str], patient_email: str) -> CalendarOutbox:
+    """Añade a la sesión la entrada del outbox de una cita (se confirma junto con ella)."""
+    entry = CalendarOutbox(
+        appointment=appointment,
+        doctor_id=appointment.doctor_id,
+        summary=summary,
+        description=description,
+        patient_email=patient_email,
+        status=CalendarOutboxStatus.PENDING,
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+    )
+    db.add(entry)
+    return entry
+
+
+def backoff_delay(attempts: int) -> float:
+    """Espera antes del siguiente intento: exponencial con jitter, acotada."""
+    delay = min(
+        settings.CALENDAR_OUTBOX_BACKOFF_MAX_SECONDS,
+        settings.CALENDAR_OUTBOX_BACKOFF_BASE_SECONDS * 2 ** max(0, attempts - 1),
+    )
+    return delay * random.uniform(0.5, 1.0)
+
+
+def event_id_for(entry: CalendarOutbox) -> str:
+    """Id de evento determinista (base32hex) para que los reintentos no dupliquen el evento."""
+    return f"cita{entry.appointment_id}n{entry.id}"
+
+
+class CalendarOutboxWorker:
+    """Vacía el outbox de eventos de Calendar en segundo plano."""
+
+    def __init__(self, concurrency: int, batch_size: int, poll_seconds: float,
+                 max_attempts: int, lease_seconds: int):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self.lease = timedelta(seconds=lease_seconds)
+        self._wake: Optional[asyncio.Event] = None
+        self.succeeded = 0
+        self.retried = 0
+        self.deferred = 0
+        self.failed = 0
+
+    # --- Acceso a datos (síncrono, se ejecuta en el threadpool) ---
+
+    def _claim_due(self) -> Dict[int, List[int]]:
+        """
+        Marca como en proceso las entradas vencidas (o huérfanas) y devuelve sus ids
+        agrupados por doctor. El UPDATE condicionado al estado evita que dos workers
+        tomen la misma entrada.
+        """
+        now = datetime.utcnow()
+        claimable = or_(
+            and_(CalendarOutbox.status == CalendarOutboxStatus.PENDING, CalendarOutbox.next_attempt_at <= now),
+            and_(CalendarOutbox.status == CalendarOutboxStatus.IN_PROGRESS, CalendarOutbox.locked_at < now - self.lease),
+        )
+        claimed: Dict[int, List[int]] = defaultdict(list)
+        with SessionLocal() as db:
+            candidates = db.execute(
+                select(CalendarOutbox.id, CalendarOutbox.doctor_id).where(claimable).order_by(CalendarOutbox.next_attempt_at).limit(self.batch_size)
+            ).all()
+            for entry_id, doctor_id in candidates:
+                result = db.execute(
+                    update(CalendarOutbox)
+                    .where(CalendarOutbox.id == entry_id, claimable)
+                    .values(status=CalendarOutboxStatus.IN_PROGRESS, locked_at=now)
+                )
+                if result.rowcount == 1:
+                    claimed[doctor_id].append(entry_id)
+            db.commit()
+        return dict(claimed)
+
+    def _process(self, entry_ids: List[int]) -> None:
+        """
+        Crea los eventos de las entradas de un mismo doctor y registra los resultados.
+        Una entrada va por la llamada simple; varias, en lotes de la API batch.
+        """
+        with SessionLocal() as db:
+            entries = [db.get(CalendarOutbox, entry_id) for entry_id in entry_ids]
+            entries = [entry for entry in entries if entry is not None and entry.status == CalendarOutboxStatus.IN_PROGRESS]
+            if not entries:
+                return
+            doctor = db.get(User, entries[0].doctor_id, options=loading_options("auth"))
+            ready = []
+            for entry in entries:
+                entry.attempts += 1
+                if entry.appointment is None or doctor is None:
+                    self._record_failure(entry, "La cita o el doctor ya no existen.", retryable=False)
+                else:
+                    ready.append(entry)
+
+            if len(ready) == 1:
+                self._create_single(doctor, ready[0])
+            elif ready:
+                self._create_batch(doctor, ready)
+            try:
+                db.commit()
+            except StaleDataError as e:
+                # Una cita cambió mientras se creaba su evento (versión optimista). Las
+                # entradas siguen tomadas y vuelven a la cola al vencer el lease; el
+                # reintento recupera el evento ya creado (mismo id, 409 -> GET).
+                db.rollback()
+                logger.warning(f"Resultados del outbox descartados por una cita modificada en paralelo: {e}")
+
+    def _create_single(self, doctor: User, entry: CalendarOutbox) -> None:
+        try:
+            meet_info = create_google_calendar_event(
+                doctor=doctor,
+                summary=entry.summary,
+                description=entry.description or "",
+                start_time=entry.appointment.start_time,
+                end_time=entry.appointment.end_time,
+                patient_email=entry.patient_email,
+                event_id=event_id_for(entry),
+            )
+        except (GoogleThrottledError, GoogleUnavailableError) as e:
+            self._record_deferral(entry, e)
+        except GoogleCalendarError as e:
+            self._record_failure(entry, e.detail, e.retryable)
+        except Exception as e:
+            logger.exception(f"Error inesperado en el outbox de Calendar (entrada {entry.id}): {e}")
+            self._record_failure(entry, str(e), retryable=True)
+        else:
+            self._record_success(entry, meet_info)
+
+    def _create_batch(self, doctor: User, entries: List[CalendarOutbox]) -> None:
+        # Un solo intento por lote: el backoff de las entradas fallidas lo gestiona el outbox
+        operations = [
+            CalendarOperation(
+                key=entry.id,
+                kind="insert",
+                event_id=event_id_for(entry),
+                body=build_event_body(
+                    doctor, entry.summary, entry.description or "",
+                    entry.appointment.start_time, entry.appointment.end_time,
+                    entry.patient_email, event_id_for(entry),
+                ),
+            )
+            for entry in entries
+        ]
+        try:
+            results = batch_calendar_operations(doctor, operations, max_attempts=1)
+        except (GoogleThrottledError, GoogleUnavailableError) as e:
+            for entry in entries:
+                self._record_deferral(entry, e)
+            return
+        except GoogleCalendarError as e:
+            for entry in entries:
+                self._record_failure(entry, e.detail, e.retryable)
+            return
+        except Exception as e:
+            logger.exception(f"Error inesperado en el lote de Calendar del doctor {doctor.id}: {e}")
+            for entry in entries:
+                self._record_failure(entry, str(e), retryable=True)
+            return
+
+        for entry, result in zip(entries, results):
+            if result.ok:
+                self._record_success(entry, extract_meet_info(result.event or {}))
+            else:
+                self._record_failure(entry, result.error, result.retryable)
+
+    def _record_success(self, entry: CalendarOutbox, meet_info: Dict) -> None:
+        entry.appointment.video_url = meet_info["meet_url"]
+        entry.event_url = meet_info["event_url"]
+        entry.status = CalendarOutboxStatus.DONE
+        entry.last_error = None
+        entry.locked_at = None
+        self.succeeded += 1
+
+    def _record_failure(self, entry: CalendarOutbox, error: str, retryable: bool) -> None:
+        entry.last_error = error
+        entry.locked_at = None
+        if retryable and entry.attempts < self.max_attempts:
+            entry.status = CalendarOutboxStatus.PENDING
+            entry.next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff_delay(entry.attempts))
+            self.retried += 1
+        else:
+            entry.status = CalendarOutboxStatus.FAILED
+            self.failed += 1
+            logger.warning(f"Evento de Calendar de la cita {entry.appointment_id} descartado tras {entry.attempts} intentos: {error}")
+
+    def _record_deferral(self, entry: CalendarOutbox, error: GoogleCalendarError) -> None:
+        """Google no llegó a llamarse (limitador o breaker): se reprograma sin gastar el intento."""
+        entry.attempts -= 1
+        entry.last_error = error.detail
+        entry.locked_at = None
+        entry.status = CalendarOutboxStatus.PENDING
+        entry.next_attempt_at = datetime.utcnow() + timedelta(seconds=error.retry_after_seconds)
+        self.deferred += 1
+
+    # --- Bucle del worker ---
+
+    def wake(self) -> None:
+        """Despierta al worker (p. ej. tras confirmar una cita nueva) sin esperar al sondeo."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def run(self) -> None:
+        self._wake = asyncio.Event()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def process(entry_ids: List[int]) -> None:
+            async with semaphore:
+                await run_in_threadpool(self._process, entry_ids)
+
+        while True:
+            # Se limpia antes de buscar entradas para no perder un wake() concurrente
+            self._wake.clear()
+            try:
+                claimed = await run_in_threadpool(self._claim_due)
+                if claimed:
+                    # Un grupo por doctor: sus eventos comparten credenciales y lote HTTP
+                    await asyncio.gather(*(process(entry_ids) for entry_ids in claimed.values()))
+                    if sum(len(entry_ids) for entry_ids in claimed.values()) == self.batch_size:
+                        # Puede haber más entradas vencidas: no esperar al siguiente sondeo
+                        continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"⚠️ Error en el worker del outbox de Calendar: {e}")
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self, db: Optional[Session] = None) -> Dict[str, object]:
+        result: Dict[str, object] = {
+            "succeeded": self.succeeded,
+            "retried": self.retried,
+            "deferred": self.deferred,
+            "failed": self.failed,
+        }
+        if db is not None:
+            counts = db.execute(
+                select(CalendarOutbox.status, func.count()).group_by(CalendarOutbox.status)
+            ).all()
+            result["by_status"] = {status.value: count for status, count in counts}
+        return result
+
+
+calendar_outbox_worker = CalendarOutboxWorker(
+    concurrency=settings.CALENDAR_OUTBOX_CONCURRENCY,
+    batch_size=settings.CALENDAR_OUTBOX_BATCH_SIZE,
+    poll_seconds=settings.CALENDAR_OUTBOX_POLL_SECONDS,
+    max_attempts=settings.CALENDAR_OUTBOX_MAX_ATTEMPTS,
+    lease_seconds=settings.CALENDAR_OUTBOX_LEASE_SECONDS,
+)
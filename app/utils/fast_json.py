@@ -0,0 +1,106 @@
+import enum
+from datetime import date, datetime, time
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Any, Iterable, List, Mapping, Sequence, Tuple
+
+from fastapi.responses import JSONResponse
+from pydantic_core import to_json
+
+from app.models.appointment import AppointmentStatus, PriorityLevel
+from app.models.user import UserRole
+
+try:  # Dependencia opcional: sin orjson se usa el codificador de pydantic-core
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+# Serialización JSON rápida.
+#
+# dumps() usa orjson si está instalado y, si no, pydantic_core.to_json (también en
+# Rust y siempre disponible). RowSerializer convierte filas de SQLAlchemy Core
+# (tuplas) directamente en bytes JSON, sin construir objetos ORM ni validar cada
+# fila con Pydantic: los enums se traducen con tablas de valores precalculadas y
+# las fechas las codifica el propio codificador.
+
+# Tabla miembro -> valor de los enums que aparecen en las respuestas
+ENUM_VALUES: Mapping[enum.Enum, Any] = MappingProxyType({
+    member: member.value
+    for enum_class in (AppointmentStatus, PriorityLevel, UserRole)
+    for member in enum_class
+})
+
+
+def _default(value: Any) -> Any:
+    """Tipos que el codificador no soporta de forma nativa."""
+    if isinstance(value, enum.Enum):
+        return ENUM_VALUES.get(value, value.value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Tipo no serializable a JSON: {type(value).__name__}")
+
+
+if orjson is not None:
+    # OPT_UTC_Z: las fechas UTC salen como "...Z", igual que con Pydantic
+    _ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def dumps(content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+else:
+    def dumps(content: Any) -> bytes:
+        return to_json(content, fallback=_default)
+
+
+class RawJSONResponse(JSONResponse):
+    """
+    JSONResponse que acepta bytes ya codificados (p. ej. de RowSerializer) y
+    codifica cualquier otro contenido con dumps().
+    """
+
+    def render(self, content: Any) -> bytes:
+        return content if isinstance(content, bytes) else dumps(content)
+
+
+# --- Filas de SQLAlchemy Core ---
+
+class RowSerializer:
+    """
+    Serializa filas de `select(*columns)` en el orden de las columnas. Los nombres
+    de campo son las claves de las columnas y las columnas Enum se traducen con
+    una tabla precalculada, de modo que cada fila es un dict construido en una pasada.
+    """
+
+    def __init__(self, columns: Sequence[Any]):
+        self.fields: Tuple[str, ...] = tuple(column.key for column in columns)
+        # (posición, tabla de valores) de cada columna Enum
+        self._enum_columns: Tuple[Tuple[int, Mapping[enum.Enum, Any]], ...] = tuple(
+            (position, MappingProxyType({member: member.value for member in enum_class}))
+            for position, column in enumerate(columns)
+            if (enum_class := getattr(column.type, "enum_class", None)) is not None
+        )
+
+    def to_dict(self, row: Sequence[Any]) -> dict:
+        if not self._enum_columns:
+            return dict(zip(self.fields, row))
+        values = list(row)
+        for position, table in self._enum_columns:
+            value = values[position]
+            if value is not None:
+                values[position] = table[value]
+        return dict(zip(self.fields, values))
+
+    def to_dicts(self, rows: Iterable[Sequence[Any]]) -> List[dict]:
+        to_dict = self.to_dict
+        return [to_dict(row) for row in rows]
+
+    def dumps(self, rows: Iterable[Sequence[Any]]) -> bytes:
+        """Array JSON con todas las filas."""
+        return dumps(self.to_dicts(rows))
+
+    def dumps_line(self, row: Sequence[Any]) -> bytes:
+        """Una fila como línea NDJSON."""
+        return dumps(self.to_dict(row)) + b"\n"
@@ -1,66 +1,254 @@
-from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
 from app.config import settings
-from typing import Optional
-from sqlalchemy.orm import Session
-from app.models.user import User
+from app.excepciones import GoogleCalendarError, GoogleUnavailableError
+from app.utils.cache import LRUTTLCache
+from app.utils.request_metrics import track_external
+from app.utils.resilience import CircuitBreaker
+from datetime import datetime, timedelta
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+from urllib.parse import urlencode
+import base64
+import json
+import logging
+import secrets
+import threading
 from fastapi import status, HTTPException # <--- CAMBIO: Agregada HTTPException
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# google-auth, google-auth-oauthlib y requests se importan en el primer uso: los
+# workers que no atienden rutas de Google no pagan su carga al arrancar.
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import Flow
 
 # Configuración: Los datos del cliente se obtienen de app.config
 # Estos datos son usados por la librería google-auth-oauthlib
+# Se construye una sola vez y es inmutable (se comparte entre peticiones e hilos).
 
-CLIENT_CONFIG = {
-    "web": {
+CLIENT_CONFIG = MappingProxyType({
+    "web": MappingProxyType({
         "client_id": settings.GOOGLE_CLIENT_ID,
         "project_id": "fastapi-calendar-app", # Puede ser un nombre de proyecto genérico
         "auth_uri": "https://accounts.google.com/o/oauth2/auth",
         "token_uri": "https://oauth2.googleapis.com/token",
         "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
         "client_secret": settings.GOOGLE_CLIENT_SECRET,
-        "redirect_uris": [settings.GOOGLE_REDIRECT_URI], # <--- CORRECCIÓN 1
-        "javascript_origins": ["http://localhost:8000"] # No crítico para backend, pero requerido por el objeto
-    }
-}
+        "redirect_uris": (settings.GOOGLE_REDIRECT_URI,), # <--- CORRECCIÓN 1
+        "javascript_origins": ("http://localhost:8000",) # No crítico para backend, pero requerido por el objeto
+    })
+})
+
+# Parámetros fijos de la URL de consentimiento (solo cambia el state)
+_AUTHORIZATION_PARAMS = MappingProxyType({
+    "client_id": settings.GOOGLE_CLIENT_ID,
+    "redirect_uri": settings.GOOGLE_REDIRECT_URI,
+    "response_type": "code",
+    "scope": " ".join(settings.GOOGLE_SCOPES),
+    "access_type": "offline",
+    "include_granted_scopes": "true",
+    # Solicita el refresh_token para poder usarlo después
+    "prompt": "consent",
+})
+
+
+# --- Transporte HTTP compartido ---
+# Una sesión de requests con pool de conexiones para el intercambio de códigos y
+# el refresco de tokens (evita el handshake TLS por llamada), y un cliente httpx
+# asíncrono para el callback de OAuth. Se cierran en el apagado de la aplicación.
+
+_http_session = None
+_auth_request = None
+_async_client = None
+_transport_lock = threading.Lock()
+
+
+def _get_http_session():
+    """Sesión de requests compartida (creada en el primer uso)."""
+    global _http_session
+    if _http_session is None:
+        with _transport_lock:
+            if _http_session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                session.mount("https://", HTTPAdapter(
+                    pool_connections=settings.GOOGLE_HTTP_POOL_SIZE,
+                    pool_maxsize=settings.GOOGLE_HTTP_POOL_SIZE,
+                ))
+                _http_session = session
+    return _http_session
+
 
-def get_google_auth_flow() -> Flow:
+def _get_auth_request():
+    """Transporte de google-auth sobre la sesión compartida."""
+    global _auth_request
+    if _auth_request is None:
+        from google.auth.transport.requests import Request
+        _auth_request = Request(session=_get_http_session())
+    return _auth_request
+
+
+def _get_async_client():
+    """
+    Cliente httpx compartido (se importa httpx solo si se usa el intercambio async).
+    Devuelve None si httpx no está instalado.
+    """
+    global _async_client
+    if _async_client is None:
+        try:
+            import httpx
+        except ImportError:
+            return None
+        _async_client = httpx.AsyncClient(
+            timeout=settings.GOOGLE_HTTP_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=settings.GOOGLE_HTTP_POOL_SIZE),
+        )
+    return _async_client
+
+
+async def close_http_clients() -> None:
+    """Cierra los clientes HTTP compartidos de Google."""
+    global _async_client, _http_session, _auth_request
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    if _http_session is not None:
+        _http_session.close()
+        _http_session, _auth_request = None, None
+
+
+def get_google_auth_flow() -> "Flow":
     """
     Inicializa y devuelve el objeto Flow de Google, que gestiona el proceso OAuth.
+    Las rutas usan build_authorization_url y exchange_code_for_tokens*, que no
+    necesitan construir un Flow por petición.
     """
+    from google_auth_oauthlib.flow import Flow
+
     try:
         flow = Flow.from_client_config(
-            client_config=CLIENT_CONFIG,
+            client_config={"web": dict(CLIENT_CONFIG["web"])},
             scopes=settings.GOOGLE_SCOPES,
             redirect_uri=settings.GOOGLE_REDIRECT_URI # <--- CORRECCIÓN 2
         )
         return flow
     except Exception as e:
-        print(f"Error al inicializar Google Flow: {e}")
+        logger.error(f"Error al inicializar Google Flow: {e}")
         # <--- CAMBIO: Usando HTTPException en lugar de CustomHTTPException
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error de configuración de Google OAuth."
         )
 
+def build_authorization_url(state: Optional[str] = None) -> Tuple[str, str]:
+    """
+    URL de la página de consentimiento de Google y el state usado.
+    Equivale a Flow.authorization_url con access_type=offline y prompt=consent.
+    """
+    state = state or secrets.token_urlsafe(24)
+    query = urlencode({**_AUTHORIZATION_PARAMS, "state": state})
+    return f"{CLIENT_CONFIG['web']['auth_uri']}?{query}", state
+
+
+def _token_request_data(auth_code: str) -> Dict[str, str]:
+    return {
+        "code": auth_code,
+        "client_id": settings.GOOGLE_CLIENT_ID,
+        "client_secret": settings.GOOGLE_CLIENT_SECRET,
+        "redirect_uri": settings.GOOGLE_REDIRECT_URI,
+        "grant_type": "authorization_code",
+    }
+
+
+def _id_token_claims(id_token: Optional[str]) -> dict:
+    """
+    Claims del id_token sin verificar la firma: el token llega directamente del
+    endpoint de Google por TLS en la respuesta al intercambio (OpenID Connect 3.1.3.7).
+    """
+    if not id_token:
+        return {}
+    payload = id_token.split(".")[1]
+    return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+
+
+def _tokens_from_response(status_code: int, payload: dict) -> dict:
+    """Convierte la respuesta del endpoint de tokens al diccionario que usan las rutas."""
+    if status_code >= 500:
+        raise GoogleCalendarError("El servidor de tokens de Google no está disponible.", retryable=True)
+    if status_code != 200:
+        # Código inválido, expirado o ya usado
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Google rechazó el código de autorización: {payload.get('error', status_code)}"
+        )
+    return {
+        "refresh_token": payload.get("refresh_token"),
+        "access_token": payload.get("access_token"),
+        "expiry": datetime.utcnow() + timedelta(seconds=int(payload.get("expires_in", 0))),
+        "email": _id_token_claims(payload.get("id_token")).get("email")
+    }
+
+
+def _json_or_empty(response) -> dict:
+    try:
+        return response.json()
+    except ValueError:
+        return {}
+
+
 def exchange_code_for_tokens(auth_code: str) -> dict:
     """
     Intercambia el código de autorización por los tokens de acceso y refresco.
     Devuelve un diccionario con los detalles de las credenciales.
     """
-    flow = get_google_auth_flow()
-    
-    # Realiza la solicitud al servidor de Google para obtener los tokens
-    flow.fetch_token(code=auth_code)
+    # Realiza la solicitud al servidor de Google para obtener los tokens (sesión compartida)
+    with track_external("google_oauth"):
+        response = _get_http_session().post(
+            CLIENT_CONFIG["web"]["token_uri"],
+            data=_token_request_data(auth_code),
+            timeout=settings.GOOGLE_HTTP_TIMEOUT_SECONDS,
+        )
+    return _tokens_from_response(response.status_code, _json_or_empty(response))
+
+
+async def exchange_code_for_tokens_async(auth_code: str) -> dict:
+    """Versión asíncrona de exchange_code_for_tokens (no ocupa un hilo del worker)."""
+    client = _get_async_client()
+    if client is None:
+        return await run_in_threadpool(exchange_code_for_tokens, auth_code)
+    with track_external("google_oauth"):
+        response = await client.post(
+            CLIENT_CONFIG["web"]["token_uri"],
+            data=_token_request_data(auth_code),
+        )
+    return _tokens_from_response(response.status_code, _json_or_empty(response))
+
+def refresh_credentials(refresh_token: str) -> "Credentials":
+    """
+    Obtiene un access token nuevo a partir del refresh token.
+    Propaga los errores de google-auth (RefreshError, TransportError).
+    """
+    from google.oauth2.credentials import Credentials
+
+    # Crea un objeto Credentials a partir del refresh token y las credenciales del cliente
+    credentials = Credentials(
+        token=None,  # No necesitamos un access token actual, lo va a generar
+        refresh_token=refresh_token,
+        token_uri=CLIENT_CONFIG['web']['token_uri'],
+        client_id=settings.GOOGLE_CLIENT_ID,
+        client_secret=settings.GOOGLE_CLIENT_SECRET,
+        scopes=settings.GOOGLE_SCOPES
+    )
     
-    # flow.credentials contiene el access_token, refresh_token, token_uri, etc.
-    return {
-        "refresh_token": flow.credentials.refresh_token,
-        "access_token": flow.credentials.token,
-        "expiry": flow.credentials.expiry,
-        "email": flow.credentials.id_token.get('email')
-    }
+    # Refresca el token para obtener un access token válido (transporte compartido)
+    with track_external("google_oauth"):
+        credentials.refresh(_get_auth_request())
+    return credentials
 
-def get_credentials_from_refresh_token(refresh_token: str) -> Optional[Credentials]:
+
+def get_credentials_from_refresh_token(refresh_token: str) -> Optional["Credentials"]:
     """
     Usa el token de refresco guardado para obtener un nuevo token de acceso.
     """
@@ -68,21 +256,134 @@ def get_credentials_from_refresh_token(refresh_token: str) -> Optional[Credentia
         return None
         
     try:
-        # Crea un objeto Credentials a partir del refresh token y las credenciales del cliente
-        credentials = Credentials(
-            token=None,  # No necesitamos un access token actual, lo va a generar
-            refresh_token=refresh_token,
-            token_uri=CLIENT_CONFIG['web']['token_uri'],
-            client_id=settings.GOOGLE_CLIENT_ID,
-            client_secret=settings.GOOGLE_CLIENT_SECRET,
-            scopes=settings.GOOGLE_SCOPES
-        )
-        
-        # Refresca el token para obtener un access token válido
-        credentials.refresh(Request())
-        
-        return credentials
+        return refresh_credentials(refresh_token)
     except Exception as e:
-        print(f"Error al refrescar el token de Google: {e}")
+        logger.warning(f"Error al refrescar el token de Google: {e}")
         # Si el refresh token falla (por ejemplo, revocado), devolvemos None
         return None
+
+
+# --- Caché de credenciales por doctor ---
+# Refrescar el access token es una llamada de red a Google. Las credenciales de
+# cada doctor se guardan hasta poco antes de su expiración (margen configurable)
+# y se refrescan de forma proactiva al pedirlas dentro de ese margen. Un lock por
+# doctor evita que varias peticiones simultáneas refresquen el mismo token; los
+# locks son un conjunto fijo (striping por doctor_id), así que no crecen con el
+# número de doctores.
+
+class GoogleCredentialsCache:
+    """Credenciales OAuth válidas por doctor, refrescadas antes de expirar."""
+
+    def __init__(self, max_entries: int, refresh_margin_seconds: int, lock_stripes: int = 64):
+        self.refresh_margin = timedelta(seconds=refresh_margin_seconds)
+        # doctor_id -> (refresh_token, Credentials)
+        self._entries = LRUTTLCache(max_entries=max_entries)
+        self._locks = tuple(threading.Lock() for _ in range(lock_stripes))
+        self.hits = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    def _lock_for(self, doctor_id: int) -> threading.Lock:
+        return self._locks[doctor_id % len(self._locks)]
+
+    def _is_fresh(self, credentials: "Credentials") -> bool:
+        # google-auth guarda expiry como datetime UTC sin zona horaria
+        return (
+            credentials.token is not None
+            and credentials.expiry is not None
+            and credentials.expiry - self.refresh_margin > datetime.utcnow()
+        )
+
+    def _cached(self, doctor_id: int, refresh_token: str) -> Optional["Credentials"]:
+        entry = self._entries.get(doctor_id)
+        if entry is not None and entry[0] == refresh_token and self._is_fresh(entry[1]):
+            return entry[1]
+        return None
+
+    def get(self, doctor_id: int, refresh_token: str) -> Optional["Credentials"]:
+        """
+        Devuelve credenciales con un access token vigente para el doctor.
+        Solo se llama a Google si no hay token en caché o está por expirar.
+        """
+        if not refresh_token:
+            return None
+        credentials = self._cached(doctor_id, refresh_token)
+        if credentials is not None:
+            self.hits += 1
+            return credentials
+
+        with self._lock_for(doctor_id):
+            # Otra petición pudo haberlo refrescado mientras esperábamos el lock
+            credentials = self._cached(doctor_id, refresh_token)
+            if credentials is not None:
+                self.hits += 1
+                return credentials
+            credentials = self._refresh(doctor_id, refresh_token)
+            if credentials is None:
+                return None
+            self.refreshes += 1
+            self._entries.set(doctor_id, (refresh_token, credentials))
+            return credentials
+
+    def _refresh(self, doctor_id: int, refresh_token: str) -> Optional["Credentials"]:
+        """
+        Refresca el token protegido por el circuit breaker. Los fallos transitorios
+        (red, 5xx) cuentan para abrirlo y se propagan como reintentables; un refresh
+        token revocado es un error definitivo del doctor y devuelve None.
+        """
+        from google.auth.exceptions import RefreshError, TransportError
+
+        if not token_refresh_breaker.allow():
+            raise GoogleUnavailableError(
+                "Google OAuth no está disponible temporalmente.",
+                retry_after_seconds=max(1, int(token_refresh_breaker.retry_after())),
+            )
+        try:
+            credentials = refresh_credentials(refresh_token)
+        except RefreshError as e:
+            self.failures += 1
+            if getattr(e, "retryable", False):
+                token_refresh_breaker.record_failure()
+                raise GoogleCalendarError("No se pudo refrescar el token de Google.", retryable=True)
+            # Google respondió: el servicio funciona, el token no es válido
+            token_refresh_breaker.record_success()
+            logger.warning(f"Error al refrescar el token de Google del doctor {doctor_id}: {e}")
+            self._entries.delete(doctor_id)
+            return None
+        except TransportError as e:
+            self.failures += 1
+            token_refresh_breaker.record_failure()
+            logger.warning(f"Error de red al refrescar el token de Google del doctor {doctor_id}: {e}")
+            raise GoogleCalendarError("No se pudo contactar con Google OAuth.", retryable=True)
+        except Exception:
+            # Cualquier otro fallo también cierra la llamada de prueba del breaker en half_open
+            self.failures += 1
+            token_refresh_breaker.record_failure()
+            raise
+        token_refresh_breaker.record_success()
+        return credentials
+
+    def invalidate(self, doctor_id: int) -> None:
+        """Descarta las credenciales de un doctor (p. ej. si Google las rechaza)."""
+        self._entries.delete(doctor_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+        }
+
+
+# Circuit breaker del endpoint de tokens de Google
+token_refresh_breaker = CircuitBreaker(
+    name="google_token_refresh",
+    failure_threshold=settings.GOOGLE_BREAKER_FAILURE_THRESHOLD,
+    recovery_seconds=settings.GOOGLE_BREAKER_RECOVERY_SECONDS,
+)
+
+credentials_cache = GoogleCredentialsCache(
+    max_entries=settings.GOOGLE_CREDENTIALS_CACHE_MAX_ENTRIES,
+    refresh_margin_seconds=settings.GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS,
+)
@@ -0,0 +1,105 @@
+import argparse
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+from app.config import settings
+
+# Perfilado del tiempo de importación (arranque en frío de cada worker).
+#
+# Ejecuta `python -X importtime -c "import <módulo>"` en un proceso limpio y
+# analiza la salida. Se usa como control de regresión:
+#
+#   python -m app.utils.import_profiler main --threshold-ms 1500
+#
+# falla (código 1) si la importación supera el umbral o si se cargan módulos que
+# deben importarse bajo demanda (Google, passlib).
+
+# Dependencias pesadas que solo deben cargarse en el primer uso
+LAZY_MODULES = ("googleapiclient", "google_auth_oauthlib", "google.oauth2", "passlib", "httplib2")
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@dataclass(frozen=True)
+class ImportTiming:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+@dataclass
+class ImportProfile:
+    module: str
+    timings: List[ImportTiming]
+
+    @property
+    def total_ms(self) -> float:
+        """Tiempo acumulado de importar el módulo pedido (incluye sus dependencias)."""
+        roots = [timing for timing in self.timings if timing.depth == 0]
+        return sum(timing.cumulative_us for timing in roots) / 1000
+
+    def loaded(self, prefix: str) -> bool:
+        return any(timing.module == prefix or timing.module.startswith(prefix + ".") for timing in self.timings)
+
+    def slowest(self, count: int) -> List[ImportTiming]:
+        return sorted(self.timings, key=lambda timing: timing.self_us, reverse=True)[:count]
+
+
+def parse_importtime(output: str) -> List[ImportTiming]:
+    """Convierte las líneas 'import time: self | cumulative | módulo' en ImportTiming."""
+    timings = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # La indentación del nombre indica la profundidad (2 espacios por nivel)
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        timings.append(ImportTiming(name.strip(), int(self_us), int(cumulative_us), depth))
+    return timings
+
+
+def profile_imports(module: str, python: Optional[str] = None) -> ImportProfile:
+    """Importa `module` en un intérprete nuevo con -X importtime y devuelve los tiempos."""
+    result = subprocess.run(
+        [python or sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {module}:\n{result.stderr[-2000:]}")
+    return ImportProfile(module=module, timings=parse_importtime(result.stderr))
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Perfil de tiempo de importación con umbral de regresión.")
+    parser.add_argument("module", nargs="?", default="main")
+    parser.add_argument("--threshold-ms", type=float, default=settings.IMPORT_TIME_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--runs", type=int, default=3, help="se toma la mejor de N ejecuciones")
+    args = parser.parse_args(argv)
+
+    profiles = [profile_imports(args.module) for _ in range(max(1, args.runs))]
+    profile = min(profiles, key=lambda item: item.total_ms)
+
+    print(f"{args.module}: {profile.total_ms:.1f} ms (umbral {args.threshold_ms:.0f} ms)")
+    for timing in profile.slowest(args.top):
+        print(f"  {timing.self_us / 1000:8.1f} ms  {timing.module}")
+
+    failed = False
+    eager = [name for name in LAZY_MODULES if profile.loaded(name)]
+    if eager:
+        print(f"Módulos que deberían cargarse bajo demanda: {', '.join(eager)}")
+        failed = True
+    if profile.total_ms > args.threshold_ms:
+        print("La importación supera el umbral.")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
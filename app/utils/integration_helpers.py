@@ -1,39 +1,42 @@
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Iterable, List, Optional
+from sqlalchemy.orm import Session
+
+from app.utils.availability import AvailabilityGrid, BusyBlock, compute_free_slots, load_booked_intervals
+from app.utils.availability_cache import availability_cache
 
 # Este módulo simula la interacción con APIs externas (Google Calendar, Zoom, etc.)
 # En un entorno real, aquí iría la lógica de autenticación OAuth2 de Google/Zoom
 # y las llamadas HTTP a sus endpoints.
 
-# --- 1. Simulación de Integración de Calendario (Disponibilidad) ---
+# --- 1. Integración de Calendario (Disponibilidad) ---
 
-def get_doctor_available_slots(doctor_id: int, date: datetime) -> List[datetime]:
+def get_doctor_available_slots(
+    doctor_id: int,
+    date: datetime,
+    db: Optional[Session] = None,
+    busy_blocks: Iterable[BusyBlock] = (),
+) -> List[datetime]:
     """
-    SIMULACIÓN: Consulta la API de Google Calendar del doctor para slots disponibles.
+    Slots libres de un doctor en un día (ver app/utils/availability.py).
     
-    En la realidad:
-    1. Se autenticaría usando las credenciales OAuth2 del doctor.
-    2. Se llamaría al endpoint de 'free/busy' de Google Calendar.
-    3. Se calcularían los slots disponibles (ej. cada 30 minutos).
+    Parte de la plantilla de horario laboral y resta las citas ya reservadas
+    (si se pasa la sesión `db`) y los bloques ocupados externos, por ejemplo
+    los del endpoint 'free/busy' de Google Calendar.
     """
-    
-    # Para la demostración, el doctor siempre está disponible de 9:00 a 12:00
-    if date.weekday() in [5, 6]: # Sábado o Domingo
-        return []
-
-    available_slots = []
-    start_hour = 9
-    end_hour = 12
-    slot_duration_minutes = 30
-
-    current_time = datetime(date.year, date.month, date.day, start_hour, 0, 0)
-    end_of_day = datetime(date.year, date.month, date.day, end_hour, 0, 0)
-
-    while current_time < end_of_day:
-        available_slots.append(current_time)
-        current_time += timedelta(minutes=slot_duration_minutes)
-        
-    return available_slots
+    day = date.date() if isinstance(date, datetime) else date
+    busy_blocks = list(busy_blocks)
+    if db is not None and not busy_blocks:
+        # Camino habitual: bitmap materializado en la caché de disponibilidad
+        free = availability_cache.get_day(db, doctor_id, day)
+        return AvailabilityGrid([doctor_id], day, free[None, None, :]).slots_for(doctor_id, day)
+
+    booked = []
+    if db is not None:
+        day_start = datetime.combine(day, datetime.min.time())
+        booked = load_booked_intervals(db, [doctor_id], day_start, day_start + timedelta(days=1))
+    grid = compute_free_slots([doctor_id], day, 1, [*booked, *busy_blocks])
+    return grid.slots_for(doctor_id, day)
 
 
 # --- 2. Simulación de Integración de Videollamadas ---
@@ -0,0 +1,45 @@
+from functools import lru_cache
+from typing import Callable, Dict, Tuple
+from sqlalchemy.orm import raiseload, selectinload
+from sqlalchemy.orm.interfaces import LoaderOption
+
+from app.models.user import User
+
+# Perfiles de carga para las relaciones de User.
+# El modelo declara todas sus relaciones como perezosas ('select'); cada endpoint
+# elige aquí qué relaciones necesita realmente y el resto queda bloqueado con
+# raiseload para detectar accesos accidentales (que generarían consultas N+1).
+# Los perfiles se construyen al primer uso para no forzar la configuración de
+# los mappers al importar el módulo.
+
+LOADING_PROFILES: Dict[str, Callable[[], Tuple[LoaderOption, ...]]] = {
+    # Autenticación y búsquedas de usuario (login, doctor de una cita): solo columnas
+    # del usuario, ninguna relación. Los listados de citas no cargan User: proyectan
+    # columnas con Core (ver app/routes/citas.py).
+    "auth": lambda: (
+        raiseload("*"),
+    ),
+    # Panel del paciente: sus citas y su historial clínico.
+    "patient-dashboard": lambda: (
+        selectinload(User.patient_appointments),
+        selectinload(User.patient_records),
+        raiseload("*"),
+    ),
+    # Agenda del doctor: solo las citas que tiene asignadas.
+    "doctor-agenda": lambda: (
+        selectinload(User.doctor_appointments),
+        raiseload("*"),
+    ),
+}
+
+
+@lru_cache(maxsize=None)
+def loading_options(profile: str) -> Tuple[LoaderOption, ...]:
+    """
+    Devuelve las opciones de carga del perfil indicado, listas para pasarlas
+    a `query.options(*...)` o `select(...).options(*...)`.
+    """
+    try:
+        return LOADING_PROFILES[profile]()
+    except KeyError:
+        raise ValueError(f"Perfil de carga desconocido: {profile}")
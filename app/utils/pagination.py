@@ -0,0 +1,25 @@
+import base64
+import json
+from datetime import datetime
+from typing import Tuple
+
+from fastapi import HTTPException, status
+
+# Cursores opacos para paginación keyset sobre (start_time, id).
+# El cliente recibe el cursor de la página siguiente y lo devuelve tal cual.
+
+
+def encode_cursor(start_time: datetime, row_id: int) -> str:
+    """Codifica la clave de la última fila devuelta en un cursor URL-safe."""
+    raw = json.dumps([start_time.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decodifica un cursor; responde 400 si está mal formado."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        start_time, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(start_time), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor de paginación inválido.")
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from app.config import settings
+from app.excepciones import ServiceSaturatedError
+
+# Pool dedicado para el hashing de contraseñas.
+# bcrypt es costoso a propósito; ejecutarlo en el threadpool compartido de
+# Starlette bloquea al resto de endpoints síncronos durante picos de login.
+# Se usa un pool de hilos propio (la extensión C de bcrypt libera el GIL) con
+# un límite de trabajos pendientes: si se supera, se rechaza con 429.
+
+
+class PasswordHashingPool:
+    """Ejecutor acotado para operaciones de bcrypt, con métricas de cola."""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.pending = 0      # en cola + en ejecución
+        self.active = 0       # en ejecución
+        self.completed = 0
+        self.rejected = 0
+
+    def _run(self, fn: Callable, args: tuple) -> Any:
+        with self._lock:
+            self.active += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.pending -= 1
+                self.completed += 1
+            self._slots.release()
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Encola `fn(*args)`; lanza ServiceSaturatedError si el pool está lleno."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ServiceSaturatedError("Servicio de autenticación saturado. Reintente en unos segundos.")
+        with self._lock:
+            self.pending += 1
+        return self._executor.submit(self._run, fn, args)
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Variante awaitable de submit para usar desde rutas async."""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def stats(self) -> Dict[str, int]:
+        """Métricas de profundidad de cola expuestas para monitoreo."""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "active": self.active,
+                "queued": self.pending - self.active,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+password_pool = PasswordHashingPool(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
@@ -0,0 +1,148 @@
+import threading
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.models.user import User, UserRole
+from app.utils.cache import LRUTTLCache, RedisCacheBackend, redis_client_from_url
+
+# Caché del usuario autenticado (principal).
+# get_current_user guarda aquí una instantánea inmutable del usuario para no
+# consultar la base de datos en cada petición protegida. Cualquier cambio sobre
+# un User (registro, conexión de Google, cambio de rol o de estado) la invalida
+# al confirmarse la transacción.
+
+
+@dataclass(frozen=True)
+class PrincipalSnapshot:
+    """Datos mínimos del usuario autenticado que necesitan las rutas."""
+    id: int
+    role: UserRole
+    is_active: bool
+    email: str
+    has_google_token: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> "PrincipalSnapshot":
+        return cls(
+            id=user.id,
+            role=user.role,
+            is_active=bool(user.is_active),
+            email=user.email,
+            has_google_token=bool(user.google_refresh_token),
+        )
+
+
+def _snapshot_to_dict(snapshot: PrincipalSnapshot) -> dict:
+    data = asdict(snapshot)
+    data["role"] = snapshot.role.value
+    return data
+
+
+def _snapshot_from_dict(data: dict) -> PrincipalSnapshot:
+    return PrincipalSnapshot(**{**data, "role": UserRole(data["role"])})
+
+
+class PrincipalCache:
+    """Caché de PrincipalSnapshot por id de usuario, con contadores de aciertos."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[PrincipalSnapshot]:
+        snapshot = self.backend.get(user_id)
+        with self._lock:
+            if snapshot is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return snapshot
+
+    def set(self, snapshot: PrincipalSnapshot) -> None:
+        self.backend.set(snapshot.id, snapshot)
+
+    # Variantes para las dependencias async: un backend en memoria responde sin
+    # esperas, uno de red (Redis) se consulta en el threadpool para no bloquear el
+    # event loop durante el round trip.
+    async def get_async(self, user_id: int) -> Optional[PrincipalSnapshot]:
+        if self.backend.blocking:
+            return await run_in_threadpool(self.get, user_id)
+        return self.get(user_id)
+
+    async def set_async(self, snapshot: PrincipalSnapshot) -> None:
+        if self.backend.blocking:
+            await run_in_threadpool(self.set, snapshot)
+        else:
+            self.set(snapshot)
+
+    def invalidate(self, user_id: int) -> None:
+        self.backend.delete(user_id)
+        with self._lock:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores expuestos para monitoreo."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "size": len(self.backend),
+        }
+
+
+def _build_backend():
+    if settings.PRINCIPAL_CACHE_REDIS_URL:
+        return RedisCacheBackend(
+            redis_client_from_url(settings.PRINCIPAL_CACHE_REDIS_URL),
+            prefix="principal",
+            ttl_seconds=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+            dumps=_snapshot_to_dict,
+            loads=_snapshot_from_dict,
+        )
+    return LRUTTLCache(
+        max_entries=settings.PRINCIPAL_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+    )
+
+
+principal_cache = PrincipalCache(_build_backend())
+
+
+# --- Invalidación automática ---
+# Los ids de los usuarios modificados se acumulan en la sesión durante el flush
+# y se invalidan solo cuando la transacción se confirma.
+
+_PENDING_KEY = "principal_cache_pending"
+
+
+def _mark_user_changed(mapper, connection, target: User) -> None:
+    session = object_session(target)
+    if session is not None and target.id is not None:
+        pending: Set[int] = session.info.setdefault(_PENDING_KEY, set())
+        pending.add(target.id)
+
+
+for _event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(User, _event_name, _mark_user_changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    for user_id in session.info.pop(_PENDING_KEY, ()):
+        principal_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
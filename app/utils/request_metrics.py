@@ -0,0 +1,223 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+from app.utils.metrics import (
+    DEFAULT_LATENCY_BUCKETS, Histogram, render_histogram, render_metric_header, render_sample
+)
+
+# Instrumentación por petición.
+#
+# PerformanceMiddleware abre un RequestStats en una ContextVar al recibir cada
+# petición. Los eventos de SQLAlchemy (before/after_cursor_execute) y
+# track_external() suman ahí las consultas y las llamadas externas; al terminar,
+# el middleware vuelca todo en histogramas por ruta que se exportan en formato
+# Prometheus (GET /metrics). El contexto se propaga al threadpool, así que las
+# consultas de las sesiones síncronas también se atribuyen a su petición.
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+RESPONSE_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_seconds: float = 0.0
+    external_calls: int = 0
+    external_seconds: float = 0.0
+
+
+_current_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+class RouteMetrics:
+    """Histogramas de una ruta (método + plantilla de path)."""
+
+    def __init__(self):
+        self.latency = Histogram(DEFAULT_LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.db_seconds = Histogram(DEFAULT_LATENCY_BUCKETS)
+        self.external_seconds = Histogram(DEFAULT_LATENCY_BUCKETS)
+        self.response_bytes = Histogram(RESPONSE_SIZE_BUCKETS)
+        self.status_counts: Dict[int, int] = {}
+        self.n_plus_one = 0
+
+
+class RequestMetricsRegistry:
+    def __init__(self, query_warning_threshold: int):
+        self.query_warning_threshold = query_warning_threshold
+        self._routes: Dict[Tuple[str, str], RouteMetrics] = {}
+        # Tiempo de llamadas externas por servicio, dentro o fuera de una petición
+        self._external: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _route(self, method: str, route: str) -> RouteMetrics:
+        key = (method, route)
+        metrics = self._routes.get(key)
+        if metrics is None:
+            with self._lock:
+                metrics = self._routes.setdefault(key, RouteMetrics())
+        return metrics
+
+    def observe_request(self, method: str, route: str, status_code: int, seconds: float,
+                        response_bytes: int, stats: RequestStats) -> None:
+        metrics = self._route(method, route)
+        metrics.latency.observe(seconds)
+        metrics.queries.observe(stats.queries)
+        metrics.db_seconds.observe(stats.db_seconds)
+        metrics.external_seconds.observe(stats.external_seconds)
+        metrics.response_bytes.observe(response_bytes)
+        with self._lock:
+            metrics.status_counts[status_code] = metrics.status_counts.get(status_code, 0) + 1
+        if self.query_warning_threshold and stats.queries > self.query_warning_threshold:
+            metrics.n_plus_one += 1
+            logger.warning(
+                f"⚠️ Posible N+1: {method} {route} ejecutó {stats.queries} consultas "
+                f"({stats.db_seconds * 1000:.1f} ms en DB)"
+            )
+
+    def observe_external(self, service: str, seconds: float) -> None:
+        histogram = self._external.get(service)
+        if histogram is None:
+            with self._lock:
+                histogram = self._external.setdefault(service, Histogram(DEFAULT_LATENCY_BUCKETS))
+        histogram.observe(seconds)
+
+    def render_prometheus(self) -> List[str]:
+        with self._lock:
+            routes = list(self._routes.items())
+            external = list(self._external.items())
+
+        lines: List[str] = []
+        histograms = (
+            ("http_request_duration_seconds", "Latencia de las peticiones por ruta.", "latency"),
+            ("http_request_db_queries", "Consultas SQL por petición.", "queries"),
+            ("http_request_db_seconds", "Tiempo en la base de datos por petición.", "db_seconds"),
+            ("http_request_external_seconds", "Tiempo en servicios externos (Google) por petición.", "external_seconds"),
+            ("http_response_size_bytes", "Tamaño del cuerpo de la respuesta.", "response_bytes"),
+        )
+        for name, help_text, attribute in histograms:
+            lines += render_metric_header(name, "histogram", help_text)
+            for (method, route), metrics in routes:
+                lines += render_histogram(name, {"method": method, "route": route}, getattr(metrics, attribute).snapshot())
+
+        lines += render_metric_header("http_requests_total", "counter", "Peticiones por ruta y código de estado.")
+        for (method, route), metrics in routes:
+            for status_code, count in sorted(metrics.status_counts.items()):
+                lines.append(render_sample("http_requests_total", {"method": method, "route": route, "status": status_code}, count))
+
+        lines += render_metric_header("http_request_n_plus_one_total", "counter", "Peticiones que superaron el umbral de consultas.")
+        for (method, route), metrics in routes:
+            lines.append(render_sample("http_request_n_plus_one_total", {"method": method, "route": route}, metrics.n_plus_one))
+
+        lines += render_metric_header("external_call_duration_seconds", "histogram", "Duración de las llamadas a servicios externos.")
+        for service, histogram in external:
+            lines += render_histogram("external_call_duration_seconds", {"service": service}, histogram.snapshot())
+        return lines
+
+
+request_metrics = RequestMetricsRegistry(query_warning_threshold=settings.REQUEST_QUERY_WARNING_THRESHOLD)
+
+
+# --- Llamadas externas ---
+
+@contextmanager
+def track_external(service: str):
+    """Mide una llamada a un servicio externo y la suma a la petición en curso."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        request_metrics.observe_external(service, elapsed)
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.external_calls += 1
+            stats.external_seconds += elapsed
+
+
+# --- Consultas SQL ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+
+def instrument_engine(target: Engine) -> None:
+    """Registra los eventos de conteo de consultas en un Engine (o el sync_engine de uno async)."""
+    if not event.contains(target, "before_cursor_execute", _before_cursor_execute):
+        event.listen(target, "before_cursor_execute", _before_cursor_execute)
+        event.listen(target, "after_cursor_execute", _after_cursor_execute)
+
+
+# --- Middleware ASGI ---
+
+def _route_template(scope) -> str:
+    """
+    Plantilla de la ruta (p. ej. /api/v1/appointments/citas/{id}), no el path concreto:
+    cardinalidad acotada. Las versiones recientes de FastAPI dejan en scope["route"] la
+    ruta del router sin el prefijo de include_router; el path completo está en el
+    contexto efectivo de la ruta.
+    """
+    effective = scope.get("fastapi", {}).get("effective_route_context")
+    if getattr(effective, "path", None):
+        return effective.path
+    route = scope.get("route")
+    return getattr(route, "path_format", None) or getattr(route, "path", None) or "<sin ruta>"
+
+
+class PerformanceMiddleware:
+    """
+    Middleware ASGI puro (no envuelve el cuerpo en memoria como BaseHTTPMiddleware):
+    mide latencia, consultas, tiempo externo y bytes enviados de cada petición HTTP.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        started = time.perf_counter()
+        response = {"status": 500, "bytes": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_stats.reset(token)
+            request_metrics.observe_request(
+                scope["method"],
+                _route_template(scope),
+                response["status"],
+                time.perf_counter() - started,
+                response["bytes"],
+                stats,
+            )
@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable
+
+# Primitivas de resiliencia para servicios externos (sin dependencias externas).
+# TokenBucket / KeyedRateLimiter limitan el ritmo de llamadas; CircuitBreaker corta
+# las llamadas mientras el servicio falla para responder rápido en lugar de agotar
+# workers esperando timeouts. Los métodos devuelven booleanos: cada llamador decide
+# qué excepción lanzar (ver app.excepciones).
+
+
+class TokenBucket:
+    """Cubo de tokens: `rate` tokens por segundo con ráfagas de hasta `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self, now: float) -> float:
+        self._refill(now)
+        return self._tokens
+
+    def take(self, tokens: float) -> None:
+        self._tokens -= tokens
+
+    def seconds_until(self, tokens: float) -> float:
+        """Segundos hasta tener `tokens` disponibles (0 si ya los hay)."""
+        missing = tokens - self._tokens
+        return 0.0 if missing <= 0 else missing / self.rate
+
+
+class KeyedRateLimiter:
+    """
+    Limitador con un cubo global y uno por clave (p. ej. por doctor).
+    Una llamada solo consume tokens si ambos cubos tienen suficientes.
+    """
+
+    def __init__(self, global_rate: float, global_burst: float, key_rate: float, key_burst: float,
+                 max_keys: int = 10000):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.key_rate = key_rate
+        self.key_burst = key_burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.throttled_global = 0
+        self.throttled_key = 0
+
+    def _bucket_for(self, key: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.key_rate, self.key_burst)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(key)
+        return bucket
+
+    def try_acquire(self, key: Hashable, tokens: float = 1) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._bucket_for(key)
+            if bucket.available(now) < tokens:
+                self.throttled_key += 1
+                return False
+            if self.global_bucket.available(now) < tokens:
+                self.throttled_global += 1
+                return False
+            bucket.take(tokens)
+            self.global_bucket.take(tokens)
+            self.allowed += 1
+            return True
+
+    def retry_after(self, key: Hashable, tokens: float = 1) -> float:
+        """Segundos estimados hasta que la clave pueda volver a llamar."""
+        with self._lock:
+            bucket = self._bucket_for(key)
+            return max(bucket.seconds_until(tokens), self.global_bucket.seconds_until(tokens))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "allowed": self.allowed,
+            "throttled_global": self.throttled_global,
+            "throttled_key": self.throttled_key,
+            "keys": len(self._buckets),
+        }
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker clásico:
+      - closed: las llamadas pasan; `failure_threshold` fallos seguidos lo abren.
+      - open: las llamadas se rechazan hasta que pasa `recovery_seconds`.
+      - half_open: se dejan pasar hasta `half_open_max_calls` llamadas de prueba; un
+        éxito lo cierra y un fallo lo vuelve a abrir.
+    Uso: `if not breaker.allow(): ...` y después record_success() / record_failure().
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, recovery_seconds: float, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._update_state(time.monotonic())
+            return self._state
+
+    def _update_state(self, now: float) -> None:
+        if self._state == self.OPEN and now - self._opened_at >= self.recovery_seconds:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+
+    def _open(self, now: float) -> None:
+        self._state = self.OPEN
+        self._opened_at = now
+        self.times_opened += 1
+
+    def allow(self) -> bool:
+        """True si la llamada puede hacerse; en half_open reserva una llamada de prueba."""
+        with self._lock:
+            self._update_state(time.monotonic())
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_after(self) -> float:
+        """Segundos hasta que el breaker admita llamadas de prueba."""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self.recovery_seconds - (time.monotonic() - self._opened_at))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            if self._state == self.HALF_OPEN:
+                self._state = self.CLOSED
+
+    def record_failure(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if self._state == self.HALF_OPEN:
+                self._open(now)
+                return
+            self._failures += 1
+            if self._state == self.CLOSED and self._failures >= self.failure_threshold:
+                self._open(now)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,489 @@
+import heapq
+import itertools
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.models.appointment import (
+    ACTIVE_STATUS_FILTER, OVERLAP_CONSTRAINT_NAME, OVERLAP_TRIGGER_MESSAGE,
+    Appointment, PriorityLevel
+)
+from app.models.user import User, UserRole
+from app.utils.appointment_changes import AppointmentChange, register_listener
+
+# Motor de asignación de citas por prioridad.
+#
+# - Un índice de intervalos por doctor (listas ordenadas + bisect) responde en
+#   O(log n) si un horario está libre.
+# - Un heap de candidatos por horario pedido elige el doctor menos cargado libre
+#   en ese horario en O(log n) amortizado: las entradas obsoletas (doctor ya
+#   ocupado en el horario, carga desactualizada) se corrigen al llegar a la cima.
+# - Los fines de todas las citas, en una lista ordenada, dan el hueco más cercano
+#   cuando nadie está libre a la hora pedida sin recorrer a todos los doctores.
+# - Una cola de prioridad ordena las solicitudes por PriorityLevel y, dentro del
+#   mismo nivel, por orden de llegada (FIFO).
+#
+# El motor vive en memoria del proceso y actúa como caché de la agenda: la base
+# de datos sigue siendo la fuente de verdad y cada reserva se verifica en la
+# transacción que la persiste (ver citas.assign_priority_and_schedule).
+# Las reservas hechas y aún no confirmadas (pendientes) se recuerdan aparte para
+# que recargar la agenda de un doctor desde la DB no las borre del índice.
+
+# Orden de atención: menor rango = se atiende antes
+PRIORITY_RANK = {
+    PriorityLevel.URGENT: 0,
+    PriorityLevel.HIGH: 1,
+    PriorityLevel.MEDIUM: 2,
+    PriorityLevel.LOW: 3,
+}
+
+class DoctorIntervalIndex:
+    """
+    Intervalos ocupados de un doctor, ordenados por inicio y sin solapamientos.
+    """
+
+    def __init__(self, intervals: Iterable[Tuple[datetime, datetime]] = ()):
+        self._starts: List[datetime] = []
+        self._ends: List[datetime] = []
+        # Se fusionan los solapamientos que pudieran existir en datos históricos
+        for start, end in sorted(intervals):
+            if self._ends and start < self._ends[-1]:
+                self._ends[-1] = max(self._ends[-1], end)
+            else:
+                self._starts.append(start)
+                self._ends.append(end)
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def ends(self) -> List[datetime]:
+        return list(self._ends)
+
+    def is_free(self, start: datetime, end: datetime) -> bool:
+        """True si [start, end) no se solapa con ningún intervalo ocupado."""
+        i = bisect_right(self._starts, start)
+        if i > 0 and self._ends[i - 1] > start:
+            return False
+        return i >= len(self._starts) or self._starts[i] >= end
+
+    def add(self, start: datetime, end: datetime) -> None:
+        i = bisect_left(self._starts, start)
+        self._starts.insert(i, start)
+        self._ends.insert(i, end)
+
+    def contains(self, start: datetime, end: datetime) -> bool:
+        i = bisect_left(self._starts, start)
+        while i < len(self._starts) and self._starts[i] == start:
+            if self._ends[i] == end:
+                return True
+            i += 1
+        return False
+
+    def remove(self, start: datetime, end: datetime) -> bool:
+        i = bisect_left(self._starts, start)
+        while i < len(self._starts) and self._starts[i] == start:
+            if self._ends[i] == end:
+                del self._starts[i]
+                del self._ends[i]
+                return True
+            i += 1
+        return False
+
+
+@dataclass
+class SchedulingRequest:
+    """Solicitud de cita pendiente de asignar."""
+    start_time: datetime
+    end_time: datetime
+    priority_level: PriorityLevel = PriorityLevel.MEDIUM
+    doctor_id: Optional[int] = None
+    requested_at: datetime = field(default_factory=datetime.utcnow)
+    # Referencia libre del llamador (índice en un lote, id de cita...)
+    key: Any = None
+
+    @property
+    def duration(self) -> timedelta:
+        return self.end_time - self.start_time
+
+
+@dataclass(frozen=True)
+class Assignment:
+    """Resultado de una reserva: doctor y horario asignados."""
+    doctor_id: int
+    start_time: datetime
+    end_time: datetime
+
+
+class AppointmentRequestQueue:
+    """Cola de prioridad por (PriorityLevel, tiempo de espera), FIFO dentro del nivel."""
+
+    def __init__(self, requests: Iterable[SchedulingRequest] = ()):
+        self._heap: List[Tuple[int, datetime, int, SchedulingRequest]] = []
+        self._counter = itertools.count()
+        for request in requests:
+            self.push(request)
+
+    def push(self, request: SchedulingRequest) -> None:
+        heapq.heappush(self._heap, (
+            PRIORITY_RANK.get(request.priority_level, len(PRIORITY_RANK)),
+            request.requested_at,
+            next(self._counter),
+            request,
+        ))
+
+    def pop(self) -> SchedulingRequest:
+        return heapq.heappop(self._heap)[-1]
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+class SchedulingEngine:
+    """
+    Índices de agenda por doctor y heap de carga, compartidos por el proceso.
+    Todas las operaciones están protegidas por un lock.
+    """
+
+    def __init__(self, max_candidate_heaps: int = 512):
+        self._indexes: Dict[int, DoctorIntervalIndex] = {}
+        self._loads: Dict[int, int] = {}
+        # Heap (carga, doctor) por horario pedido, con los más recientes al final (LRU).
+        # Cada heap guarda una entrada por doctor: memoria ~ max_candidate_heaps x doctores
+        self._candidates: "OrderedDict[Tuple[datetime, datetime], List[Tuple[int, int]]]" = OrderedDict()
+        self._max_candidate_heaps = max_candidate_heaps
+        # (fin, doctor) de cada intervalo ocupado, ordenados por fin
+        self._ends: List[Tuple[datetime, int]] = []
+        # Reservas en curso (hechas por reserve, sin commit ni release todavía) por doctor
+        self._pending: Dict[int, Counter] = {}
+        self._lock = threading.RLock()
+        self._loaded = False
+
+    # --- Carga desde la base de datos ---
+
+    def load(self, db: Session, now: Optional[datetime] = None) -> None:
+        """Reconstruye los índices con los doctores activos y sus citas futuras."""
+        now = now or datetime.utcnow()
+        doctor_ids = db.scalars(
+            select(User.id).where(User.role == UserRole.DOCTOR, User.is_active.is_not(False))
+        ).all()
+        rows = db.execute(
+            select(Appointment.doctor_id, Appointment.start_time, Appointment.end_time).where(
+                Appointment.doctor_id.is_not(None),
+                ACTIVE_STATUS_FILTER,
+                Appointment.end_time >= now,
+            )
+        ).all()
+
+        booked: Dict[int, List[Tuple[datetime, datetime]]] = {doctor_id: [] for doctor_id in doctor_ids}
+        for doctor_id, start, end in rows:
+            if doctor_id in booked and start is not None and end is not None:
+                booked[doctor_id].append((start, end))
+
+        with self._lock:
+            booked = {doctor_id: self._with_pending(doctor_id, intervals) for doctor_id, intervals in booked.items()}
+            self._indexes = {doctor_id: DoctorIntervalIndex(intervals) for doctor_id, intervals in booked.items()}
+            self._loads = {doctor_id: len(intervals) for doctor_id, intervals in booked.items()}
+            self._ends = sorted(
+                (end, doctor_id) for doctor_id, index in self._indexes.items() for end in index.ends()
+            )
+            self._candidates.clear()
+            self._loaded = True
+
+    def ensure_loaded(self, db: Session) -> None:
+        with self._lock:
+            if not self._loaded:
+                self.load(db)
+
+    def reload_doctor(self, db: Session, doctor_id: int, now: Optional[datetime] = None) -> None:
+        """
+        Vuelve a leer la agenda de un doctor (tras detectar un conflicto en la DB).
+        El índice queda con lo confirmado en la DB más las reservas pendientes de
+        este proceso (resto del lote en curso, peticiones concurrentes), que no
+        deben volver a ofrecerse mientras su transacción no termine.
+        """
+        now = now or datetime.utcnow()
+        intervals = [
+            (start, end) for start, end in db.execute(
+                select(Appointment.start_time, Appointment.end_time).where(
+                    Appointment.doctor_id == doctor_id,
+                    ACTIVE_STATUS_FILTER,
+                    Appointment.end_time >= now,
+                )
+            ).all()
+        ]
+        with self._lock:
+            intervals = self._with_pending(doctor_id, intervals)
+            previous = self._indexes.get(doctor_id)
+            for end in previous.ends() if previous is not None else ():
+                self._remove_end(end, doctor_id)
+            index = self._indexes[doctor_id] = DoctorIntervalIndex(intervals)
+            for end in index.ends():
+                insort(self._ends, (end, doctor_id))
+            self._loads[doctor_id] = len(intervals)
+            # Puede haber quedado libre en horarios de los que se descartó
+            self._push_candidate(doctor_id)
+
+    # --- Reservas pendientes ---
+
+    def _with_pending(self, doctor_id: int, committed: List[Tuple[datetime, datetime]]) -> List[Tuple[datetime, datetime]]:
+        """Intervalos confirmados más las reservas pendientes del doctor que aún no están en la DB."""
+        pending = self._pending.get(doctor_id)
+        if not pending:
+            return committed
+        # Una reserva pendiente que ya aparece en la DB es la misma cita: no se duplica
+        return committed + list((pending - Counter(committed)).elements())
+
+    def _add_pending(self, assignment: Assignment) -> None:
+        self._pending.setdefault(assignment.doctor_id, Counter())[(assignment.start_time, assignment.end_time)] += 1
+
+    def _discard_pending(self, doctor_id: int, start: datetime, end: datetime) -> None:
+        pending = self._pending.get(doctor_id)
+        if pending and pending[(start, end)] > 0:
+            pending[(start, end)] -= 1
+            if pending[(start, end)] == 0:
+                del pending[(start, end)]
+            if not pending:
+                del self._pending[doctor_id]
+
+    def pending_count(self) -> int:
+        """Reservas hechas por el motor que aún no se confirmaron ni liberaron."""
+        with self._lock:
+            return sum(sum(pending.values()) for pending in self._pending.values())
+
+    # --- Índices de agenda ---
+
+    def _book(self, doctor_id: int, start: datetime, end: datetime) -> None:
+        self._indexes[doctor_id].add(start, end)
+        insort(self._ends, (end, doctor_id))
+        # Subir la carga no toca los heaps de candidatos: se corrige al llegar a la cima
+        self._loads[doctor_id] += 1
+
+    def _unbook(self, doctor_id: int, start: datetime, end: datetime) -> None:
+        index = self._indexes.get(doctor_id)
+        if index is None or not index.remove(start, end):
+            return
+        self._remove_end(end, doctor_id)
+        self._loads[doctor_id] = max(0, self._loads[doctor_id] - 1)
+        self._push_candidate(doctor_id)
+
+    def _remove_end(self, end: datetime, doctor_id: int) -> None:
+        i = bisect_left(self._ends, (end, doctor_id))
+        if i < len(self._ends) and self._ends[i] == (end, doctor_id):
+            del self._ends[i]
+
+    # --- Heaps de candidatos (con corrección perezosa de entradas obsoletas) ---
+    #
+    # Invariante: en el heap de cada horario, todo doctor libre en ese horario
+    # tiene una entrada con carga <= su carga actual. Subir la carga no exige
+    # nada; bajarla, liberar un intervalo o recargar la agenda empuja una entrada
+    # nueva en todos los heaps (_push_candidate).
+
+    def _push_candidate(self, doctor_id: int) -> None:
+        entry = (self._loads[doctor_id], doctor_id)
+        for heap in self._candidates.values():
+            heapq.heappush(heap, entry)
+
+    def _candidate_heap(self, start: datetime, end: datetime) -> List[Tuple[int, int]]:
+        heap = self._candidates.get((start, end))
+        if heap is not None:
+            self._candidates.move_to_end((start, end))
+            return heap
+        heap = [(load, doctor_id) for doctor_id, load in self._loads.items()]
+        heapq.heapify(heap)
+        self._candidates[(start, end)] = heap
+        if len(self._candidates) > self._max_candidate_heaps:
+            self._candidates.popitem(last=False)
+        return heap
+
+    def _least_loaded_free(self, start: datetime, end: datetime, exclude: Set[int]) -> Optional[int]:
+        """
+        Doctor de menor carga libre en [start, end), sin recorrer a los doctores
+        ocupados. Cada entrada obsoleta se saca o se corrige una sola vez y cada
+        reserva deja como mucho una por heap vivo, así que el coste amortizado es
+        O(log n). Los doctores excluidos se apartan y se devuelven al terminar.
+        """
+        heap = self._candidate_heap(start, end)
+        skipped = []
+        found = None
+        while heap:
+            load, doctor_id = heap[0]
+            current = self._loads[doctor_id]
+            if load < current:
+                # La carga subió desde que se apiló: se corrige en su sitio
+                heapq.heapreplace(heap, (current, doctor_id))
+            elif load > current or not self._indexes[doctor_id].is_free(start, end):
+                # Entrada sustituida por otra de menor carga, o doctor ocupado en este horario
+                heapq.heappop(heap)
+            elif doctor_id in exclude:
+                skipped.append(heapq.heappop(heap))
+            else:
+                found = doctor_id
+                break
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        return found
+
+    def _earliest_free(self, start: datetime, duration: timedelta, exclude: Set[int]) -> Optional[Assignment]:
+        """
+        Hueco más cercano entre todos los doctores cuando nadie está libre en el
+        horario pedido. Un doctor ocupado a esa hora solo puede empezar justo al
+        terminar una de sus citas: se recorren los fines posteriores en orden hasta
+        el primero con hueco, y a esa hora se elige el de menor carga con el heap de
+        candidatos. El coste depende de las citas recorridas, no del número de doctores.
+        """
+        for i in range(bisect_left(self._ends, (start,)), len(self._ends)):
+            end, doctor_id = self._ends[i]
+            if doctor_id not in exclude and self._indexes[doctor_id].is_free(end, end + duration):
+                doctor_id = self._least_loaded_free(end, end + duration, exclude)
+                return Assignment(doctor_id, end, end + duration)
+        return None
+
+    def add_doctor(self, doctor_id: int) -> None:
+        """Registra un doctor nuevo con la agenda vacía."""
+        with self._lock:
+            if self._loaded and doctor_id not in self._indexes:
+                self._indexes[doctor_id] = DoctorIntervalIndex()
+                self._loads[doctor_id] = 0
+                self._push_candidate(doctor_id)
+
+    def knows_doctor(self, doctor_id: int) -> bool:
+        return doctor_id in self._indexes
+
+    # --- Reservas ---
+
+    def _choose(self, request: SchedulingRequest, exclude: Set[int]) -> Optional[Assignment]:
+        if request.doctor_id is not None:
+            # El paciente pidió un doctor concreto: ese horario con ese doctor o nada
+            index = self._indexes.get(request.doctor_id)
+            if index is None or request.doctor_id in exclude or not index.is_free(request.start_time, request.end_time):
+                return None
+            return Assignment(request.doctor_id, request.start_time, request.end_time)
+
+        # 1. Doctor menos cargado que esté libre en el horario solicitado
+        doctor_id = self._least_loaded_free(request.start_time, request.end_time, exclude)
+        if doctor_id is not None:
+            return Assignment(doctor_id, request.start_time, request.end_time)
+
+        # 2. Nadie libre a esa hora: el hueco más cercano entre todos los doctores
+        return self._earliest_free(request.start_time, request.duration, exclude)
+
+    def reserve(self, request: SchedulingRequest, exclude: Iterable[int] = ()) -> Optional[Assignment]:
+        """
+        Elige doctor y horario y los marca como ocupados en el índice. Devuelve None
+        si no hay ningún doctor posible o si el doctor pedido está ocupado a esa hora.
+        """
+        with self._lock:
+            assignment = self._choose(request, set(exclude))
+            if assignment is not None:
+                self._book(assignment.doctor_id, assignment.start_time, assignment.end_time)
+                self._add_pending(assignment)
+            return assignment
+
+    def release(self, assignment: Assignment) -> None:
+        """Deshace una reserva (por ejemplo, si la transacción no llegó a confirmarse)."""
+        with self._lock:
+            self._discard_pending(assignment.doctor_id, assignment.start_time, assignment.end_time)
+            self._unbook(assignment.doctor_id, assignment.start_time, assignment.end_time)
+
+    def apply_changes(self, changes: List[AppointmentChange]) -> None:
+        """
+        Listener de cambios confirmados: libera las citas canceladas o reprogramadas
+        y registra las creadas fuera del motor. Las reservas hechas por el propio
+        motor ya están en el índice y no se duplican.
+        """
+        with self._lock:
+            for change in changes:
+                before, after = change.before, change.after
+                if before is not None and before.occupies_agenda and not (
+                    after is not None and after.occupies_agenda
+                    and (before.doctor_id, before.start_time, before.end_time) == (after.doctor_id, after.start_time, after.end_time)
+                ):
+                    self.release(Assignment(before.doctor_id, before.start_time, before.end_time))
+                if after is not None and after.occupies_agenda:
+                    # La reserva pendiente que originó la cita ya está confirmada
+                    self._discard_pending(after.doctor_id, after.start_time, after.end_time)
+                    index = self._indexes.get(after.doctor_id)
+                    if index is not None and not index.contains(after.start_time, after.end_time):
+                        self._book(after.doctor_id, after.start_time, after.end_time)
+
+    def schedule_batch(self, requests: Iterable[SchedulingRequest]) -> List[Tuple[SchedulingRequest, Optional[Assignment]]]:
+        """Asigna un lote completo en orden de prioridad, en una sola pasada."""
+        queue = AppointmentRequestQueue(requests)
+        results = []
+        with self._lock:
+            while queue:
+                request = queue.pop()
+                results.append((request, self.reserve(request)))
+        return results
+
+
+# Instancia compartida por el proceso
+scheduling_engine = SchedulingEngine()
+register_listener(scheduling_engine.apply_changes)
+
+
+# --- Verificación transaccional ---
+
+def slot_is_free_in_db(db: Session, assignment: Assignment, exclude_appointment_id: Optional[int] = None) -> bool:
+    """
+    Comprueba en la transacción actual que el horario sigue libre, sin bloquear
+    al doctor. Evita casi todos los conflictos; los que ocurren entre esta lectura
+    y el commit los detecta la restricción de solapamiento de la base de datos
+    (ver is_booking_conflict) y el llamador reintenta.
+    """
+    query = select(Appointment.id).where(
+        Appointment.doctor_id == assignment.doctor_id,
+        ACTIVE_STATUS_FILTER,
+        Appointment.start_time < assignment.end_time,
+        Appointment.end_time > assignment.start_time,
+    )
+    if exclude_appointment_id is not None:
+        query = query.where(Appointment.id != exclude_appointment_id)
+    return db.execute(query.limit(1)).first() is None
+
+
+def is_booking_conflict(error: Exception) -> bool:
+    """
+    True si el error es un conflicto de concurrencia sobre la agenda que se resuelve
+    reintentando: la restricción de exclusión (PostgreSQL) o el trigger equivalente
+    (SQLite), una actualización optimista que encontró otra versión de la cita
+    (StaleDataError) o SQLite rechazando la escritura por otra transacción en curso.
+    """
+    if isinstance(error, StaleDataError):
+        return True
+    message = str(getattr(error, "orig", error))
+    if isinstance(error, IntegrityError):
+        return OVERLAP_CONSTRAINT_NAME in message or OVERLAP_TRIGGER_MESSAGE in message
+    return isinstance(error, OperationalError) and "database is locked" in message
+
+
+# --- Alta de doctores ---
+# Los doctores registrados después de cargar el motor se añaden al confirmar.
+
+_NEW_DOCTORS_KEY = "scheduling_new_doctors"
+
+
+@event.listens_for(User, "after_insert")
+def _mark_new_doctor(mapper, connection, target: User) -> None:
+    session = object_session(target)
+    if session is not None and target.role == UserRole.DOCTOR:
+        session.info.setdefault(_NEW_DOCTORS_KEY, set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _add_new_doctors(session: Session) -> None:
+    for doctor_id in session.info.pop(_NEW_DOCTORS_KEY, ()):
+        scheduling_engine.add_doctor(doctor_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_new_doctors(session: Session) -> None:
+    session.info.pop(_NEW_DOCTORS_KEY, None)
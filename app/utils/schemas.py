@@ -1,6 +1,6 @@
 from typing import Optional, List
-from datetime import datetime
-from pydantic import BaseModel, EmailStr
+from datetime import datetime, time
+from pydantic import BaseModel, EmailStr, Field
 
 # Importaciones de modelos ORM para los Enums
 # Asumo que estos enums existen en los modelos
@@ -76,6 +76,47 @@ class AppointmentCreate(BaseModel):
     class Config:
         use_enum_values = True
 
+class AppointmentBatchItem(AppointmentCreate):
+    """
+    Elemento de una carga masiva de citas (listas de espera de una clínica).
+    patient_id es obligatorio para administradores; para un paciente se ignora
+    y se usa el del token.
+    """
+    patient_id: Optional[int] = None
+
+class AppointmentBatchItemResult(BaseModel):
+    """Resultado de un elemento de la carga masiva, en el orden recibido."""
+    index: int
+    ok: bool
+    appointment_id: Optional[int] = None
+    doctor_id: Optional[int] = None
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    status: Optional[AppointmentStatus] = None
+    error: Optional[str] = None
+
+    class Config:
+        use_enum_values = True
+
+class AppointmentBatchResponse(BaseModel):
+    """Resumen de la carga masiva de citas."""
+    total: int
+    created: int
+    failed: int
+    results: List[AppointmentBatchItemResult]
+
+class EarliestSlotResponse(BaseModel):
+    """Primer hueco libre encontrado entre todos los doctores."""
+    doctor_id: int
+    start_time: datetime
+    end_time: datetime
+
+class WorkingHoursRange(BaseModel):
+    """Franja del horario laboral semanal de un doctor (weekday: 0 = lunes; fin 00:00 = medianoche)."""
+    weekday: int = Field(ge=0, le=6)
+    start_time: time
+    end_time: time
+
 class AppointmentUpdate(BaseModel):
     """Esquema para modificar campos de una cita existente."""
     doctor_id: Optional[int] = None
@@ -91,6 +132,40 @@ class AppointmentUpdate(BaseModel):
         use_enum_values = True
         extra = "ignore" 
 
+class AppointmentBulkTransition(BaseModel):
+    """
+    Transición masiva de estado: todas las citas que cumplen los criterios (AND)
+    y admiten la transición pasan a target_status.
+    Ej.: cancelar el día de un doctor o marcar ausencias pasadas.
+    """
+    target_status: AppointmentStatus
+    appointment_ids: Optional[List[int]] = None
+    doctor_id: Optional[int] = None
+    patient_id: Optional[int] = None
+    from_statuses: Optional[List[AppointmentStatus]] = None
+    start_from: Optional[datetime] = None
+    start_to: Optional[datetime] = None
+    end_before: Optional[datetime] = None
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "target_status": "Cancelada",
+                "doctor_id": 7,
+                "start_from": "2030-01-07T00:00:00",
+                "start_to": "2030-01-08T00:00:00",
+            }
+        }
+
+class AppointmentBulkTransitionResponse(BaseModel):
+    """Resultado de la transición masiva."""
+    target_status: AppointmentStatus
+    updated: int
+    appointment_ids: List[int]
+
+    class Config:
+        use_enum_values = True
+
 class AppointmentResponse(BaseModel):
     """Esquema de salida para devolver los detalles de la cita."""
     id: int
@@ -1,28 +1,74 @@
+import hashlib
+import secrets
+import threading
+import time
 from datetime import datetime, timedelta
-from typing import Optional, Annotated # Añadida Annotated para Type Hinting
-from passlib.context import CryptContext
+from functools import lru_cache
+from typing import Dict, Optional, Tuple, Annotated # Añadida Annotated para Type Hinting
 from jose import JWTError, jwt
 from app.config import settings
 
 # Importaciones adicionales para la dependencia de usuario
 from fastapi import Depends, HTTPException, status, Header
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from app.database import get_async_db
 # Asumo que esta ruta es correcta para tu modelo User
 from app.models.user import User
+from app.utils.loading_profiles import loading_options
+from app.utils.principal_cache import PrincipalSnapshot, principal_cache
+from app.utils.cache import LRUTTLCache, RedisCacheBackend, redis_client_from_url
+from app.utils.password_pool import password_pool
 
 # Configuración del contexto de hashing (usando bcrypt)
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# min_rounds/max_rounds iguales al coste configurado: cualquier hash con otro coste
+# se considera obsoleto y se rehashea en el siguiente login.
+# passlib y su backend de bcrypt se cargan en el primer uso, no al importar el módulo.
+@lru_cache(maxsize=1)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+        bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+        bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+    )
+
+
+def __getattr__(name: str):
+    # Compatibilidad: `security.pwd_context` sigue disponible, creado bajo demanda
+    if name == "pwd_context":
+        return get_pwd_context()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- Funciones de Hashing de Contraseñas ---
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifica si la contraseña plana coincide con el hash almacenado."""
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """Genera el hash de una contraseña plana."""
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifica la contraseña y, si el hash está obsoleto (esquema o coste distinto),
+    devuelve también el nuevo hash que debe guardarse.
+    """
+    return get_pwd_context().verify_and_update(plain_password, hashed_password)
+
+# Variantes async: se ejecutan en el pool dedicado de hashing (ver password_pool)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Como verify_and_update_password, fuera del threadpool compartido."""
+    return await password_pool.run(verify_and_update_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Como get_password_hash, fuera del threadpool compartido."""
+    return await password_pool.run(get_password_hash, password)
 
 # --- Funciones de JWT ---
 
@@ -35,7 +81,9 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         # Usa el tiempo de expiración de la configuración si no se especifica
         expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire})
+    # jti: dos tokens del mismo usuario emitidos en el mismo segundo no son idénticos,
+    # así que revocar uno (logout) no revoca el otro
+    to_encode.update({"exp": expire, "jti": secrets.token_hex(8)})
     
     # Codifica el token usando la clave secreta y el algoritmo
     encoded_jwt = jwt.encode(
@@ -45,8 +93,72 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     )
     return encoded_jwt
 
+# --- Caché de tokens verificados ---
+# Un mismo token se reutiliza en muchas peticiones durante su vigencia. Se guarda
+# el payload ya verificado bajo el digest SHA-256 del token, y cada entrada expira
+# exactamente en su claim 'exp', así que la verificación criptográfica solo se
+# hace una vez por token.
+#
+# Los tokens revocados (logout) se guardan hasta su expiración. Por defecto en la
+# memoria del proceso; con TOKEN_REVOCATION_REDIS_URL se comparten entre workers,
+# de modo que un logout atendido por uno se respeta en todos.
+
+_verified_tokens = LRUTTLCache(max_entries=settings.TOKEN_CACHE_MAX_ENTRIES)
+
+
+class _LocalRevocations:
+    """Revocaciones en memoria del proceso. Sin límite de tamaño: nunca se olvida una revocación vigente."""
+    blocking = False
+
+    def __init__(self):
+        self._expires_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def get(self, digest: str) -> Optional[bool]:
+        expires_at = self._expires_at.get(digest)
+        return True if expires_at is not None and time.time() <= expires_at else None
+
+    def set(self, digest: str, value: bool, expires_at: float) -> None:
+        now = time.time()
+        with self._lock:
+            # Limpia las revocaciones de tokens que ya expiraron por sí solos
+            for expired in [key for key, exp in self._expires_at.items() if exp < now]:
+                del self._expires_at[expired]
+            self._expires_at[digest] = expires_at
+
+    def clear(self) -> None:
+        with self._lock:
+            self._expires_at.clear()
+
+
+def _build_revocation_backend():
+    if settings.TOKEN_REVOCATION_REDIS_URL:
+        return RedisCacheBackend(
+            redis_client_from_url(settings.TOKEN_REVOCATION_REDIS_URL),
+            prefix="revoked_token",
+            ttl_seconds=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        )
+    return _LocalRevocations()
+
+
+_revoked_tokens = _build_revocation_backend()
+
+def _token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def _is_revoked(digest: str) -> bool:
+    return _revoked_tokens.get(digest) is not None
+
 def decode_access_token(token: str) -> Optional[dict]:
-    """Decodifica y valida un token de acceso JWT."""
+    """Decodifica y valida un token de acceso JWT (con caché de tokens verificados)."""
+    digest = _token_digest(token)
+    if _is_revoked(digest):
+        return None
+
+    cached = _verified_tokens.get(digest)
+    if cached is not None:
+        return dict(cached)
+
     try:
         # Decodifica el token
         payload = jwt.decode(
@@ -54,20 +166,51 @@ def decode_access_token(token: str) -> Optional[dict]:
             settings.SECRET_KEY, 
             algorithms=[settings.ALGORITHM]
         )
-        return payload
     except JWTError:
         # Devuelve None si el token es inválido o ha expirado
         return None
 
+    if payload.get("exp") is not None:
+        _verified_tokens.set(digest, payload, expires_at=payload["exp"])
+    return dict(payload)
+
+async def decode_access_token_async(token: str) -> Optional[dict]:
+    """Como decode_access_token; con revocaciones en Redis se ejecuta en el threadpool."""
+    if _revoked_tokens.blocking:
+        return await run_in_threadpool(decode_access_token, token)
+    return decode_access_token(token)
+
+def revoke_access_token(token: str) -> None:
+    """Revoca un token: deja de aceptarse aunque su firma y 'exp' sean válidos."""
+    digest = _token_digest(token)
+    try:
+        expires_at = jwt.get_unverified_claims(token).get("exp")
+    except JWTError:
+        expires_at = None
+    if expires_at is None:
+        expires_at = time.time() + settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+    _revoked_tokens.set(digest, True, expires_at=expires_at)
+    _verified_tokens.delete(digest)
+
+async def revoke_access_token_async(token: str) -> None:
+    """Como revoke_access_token; con revocaciones en Redis se ejecuta en el threadpool."""
+    if _revoked_tokens.blocking:
+        await run_in_threadpool(revoke_access_token, token)
+    else:
+        revoke_access_token(token)
+
 # --- DEPENDENCIA DE AUTENTICACIÓN (Añadida para uso en todas las rutas) ---
 
-def get_current_user(db: Session = Depends(get_db), token: str = Header(..., alias="Authorization")):
+async def get_current_user(db: AsyncSession = Depends(get_async_db), token: str = Header(..., alias="Authorization")) -> PrincipalSnapshot:
     """
-    Decodifica el token JWT y obtiene el objeto User autenticado desde la base de datos.
+    Decodifica el token JWT y obtiene el usuario autenticado.
+    Devuelve una instantánea inmutable (PrincipalSnapshot) servida desde la caché
+    de principales; solo consulta la base de datos si el usuario no está en caché.
     Esta función se usa como dependencia en las rutas protegidas.
     """
     token = token.replace("Bearer ", "")
-    payload = decode_access_token(token) # Usa la función local decode_access_token
+    payload = await decode_access_token_async(token)
     
     if payload is None:
         raise HTTPException(
@@ -77,15 +220,23 @@ def get_current_user(db: Session = Depends(get_db), token: str = Header(..., ali
         )
         
     user_id = payload.get("user_id")
+
+    principal = await principal_cache.get_async(user_id)
+    if principal is not None:
+        return principal
     
-    # Buscamos al usuario en la DB
-    db_user = db.query(User).filter(User.id == user_id).first()
+    # Buscamos al usuario en la DB (perfil "auth": sin cargar relaciones)
+    result = await db.execute(
+        select(User).options(*loading_options("auth")).where(User.id == user_id)
+    )
+    db_user = result.scalar_one_or_none()
     
     if db_user is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado")
         
-    # Devolvemos el objeto User del ORM
-    return db_user
+    principal = PrincipalSnapshot.from_user(db_user)
+    await principal_cache.set_async(principal)
+    return principal
 
 # Definición del tipo de dependencia para usar en las rutas (ej: CurrentUserDep)
-CurrentUserDep = Annotated[User, Depends(get_current_user)]
+CurrentUserDep = Annotated[PrincipalSnapshot, Depends(get_current_user)]
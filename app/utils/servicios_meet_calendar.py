@@ -1,24 +1,203 @@
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from app.utils.google_tokens import get_credentials_from_refresh_token
-from app.excepciones import GoogleCalendarError  # <--- CAMBIO AQUÍ
+from app.utils.google_tokens import credentials_cache
+from app.excepciones import GoogleCalendarError, GoogleThrottledError, GoogleUnavailableError  # <--- CAMBIO AQUÍ
+from app.utils.request_metrics import track_external
+from app.utils.resilience import CircuitBreaker, KeyedRateLimiter
 from app.models.user import User
 from app.config import settings
-from typing import Dict, Optional
+from typing import TYPE_CHECKING, Dict, Hashable, List, Optional, Sequence, Tuple
+from dataclasses import dataclass
+from functools import lru_cache
 import datetime
-import pytz
+import json
+import random
+import time
+from zoneinfo import ZoneInfo
+
+# googleapiclient y httplib2 se cargan en el primer uso (ver _google_errors y
+# get_calendar_service): los workers que no llaman a Google no pagan su importación.
+if TYPE_CHECKING:
+    from googleapiclient.errors import HttpError
 
 # El time zone por defecto para los eventos de calendario
 # Es CRÍTICO que este time zone coincida con el time zone que manejas en tu backend
 TIME_ZONE = settings.TIME_ZONE 
 
+# Respuestas de Google que indican un fallo transitorio (se pueden reintentar)
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded"}
+
+
+@lru_cache(maxsize=1)
+def _google_errors():
+    """Clases de error de googleapiclient y httplib2 (importadas bajo demanda)."""
+    from googleapiclient.errors import HttpError
+    from httplib2 import HttpLib2Error
+    return HttpError, HttpLib2Error
+
+
+def is_retryable_http_error(error: "HttpError") -> bool:
+    """True si el error de Google es transitorio: cuota, límite de ritmo o error del servidor."""
+    if error.resp.status in RETRYABLE_STATUS_CODES:
+        return True
+    if error.resp.status == 403:
+        return any(detail.get("reason") in RATE_LIMIT_REASONS for detail in (error.error_details or []) if isinstance(detail, dict))
+    return False
+
+
+
+# --- Límite de ritmo y circuit breaker de la API de Calendar ---
+# Cada llamada (o sub-petición de un lote) consume un token del cubo global y del
+# cubo del doctor. Si Google acumula errores transitorios seguidos, el breaker se
+# abre y las llamadas fallan al instante con un error reintentable (el outbox las
+# vuelve a encolar) hasta la llamada de prueba.
+
+calendar_rate_limiter = KeyedRateLimiter(
+    global_rate=settings.GOOGLE_RATE_LIMIT_GLOBAL_PER_SECOND,
+    global_burst=settings.GOOGLE_RATE_LIMIT_GLOBAL_BURST,
+    key_rate=settings.GOOGLE_RATE_LIMIT_PER_DOCTOR_PER_SECOND,
+    key_burst=settings.GOOGLE_RATE_LIMIT_PER_DOCTOR_BURST,
+)
+calendar_breaker = CircuitBreaker(
+    name="google_calendar",
+    failure_threshold=settings.GOOGLE_BREAKER_FAILURE_THRESHOLD,
+    recovery_seconds=settings.GOOGLE_BREAKER_RECOVERY_SECONDS,
+)
+
+
+def acquire_calendar_call(doctor_id: int, calls: int = 1) -> None:
+    """Reserva `calls` llamadas a Calendar o lanza un error reintentable sin llamar a Google."""
+    # Primero el limitador: el breaker en half_open reserva la llamada de prueba al admitirla
+    if not calendar_rate_limiter.try_acquire(doctor_id, calls):
+        raise GoogleThrottledError(
+            "Límite de llamadas a Google Calendar alcanzado.",
+            retry_after_seconds=max(1, int(calendar_rate_limiter.retry_after(doctor_id, calls) + 0.999)),
+        )
+    if not calendar_breaker.allow():
+        raise GoogleUnavailableError(
+            "Google Calendar no está disponible temporalmente.",
+            retry_after_seconds=max(1, int(calendar_breaker.retry_after() + 0.999)),
+        )
+
+
+def record_calendar_outcome(error: Optional[BaseException] = None) -> None:
+    """Informa al breaker del resultado: solo los errores transitorios cuentan como fallo."""
+    HttpError, _ = _google_errors()
+    if error is None or (isinstance(error, HttpError) and not is_retryable_http_error(error)):
+        calendar_breaker.record_success()
+    else:
+        calendar_breaker.record_failure()
+
+
+@lru_cache(maxsize=None)
+def _discovery_document(api: str, version: str) -> dict:
+    """
+    Documento de descubrimiento de la API, cargado y parseado una sola vez.
+    Se usa la copia estática que distribuye googleapiclient (sin llamada de red).
+    """
+    from googleapiclient.discovery_cache import get_static_doc
+    document = get_static_doc(api, version)
+    if document is None:
+        raise GoogleCalendarError(f"No se encontró el documento de descubrimiento de {api} {version}.")
+    return json.loads(document)
+
+
+def get_calendar_service(credentials):
+    """
+    Cliente de Google Calendar para unas credenciales.
+    Construirlo a partir del documento ya parseado es prácticamente gratuito, así que
+    se crea uno por llamada (los clientes httplib2 no son seguros entre hilos).
+    """
+    from googleapiclient.discovery import build_from_document
+    return build_from_document(_discovery_document("calendar", "v3"), credentials=credentials)
+
+
+def get_doctor_credentials(doctor: User):
+    """Credenciales válidas del doctor (en caché hasta poco antes de expirar)."""
+    refresh_token = doctor.google_refresh_token
+    if not refresh_token:
+        # Esto debería ser capturado por la ruta, pero es una doble verificación.
+        raise GoogleCalendarError("Doctor no tiene el calendario de Google conectado.")
+
+    credentials = credentials_cache.get(doctor.id, refresh_token)
+    
+    if not credentials:
+        raise GoogleCalendarError("Token de refresco de Google inválido o expirado.")
+    return credentials
+
+
+def build_event_body(
+    doctor: User,
+    summary: str,
+    description: str,
+    start_time: datetime.datetime,
+    end_time: datetime.datetime,
+    patient_email: str,
+    event_id: Optional[str] = None
+) -> Dict:
+    """Cuerpo del evento de Calendar con conferencia de Meet, invitados y recordatorios."""
+    # Formato de las horas con Time Zone (CRÍTICO)
+    local_tz = ZoneInfo(TIME_ZONE)
+    
+    # Aseguramos que las horas de inicio y fin tengan la información del Time Zone
+    start_dt_aware = start_time.replace(tzinfo=local_tz) if start_time.tzinfo is None else start_time
+    end_dt_aware = end_time.replace(tzinfo=local_tz) if end_time.tzinfo is None else end_time
+
+    return {
+        **({'id': event_id} if event_id else {}),
+        'summary': summary,
+        'description': description,
+        # Configuración de Meet
+        'conferenceData': {
+            'createRequest': {
+                'requestId': f"meet-{doctor.id}-{start_time.strftime('%Y%m%d%H%M%S')}",
+                'conferenceSolutionKey': {'type': 'hangoutsMeet'}
+            },
+        },
+        'start': {
+            'dateTime': start_dt_aware.isoformat(),
+            'timeZone': TIME_ZONE,
+        },
+        'end': {
+            'dateTime': end_dt_aware.isoformat(),
+            'timeZone': TIME_ZONE,
+        },
+        # Invitados: Doctor y Paciente
+        'attendees': [
+            {'email': doctor.email},
+            {'email': patient_email, 'responseStatus': 'needsAction'},
+        ],
+        'reminders': {
+            'useDefault': False,
+            'overrides': [
+                {'method': 'email', 'minutes': 24 * 60},  # 1 día antes
+                {'method': 'email', 'minutes': 10},      # 10 minutos antes
+            ],
+        },
+    }
+
+
+def extract_meet_info(event: Dict) -> Dict:
+    """URL de Meet y enlace del evento a partir de la respuesta de Google."""
+    meet_link = None
+    for entry in event.get('conferenceData', {}).get('entryPoints', []):
+        if entry.get('entryPointType') == 'video':
+            meet_link = entry.get('uri')
+            break
+
+    return {
+        "meet_url": meet_link,
+        "event_url": event.get('htmlLink')
+    }
+
+
 def create_google_calendar_event(
     doctor: User,
     summary: str,
     description: str,
     start_time: datetime.datetime,
     end_time: datetime.datetime,
-    patient_email: str
+    patient_email: str,
+    event_id: Optional[str] = None
 ) -> Optional[Dict]:
     """
     Crea un evento de Google Calendar en el calendario principal del doctor,
@@ -31,90 +210,208 @@ def create_google_calendar_event(
         start_time: Objeto datetime.datetime con el inicio de la cita.
         end_time: Objeto datetime.datetime con el final de la cita.
         patient_email: Email del paciente para enviarle la invitación.
+        event_id: Id del evento elegido por el cliente (caracteres a-v y 0-9). Hace la
+            creación idempotente: si ya existe (reintento tras un timeout), se reutiliza.
 
     Returns:
         Un diccionario con la URL de Meet y la URL del evento, o None si falla.
     """
     
-    refresh_token = doctor.google_refresh_token
-    if not refresh_token:
-        # Esto debería ser capturado por la ruta, pero es una doble verificación.
-        raise GoogleCalendarError("Doctor no tiene el calendario de Google conectado.")
+    HttpError, HttpLib2Error = _google_errors()
 
     # 1. Obtener credenciales válidas usando el refresh token
-    credentials = get_credentials_from_refresh_token(refresh_token)
-    
-    if not credentials:
-        raise GoogleCalendarError("Token de refresco de Google inválido o expirado.")
+    credentials = get_doctor_credentials(doctor)
+
+    # Falla rápido si se superó el límite de ritmo o el breaker está abierto
+    acquire_calendar_call(doctor.id)
 
     try:
         # 2. Construir el servicio de Google Calendar
-        service = build('calendar', 'v3', credentials=credentials)
-
-        # 3. Formato de las horas con Time Zone (CRÍTICO)
-        local_tz = pytz.timezone(TIME_ZONE)
-        
-        # Aseguramos que las horas de inicio y fin tengan la información del Time Zone
-        start_dt_aware = local_tz.localize(start_time) if start_time.tzinfo is None else start_time
-        end_dt_aware = local_tz.localize(end_time) if end_time.tzinfo is None else end_time
-
-        event = {
-            'summary': summary,
-            'description': description,
-            # Configuración de Meet
-            'conferenceData': {
-                'createRequest': {
-                    'requestId': f"meet-{doctor.id}-{start_time.strftime('%Y%m%d%H%M%S')}",
-                    'conferenceSolutionKey': {'type': 'hangoutsMeet'}
-                },
-            },
-            'start': {
-                'dateTime': start_dt_aware.isoformat(),
-                'timeZone': TIME_ZONE,
-            },
-            'end': {
-                'dateTime': end_dt_aware.isoformat(),
-                'timeZone': TIME_ZONE,
-            },
-            # Invitados: Doctor y Paciente
-            'attendees': [
-                {'email': doctor.email},
-                {'email': patient_email, 'responseStatus': 'needsAction'},
-            ],
-            'reminders': {
-                'useDefault': False,
-                'overrides': [
-                    {'method': 'email', 'minutes': 24 * 60},  # 1 día antes
-                    {'method': 'email', 'minutes': 10},      # 10 minutos antes
-                ],
-            },
-        }
+        service = get_calendar_service(credentials)
+
+        # 3. Cuerpo del evento (horas con Time Zone, Meet, invitados)
+        event = build_event_body(doctor, summary, description, start_time, end_time, patient_email, event_id)
 
         # 4. Insertar el evento en el calendario principal ('primary')
-        event = service.events().insert(
-            calendarId='primary',
-            body=event,
-            # Importante: solicita que se cree la conferencia/Meet
-            conferenceDataVersion=1,
-            sendNotifications=True
-        ).execute()
+        try:
+            with track_external("google_calendar"):
+                event = service.events().insert(
+                    calendarId='primary',
+                    body=event,
+                    # Importante: solicita que se cree la conferencia/Meet
+                    conferenceDataVersion=1,
+                    sendNotifications=True
+                ).execute()
+        except HttpError as e:
+            if not (event_id and e.resp.status == 409):
+                raise
+            # El evento ya se creó en un intento anterior
+            with track_external("google_calendar"):
+                event = service.events().get(calendarId='primary', eventId=event_id).execute()
 
         # 5. Extraer la URL de Meet y el enlace del evento
-        meet_link = None
-        for entry in event.get('conferenceData', {}).get('entryPoints', []):
-            if entry.get('entryPointType') == 'video':
-                meet_link = entry.get('uri')
-                break
-
-        return {
-            "meet_url": meet_link,
-            "event_url": event.get('htmlLink')
-        }
+        record_calendar_outcome()
+        return extract_meet_info(event)
 
     except HttpError as e:
         print(f"Error HTTP de Google Calendar: {e}")
+        record_calendar_outcome(e)
+        if e.resp.status == 401:
+            # Token revocado o rechazado: la próxima llamada vuelve a refrescarlo
+            credentials_cache.invalidate(doctor.id)
         # Si Google devuelve 404 (calendar no existe) o 403 (permisos insuficientes)
-        raise GoogleCalendarError(f"Error de la API de Google: {e.content.decode()}")
+        raise GoogleCalendarError(f"Error de la API de Google: {e.content.decode()}", retryable=is_retryable_http_error(e))
+    except (OSError, HttpLib2Error) as e:
+        print(f"Error de red con Google Calendar: {e}")
+        record_calendar_outcome(e)
+        raise GoogleCalendarError("No se pudo contactar con Google Calendar.", retryable=True)
     except Exception as e:
         print(f"Error inesperado al crear evento: {e}")
+        record_calendar_outcome(e)
         raise GoogleCalendarError("Error inesperado al procesar la cita.")
+
+
+# --- Operaciones en lote (batch HTTP) ---
+# Agrupa hasta GOOGLE_BATCH_MAX_SIZE inserciones/actualizaciones/borrados de eventos
+# de un doctor en una sola petición HTTP. Cada sub-petición tiene su propio
+# resultado; solo se reintentan las que fallaron con un error transitorio.
+
+@dataclass
+class CalendarOperation:
+    """Operación sobre un evento del calendario principal de un doctor."""
+    key: Hashable            # identificador del llamador (p. ej. id de la cita)
+    kind: str                # "insert", "update" o "delete"
+    event_id: Optional[str] = None
+    body: Optional[Dict] = None
+
+
+@dataclass
+class CalendarOperationResult:
+    key: Hashable
+    ok: bool
+    event: Optional[Dict] = None
+    error: Optional[str] = None
+    retryable: bool = False
+
+
+def _operation_request(service, operation: CalendarOperation):
+    events = service.events()
+    if operation.kind == "insert":
+        return events.insert(calendarId='primary', body=operation.body, conferenceDataVersion=1, sendNotifications=True)
+    if operation.kind == "update":
+        return events.patch(calendarId='primary', eventId=operation.event_id, body=operation.body, conferenceDataVersion=1, sendNotifications=True)
+    if operation.kind == "delete":
+        return events.delete(calendarId='primary', eventId=operation.event_id, sendNotifications=True)
+    if operation.kind == "get":
+        return events.get(calendarId='primary', eventId=operation.event_id)
+    raise ValueError(f"Operación de calendario desconocida: {operation.kind}")
+
+
+def _execute_batch(service, operations: List[CalendarOperation]) -> Dict[int, Tuple[Optional[Dict], Optional["HttpError"]]]:
+    """Ejecuta un lote y devuelve (respuesta, error) por posición dentro del lote."""
+    responses: Dict[int, Tuple[Optional[Dict], Optional["HttpError"]]] = {}
+
+    def callback(request_id, response, exception):
+        responses[int(request_id)] = (response, exception)
+
+    batch = service.new_batch_http_request(callback=callback)
+    for position, operation in enumerate(operations):
+        batch.add(_operation_request(service, operation), request_id=str(position))
+    with track_external("google_calendar_batch"):
+        batch.execute()
+    return responses
+
+
+def _chunks(items: List) -> List[List]:
+    size = settings.GOOGLE_BATCH_MAX_SIZE
+    return [items[offset:offset + size] for offset in range(0, len(items), size)]
+
+
+def _run_chunk(service, doctor: User, chunk: List[Tuple[int, CalendarOperation]]):
+    """Ejecuta un lote y devuelve (índice, operación, respuesta, error) por operación."""
+    HttpError, HttpLib2Error = _google_errors()
+    try:
+        # Cada sub-petición cuenta para la cuota de Google
+        acquire_calendar_call(doctor.id, len(chunk))
+        responses = _execute_batch(service, [operation for _, operation in chunk])
+    except GoogleCalendarError as e:
+        responses = {position: (None, e) for position in range(len(chunk))}
+    except HttpError as e:
+        # Falló la petición del lote completo: el error aplica a todas sus operaciones
+        record_calendar_outcome(e)
+        if e.resp.status == 401:
+            credentials_cache.invalidate(doctor.id)
+        responses = {position: (None, e) for position in range(len(chunk))}
+    except (OSError, HttpLib2Error) as e:
+        print(f"Error de red en el lote de Google Calendar: {e}")
+        record_calendar_outcome(e)
+        responses = {position: (None, e) for position in range(len(chunk))}
+    else:
+        # Lote entregado: es un fallo del servicio solo si todas las sub-peticiones fallaron de forma transitoria
+        errors = [error for _, error in responses.values()]
+        all_transient = bool(errors) and all(isinstance(error, HttpError) and is_retryable_http_error(error) for error in errors)
+        record_calendar_outcome(errors[0] if all_transient else None)
+    missing = ConnectionError("Sin respuesta para la sub-petición del lote.")
+    return [
+        (index, operation, *responses.get(position, (None, missing)))
+        for position, (index, operation) in enumerate(chunk)
+    ]
+
+
+def batch_calendar_operations(
+    doctor: User,
+    operations: Sequence[CalendarOperation],
+    max_attempts: int = settings.GOOGLE_BATCH_MAX_ATTEMPTS,
+) -> List[CalendarOperationResult]:
+    """
+    Ejecuta las operaciones sobre el calendario del doctor en lotes HTTP y devuelve
+    un resultado por operación (en el mismo orden). Las sub-peticiones que fallan con
+    un error transitorio se reintentan, con backoff, hasta `max_attempts` veces.
+    Un 409 al insertar con id propio (ya creado en un intento anterior) se resuelve
+    leyendo el evento existente; un 404/410 al borrar se considera correcto.
+    """
+    HttpError, _ = _google_errors()
+    credentials = get_doctor_credentials(doctor)
+    service = get_calendar_service(credentials)
+
+    results: Dict[int, CalendarOperationResult] = {}
+    pending = list(enumerate(operations))
+    for attempt in range(1, max_attempts + 1):
+        retry: List[Tuple[int, CalendarOperation]] = []
+        conflicts: List[Tuple[int, CalendarOperation]] = []
+        for chunk in _chunks(pending):
+            for index, operation, response, error in _run_chunk(service, doctor, chunk):
+                status_code = error.resp.status if isinstance(error, HttpError) else None
+                if error is None:
+                    results[index] = CalendarOperationResult(operation.key, True, event=response or None)
+                elif operation.kind == "insert" and operation.event_id and status_code == 409:
+                    # Ya existe (creado en un intento anterior): se lee el evento en el mismo intento
+                    results[index] = CalendarOperationResult(operation.key, False, error="El evento ya existe.", retryable=True)
+                    conflicts.append((index, operation))
+                elif operation.kind == "delete" and status_code in (404, 410):
+                    results[index] = CalendarOperationResult(operation.key, True)
+                elif isinstance(error, GoogleCalendarError):
+                    # Rechazada localmente (límite de ritmo o breaker abierto)
+                    results[index] = CalendarOperationResult(operation.key, False, error=error.detail, retryable=error.retryable)
+                    if error.retryable:
+                        retry.append((index, operation))
+                else:
+                    retryable = is_retryable_http_error(error) if isinstance(error, HttpError) else True
+                    detail = error.content.decode() if isinstance(error, HttpError) else str(error)
+                    results[index] = CalendarOperationResult(operation.key, False, error=f"Error de la API de Google: {detail}", retryable=retryable)
+                    if retryable:
+                        retry.append((index, operation))
+
+        lookups = [(index, CalendarOperation(operation.key, "get", operation.event_id)) for index, operation in conflicts]
+        for chunk in _chunks(lookups):
+            for index, operation, response, error in _run_chunk(service, doctor, chunk):
+                if error is None:
+                    results[index] = CalendarOperationResult(operation.key, True, event=response)
+        retry.extend((index, operation) for index, operation in conflicts if not results[index].ok)
+
+        if not retry or attempt == max_attempts:
+            break
+        pending = retry
+        time.sleep(min(settings.GOOGLE_BATCH_BACKOFF_MAX_SECONDS, settings.GOOGLE_BATCH_BACKOFF_BASE_SECONDS * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0))
+
+    return [results[index] for index in range(len(operations))]
@@ -0,0 +1,120 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, time as clock, timedelta
+from typing import Callable, Optional, Sequence
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models.appointment import Appointment, AppointmentStatus, PriorityLevel
+from app.models.user import User, UserRole
+from app.models.working_hours import DoctorWorkingHours
+from app.utils.availability import compute_availability
+from app.utils.availability_cache import AvailabilityCache
+
+# Benchmark de disponibilidad (doctores x días).
+#
+#   python -m benchmarks.availability --doctors 1000 --days 30 --per-day 3
+#
+# Crea doctores con citas de 30 minutos por la mañana (una parte de
+# ellos con horario guardado en doctor_working_hours) y mide:
+#   - compute_availability: la matriz completa leyendo citas y horarios de la DB
+#   - AvailabilityCache en frío (primera consulta, carga todos los días) y en
+#     caliente (bitmaps ya cacheados)
+#   - AvailabilityGrid.earliest sobre la matriz resultante
+
+_INSERT_CHUNK = 10000
+CUSTOM_HOURS_SHARE = 0.1
+
+
+def seed(db: Session, doctors: int, days: int, per_day: int, first_day: date, rng: random.Random) -> int:
+    """Citas de `per_day` huecos al azar de la mañana por doctor y día; devuelve cuántas se crearon."""
+    db.execute(insert(User), [
+        {"id": user_id, "email": f"bench{user_id}@example.com",
+         "role": UserRole.DOCTOR if user_id <= doctors else UserRole.PATIENT}
+        for user_id in range(1, doctors + 2)
+    ])
+    # Una parte de los doctores atiende por la tarde de lunes a sábado
+    db.execute(insert(DoctorWorkingHours), [
+        {"doctor_id": doctor_id, "weekday": weekday, "start_time": clock(14, 0), "end_time": clock(19, 0)}
+        for doctor_id in range(1, int(doctors * CUSTOM_HOURS_SHARE) + 1) for weekday in range(6)
+    ])
+    rows = []
+    for doctor_id in range(1, doctors + 1):
+        for offset in range(days):
+            morning = datetime.combine(first_day + timedelta(days=offset), clock(9, 0))
+            for slot in rng.sample(range(6), min(per_day, 6)):
+                start = morning + timedelta(minutes=30 * slot)
+                rows.append({
+                    "patient_id": doctors + 1, "doctor_id": doctor_id, "start_time": start,
+                    "end_time": start + timedelta(minutes=30), "is_virtual": True,
+                    "priority_level": PriorityLevel.MEDIUM, "status": AppointmentStatus.CONFIRMED, "version": 1,
+                })
+    for offset in range(0, len(rows), _INSERT_CHUNK):
+        db.execute(insert(Appointment), rows[offset:offset + _INSERT_CHUNK])
+    db.commit()
+    return len(rows)
+
+
+def measure(name: str, step: Callable[[], object], repeat: int = 1) -> object:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = step()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"  {name:<40} {elapsed * 1000:10.1f} ms")
+    return result
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Disponibilidad de muchos doctores en muchos días.")
+    parser.add_argument("--doctors", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--per-day", type=int, default=3, help="Citas por doctor y día (máximo 6).")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    first_day = date.today() + timedelta(days=1)
+    doctor_ids = list(range(1, args.doctors + 1))
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'availability.db')}")
+        Base.metadata.create_all(engine)
+        try:
+            with Session(engine) as db:
+                started = time.perf_counter()
+                created = seed(db, args.doctors, args.days, args.per_day, first_day, rng)
+                print(f"{created:,} citas de {args.doctors:,} doctores en {args.days} días creadas en "
+                      f"{time.perf_counter() - started:.1f} s")
+
+                grid = measure(
+                    "compute_availability (DB + NumPy)",
+                    lambda: compute_availability(db, first_day, args.days, doctor_ids), args.repeat,
+                )
+                print(f"    matriz {grid.free.shape}, {int(grid.free.sum()):,} slots libres")
+                measure("earliest (30 min, sobre la matriz)", lambda: grid.earliest(timedelta(minutes=30)), args.repeat)
+                measure("earliest (2 h, sobre la matriz)", lambda: grid.earliest(timedelta(hours=2)), args.repeat)
+
+                cache = AvailabilityCache(
+                    max_entries=args.doctors * args.days, keep_past_days=0, ttl_seconds=3600,
+                )
+                cached = measure("AvailabilityCache en frío", lambda: cache.get_grid(db, doctor_ids, first_day, args.days))
+                measure(
+                    "AvailabilityCache en caliente",
+                    lambda: cache.get_grid(db, doctor_ids, first_day, args.days), args.repeat,
+                )
+                if not (cached.free == grid.free).all():
+                    print("La caché no coincide con compute_availability")
+                    return 1
+        finally:
+            engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence
+
+# Benchmark de alta de citas: endpoint individual en bucle frente a la carga masiva.
+#
+#   python -m benchmarks.batch_intake --items 2000 --single 300
+#
+# Levanta la aplicación en proceso (TestClient) sobre un SQLite temporal, registra
+# unos doctores y un paciente, y mide citas/segundo de:
+#   - POST /citas/ repetido (`--single` peticiones);
+#   - POST /citas/batch con `--items` citas en una sola petición.
+# La configuración se lee al importar la aplicación, así que el entorno se fija
+# antes de importar main.
+
+
+def _items(count: int, offset: int) -> List[dict]:
+    """Citas de 30 minutos repartidas en franjas distintas (todas asignables)."""
+    start = datetime(2030, 1, 7, 8, 0)
+    return [
+        {
+            "start_time": (start + timedelta(minutes=30 * (offset + index))).isoformat(),
+            "end_time": (start + timedelta(minutes=30 * (offset + index) + 30)).isoformat(),
+            "is_virtual": True,
+            "priority_level": ("Baja", "Media", "Alta", "Urgente")[index % 4],
+        }
+        for index in range(count)
+    ]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Citas/segundo: endpoint individual frente a carga masiva.")
+    parser.add_argument("--items", type=int, default=2000, help="Citas de la carga masiva.")
+    parser.add_argument("--single", type=int, default=300, help="Peticiones al endpoint individual.")
+    parser.add_argument("--doctors", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.TemporaryDirectory()
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(directory.name, 'batch_intake.db')}",
+        "BCRYPT_ROUNDS": "4",
+        "CALENDAR_OUTBOX_ENABLED": "False",
+        "NO_SHOW_SWEEP_ENABLED": "False",
+        "AVAILABILITY_WARMUP_DAYS": "0",
+        "REQUEST_METRICS_ENABLED": "False",
+    })
+    import logging
+    from fastapi.testclient import TestClient
+    import main as app_main
+
+    logging.disable(logging.INFO)
+    try:
+        with TestClient(app_main.app) as client:
+            for index in range(args.doctors):
+                client.post("/api/v1/auth/auth/register",
+                            json={"email": f"doc{index}@example.com", "password": "pw", "role": "Doctor"})
+            client.post("/api/v1/auth/auth/register",
+                        json={"email": "patient@example.com", "password": "pw", "role": "Paciente"})
+            token = client.post("/api/v1/auth/auth/login",
+                                json={"email": "patient@example.com", "password": "pw"}).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+
+            started = time.perf_counter()
+            for item in _items(args.single, offset=0):
+                response = client.post("/api/v1/appointments/citas/", json=item, headers=headers)
+                if response.status_code != 201:
+                    print(f"Fallo en el endpoint individual: {response.status_code} {response.text[:200]}")
+                    return 1
+            single_rate = args.single / (time.perf_counter() - started)
+
+            started = time.perf_counter()
+            response = client.post("/api/v1/appointments/citas/batch",
+                                   json=_items(args.items, offset=args.single), headers=headers)
+            batch_rate = args.items / (time.perf_counter() - started)
+            summary = response.json()
+            if response.status_code != 200 or summary["created"] != args.items:
+                print(f"Fallo en la carga masiva: {response.status_code} {response.text[:200]}")
+                return 1
+    finally:
+        directory.cleanup()
+
+    print(f"{args.doctors} doctores, SQLite")
+    print(f"  {f'POST /citas/ x{args.single}':<32} {single_rate:10,.0f} citas/s")
+    print(f"  {f'POST /citas/batch ({args.items} citas)':<32} {batch_rate:10,.0f} citas/s  x{batch_rate / single_rate:.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
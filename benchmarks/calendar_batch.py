@@ -0,0 +1,124 @@
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import List, Optional, Sequence
+
+from app.utils import servicios_meet_calendar as calendar
+from app.utils.resilience import CircuitBreaker, KeyedRateLimiter
+from tests.fake_calendar import FakeCalendarServer
+
+# Benchmark de escritura en Google Calendar: un evento por petición frente a la API batch.
+#
+#   python -m benchmarks.calendar_batch --events 200 --rtt-ms 40 --fail-every 10
+#
+# Google se sustituye por el FakeCalendarServer de las pruebas con una latencia fija
+# por petición HTTP (`--rtt-ms`), de modo que se mide el coste por cita de:
+#   - create_google_calendar_event en bucle (una ida y vuelta por evento);
+#   - batch_calendar_operations (GOOGLE_BATCH_MAX_SIZE eventos por ida y vuelta).
+# Con `--fail-every N`, una de cada N operaciones falla una vez con 503 para incluir
+# el reintento de las sub-peticiones fallidas (sin la espera del backoff, para medir
+# solo las idas y vueltas).
+
+
+class SlowCalendarServer(FakeCalendarServer):
+    """FakeCalendarServer con una latencia de red fija por petición HTTP."""
+
+    def __init__(self, rtt_seconds: float):
+        super().__init__()
+        self.rtt_seconds = rtt_seconds
+        self.round_trips = 0
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        self.round_trips += 1
+        time.sleep(self.rtt_seconds)
+        return super().request(uri, method, body, headers, **kwargs)
+
+
+def _install(server: FakeCalendarServer) -> None:
+    """Dirige el módulo de Calendar al servidor simulado, sin límite de ritmo."""
+    from googleapiclient.discovery import build_from_document
+
+    calendar.get_doctor_credentials = lambda doctor: None
+    calendar.get_calendar_service = lambda credentials: build_from_document(
+        calendar._discovery_document("calendar", "v3"), http=server,
+    )
+    calendar.calendar_rate_limiter = KeyedRateLimiter(1e9, 1e9, 1e9, 1e9)
+    calendar.calendar_breaker = CircuitBreaker(name="benchmark", failure_threshold=10 ** 9, recovery_seconds=1)
+    calendar.settings.GOOGLE_BATCH_BACKOFF_BASE_SECONDS = 0
+
+
+def _slots(count: int) -> List[datetime]:
+    start = datetime(2030, 1, 7, 8, 0)
+    return [start + timedelta(minutes=30 * index) for index in range(count)]
+
+
+def _operations(doctor, count: int, prefix: str) -> List[calendar.CalendarOperation]:
+    return [
+        calendar.CalendarOperation(
+            key=index, kind="insert", event_id=f"{prefix}{index}",
+            body=calendar.build_event_body(doctor, f"Consulta {index}", "", begin, begin + timedelta(minutes=30),
+                                           "patient@example.com", f"{prefix}{index}"),
+        )
+        for index, begin in enumerate(_slots(count))
+    ]
+
+
+def _fail_some(server: FakeCalendarServer, operations: List[calendar.CalendarOperation], every: int) -> None:
+    if every:
+        for operation in operations[::every]:
+            server.fail(operation.event_id, 503)
+
+
+def _report(name: str, elapsed: float, events: int, round_trips: int) -> None:
+    print(f"  {name:<28} {elapsed * 1000:9.0f} ms  {elapsed * 1000 / events:7.2f} ms/cita  "
+          f"{round_trips:5d} peticiones HTTP")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Latencia por cita: eventos de Calendar uno a uno frente a lotes.")
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--rtt-ms", type=float, default=40.0, help="Latencia simulada de cada petición HTTP.")
+    parser.add_argument("--fail-every", type=int, default=10, help="Una de cada N operaciones falla una vez (0: ninguna).")
+    args = parser.parse_args(argv)
+
+    server = SlowCalendarServer(args.rtt_ms / 1000)
+    _install(server)
+    # El módulo de Calendar solo usa el id y el email del doctor
+    doctor = SimpleNamespace(id=1, email="doc@example.com")
+    print(f"{args.events} eventos, {args.rtt_ms:.0f} ms por petición, lotes de {calendar.settings.GOOGLE_BATCH_MAX_SIZE}")
+
+    # 1. Un evento por petición (el 503 se reintenta como lo haría el outbox)
+    operations = _operations(doctor, args.events, "uno")
+    _fail_some(server, operations, args.fail_every)
+    started = time.perf_counter()
+    for operation, begin in zip(operations, _slots(args.events)):
+        for _ in range(2):
+            try:
+                calendar.create_google_calendar_event(
+                    doctor, operation.body["summary"], "", begin, begin + timedelta(minutes=30),
+                    "patient@example.com", operation.event_id,
+                )
+                break
+            except calendar.GoogleCalendarError as e:
+                if not e.retryable:
+                    raise
+    _report("create_google_calendar_event", time.perf_counter() - started, args.events, server.round_trips)
+
+    # 2. API batch con reintento de las sub-peticiones fallidas
+    server.round_trips = 0
+    operations = _operations(doctor, args.events, "lote")
+    _fail_some(server, operations, args.fail_every)
+    started = time.perf_counter()
+    results = calendar.batch_calendar_operations(doctor, operations)
+    _report("batch_calendar_operations", time.perf_counter() - started, args.events, server.round_trips)
+
+    if not all(result.ok for result in results) or len(server.events) != 2 * args.events:
+        print("Faltan eventos en el calendario simulado")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+import httpx
+
+# Prueba de carga: motor async frente al camino síncrono con clientes concurrentes.
+#
+#   python -m benchmarks.load --clients 500 --requests 20
+#
+# Para cada modo (DB_ASYNC_ENABLED=True / False) levanta la aplicación con uvicorn
+# en un proceso aparte sobre un SQLite temporal, registra un doctor y un paciente
+# por cliente y lanza `--clients` clientes a la vez. Cada cliente reserva una cita y
+# después repite GET /citas/my (sin If-None-Match, para que cada petición llegue a
+# la base). Se informa de peticiones/segundo y de los percentiles p50/p99.
+# La configuración se lee al importar la aplicación: por eso un proceso por modo.
+
+REGISTER = "/api/v1/auth/auth/register"
+LOGIN = "/api/v1/auth/auth/login"
+BOOK = "/api/v1/appointments/citas/"
+MY = "/api/v1/appointments/citas/my"
+START = datetime(2030, 1, 7, 8, 0)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _serve(async_enabled: bool, directory: str, port: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(directory, f'load_{async_enabled}.db')}",
+        "DB_ASYNC_ENABLED": str(async_enabled),
+        "BCRYPT_ROUNDS": "4",
+        "CALENDAR_OUTBOX_ENABLED": "False",
+        "NO_SHOW_SWEEP_ENABLED": "False",
+        "AVAILABILITY_WARMUP_DAYS": "0",
+        "REQUEST_METRICS_ENABLED": "False",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning",
+         # Las conexiones de los clientes quedan abiertas mientras se registran los demás
+         "--timeout-keep-alive", "120"],
+        env=env, stdout=subprocess.DEVNULL,
+    )
+
+
+async def _wait_until_ready(client: httpx.AsyncClient, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await client.get("/docs")
+            return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def _login(client: httpx.AsyncClient, email: str, role: str) -> Dict[str, str]:
+    await client.post(REGISTER, json={"email": email, "password": "pw", "role": role})
+    response = await client.post(LOGIN, json={"email": email, "password": "pw"})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def _run_client(client: httpx.AsyncClient, index: int, headers: Dict[str, str], requests: int,
+                      start_gate: asyncio.Event, latencies: List[float], errors: List[int]) -> None:
+    await start_gate.wait()
+    slot = START + timedelta(minutes=30 * index)
+
+    async def timed(method: str, url: str, **kwargs) -> None:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, headers=headers, **kwargs)
+        except httpx.TransportError:
+            errors.append(0)
+            return
+        latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            errors.append(response.status_code)
+
+    await timed("POST", BOOK, json={
+        "start_time": slot.isoformat(), "end_time": (slot + timedelta(minutes=30)).isoformat(),
+        "is_virtual": True, "priority_level": "Media",
+    })
+    for _ in range(requests - 1):
+        await timed("GET", MY)
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def _load(base_url: str, clients: int, requests: int) -> Dict[str, float]:
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        await _wait_until_ready(client)
+        await _login(client, "doctor@example.com", "Doctor")
+        # Registro en tandas: no forma parte de la medida
+        headers = []
+        for offset in range(0, clients, 50):
+            headers.extend(await asyncio.gather(*(
+                _login(client, f"patient{index}@example.com", "Paciente")
+                for index in range(offset, min(clients, offset + 50))
+            )))
+
+        start_gate = asyncio.Event()
+        latencies: List[float] = []
+        errors: List[int] = []
+        tasks = [
+            asyncio.create_task(_run_client(client, index, headers[index], requests, start_gate, latencies, errors))
+            for index in range(clients)
+        ]
+        await asyncio.sleep(0)
+        started = time.perf_counter()
+        start_gate.set()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    return {
+        "rate": len(latencies) / elapsed,
+        "p50": _percentile(latencies, 0.50),
+        "p99": _percentile(latencies, 0.99),
+        "errors": len(errors),
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Peticiones/segundo y p99 con muchos clientes concurrentes.")
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=20, help="Peticiones por cliente (la primera reserva).")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for async_enabled in (True, False):
+            port = _free_port()
+            server = _serve(async_enabled, directory, port)
+            try:
+                results[async_enabled] = asyncio.run(_load(f"http://127.0.0.1:{port}", args.clients, args.requests))
+            finally:
+                server.terminate()
+                server.wait()
+
+    print(f"{args.clients} clientes x {args.requests} peticiones, SQLite")
+    for async_enabled, label in ((True, "async (aiosqlite)"), (False, "síncrono (threadpool)")):
+        result = results[async_enabled]
+        print(f"  {label:<24} {result['rate']:8,.0f} pet/s  p50 {result['p50'] * 1000:7.1f} ms  "
+              f"p99 {result['p99'] * 1000:7.1f} ms  errores {result['errors']}")
+    return 1 if any(result["errors"] for result in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
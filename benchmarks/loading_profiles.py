@@ -0,0 +1,139 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import create_engine, event, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, joinedload
+
+from app.database import Base
+from app.models.appointment import Appointment, AppointmentStatus, PriorityLevel
+from app.models.user import User, UserRole
+from app.utils.loading_profiles import loading_options
+
+# Benchmark de la búsqueda del usuario autenticado (consultas, filas y latencia).
+#
+#   python -m benchmarks.loading_profiles --appointments 10000 --repeat 50
+#
+# Crea un doctor con `--appointments` citas y lo busca por id como hace
+# get_current_user, antes y después de los perfiles de carga:
+#   - antes: las cuatro relaciones de User con lazy="joined" (un LEFT OUTER JOIN
+#     que arrastra todo el historial del doctor), reproducido con joinedload;
+#   - después: el perfil "auth" de app/utils/loading_profiles.py.
+
+_INSERT_CHUNK = 10000
+
+
+def seed(engine: Engine, appointments: int) -> int:
+    """Un doctor, un paciente y `appointments` citas pasadas del doctor. Devuelve el id del doctor."""
+    Base.metadata.create_all(engine)
+    start = datetime(2020, 1, 6, 8, 0)
+    with engine.begin() as connection:
+        connection.execute(insert(User), [
+            {"id": 1, "email": "doctor@example.com", "role": UserRole.DOCTOR},
+            {"id": 2, "email": "paciente@example.com", "role": UserRole.PATIENT},
+        ])
+        for offset in range(0, appointments, _INSERT_CHUNK):
+            connection.execute(insert(Appointment), [
+                {
+                    "patient_id": 2,
+                    "doctor_id": 1,
+                    "start_time": start + timedelta(minutes=30 * index),
+                    "end_time": start + timedelta(minutes=30 * index + 30),
+                    "is_virtual": True,
+                    "priority_level": PriorityLevel.MEDIUM,
+                    "status": AppointmentStatus.COMPLETED,
+                    "version": 1,
+                }
+                for index in range(offset, min(offset + _INSERT_CHUNK, appointments))
+            ])
+    return 1
+
+
+def joined_lookup(db: Session, user_id: int) -> User:
+    """Antes: todas las relaciones cargadas con JOIN en la misma consulta."""
+    return db.execute(
+        select(User).options(
+            joinedload(User.patient_records),
+            joinedload(User.doctor_records),
+            joinedload(User.patient_appointments),
+            joinedload(User.doctor_appointments),
+        ).where(User.id == user_id)
+    ).unique().scalar_one()
+
+
+def auth_lookup(db: Session, user_id: int) -> User:
+    """Después: perfil "auth", solo las columnas del usuario."""
+    return db.execute(
+        select(User).options(*loading_options("auth")).where(User.id == user_id)
+    ).scalar_one()
+
+
+def count_queries_and_rows(engine: Engine, lookup: Callable[[Session, int], User], user_id: int) -> Tuple[int, int]:
+    """Consultas que emite una búsqueda y filas que devuelven (se re-ejecutan fuera de la medición)."""
+    statements: List[Tuple[str, object]] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        with Session(engine) as db:
+            lookup(db, user_id)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    rows = 0
+    with engine.connect() as connection:
+        for statement, parameters in statements:
+            rows += len(connection.exec_driver_sql(statement, parameters).fetchall())
+    return len(statements), rows
+
+
+def measure(engine: Engine, lookup: Callable[[Session, int], User], user_id: int, repeat: int) -> float:
+    """Milisegundos por búsqueda (mediana de `repeat`), con una sesión nueva en cada una como por petición."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        with Session(engine) as db:
+            lookup(db, user_id)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Consultas, filas y latencia de la búsqueda del usuario autenticado.")
+    parser.add_argument("--appointments", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--url", default=None, help="URL de SQLAlchemy; por defecto un SQLite temporal.")
+    args = parser.parse_args(argv)
+
+    directory = None
+    url = args.url
+    if url is None:
+        directory = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(directory.name, 'loading_profiles.db')}"
+    engine = create_engine(url)
+    try:
+        doctor_id = seed(engine, args.appointments)
+        print(f"Doctor con {args.appointments:,} citas ({engine.dialect.name})")
+        baseline = None
+        for name, lookup in (("antes (lazy='joined')", joined_lookup), ("después (perfil auth)", auth_lookup)):
+            queries, rows = count_queries_and_rows(engine, lookup, doctor_id)
+            latency = measure(engine, lookup, doctor_id, args.repeat)
+            baseline = baseline or latency
+            print(f"  {name:<24} {queries} consultas {rows:>8,} filas {latency:9.2f} ms  x{baseline / latency:.1f}")
+        return 0
+    finally:
+        engine.dispose()
+        if directory is not None:
+            directory.cleanup()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
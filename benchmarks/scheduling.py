@@ -0,0 +1,127 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Sequence
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models.appointment import Appointment, AppointmentStatus, PriorityLevel
+from app.models.user import User, UserRole
+from app.utils.scheduling import SchedulingEngine, SchedulingRequest
+
+# Benchmark del motor de asignación (latencia por reserva).
+#
+#   python -m benchmarks.scheduling --appointments 100000 --doctors 500 --requests 20000
+#
+# Carga en el motor una agenda sintética (citas de 30 minutos repartidas al azar
+# entre los doctores, en jornadas de 16 huecos) y mide cada reserve() en dos
+# escenarios: horarios donde todavía hay doctores libres (heap de candidatos) y
+# horarios donde todos están ocupados (hueco más cercano). Como referencia se
+# mide la misma elección recorriendo a todos los doctores, que era el coste
+# anterior en el peor caso.
+
+SLOT = timedelta(minutes=30)
+SLOTS_PER_DAY = 16
+_INSERT_CHUNK = 10000
+
+
+def seed(db: Session, appointments: int, doctors: int, days: int, first_day: datetime, rng: random.Random) -> None:
+    """Citas confirmadas sin solapes por doctor, en huecos al azar de `days` jornadas."""
+    db.execute(insert(User), [
+        {"id": user_id, "email": f"bench{user_id}@example.com",
+         "role": UserRole.DOCTOR if user_id <= doctors else UserRole.PATIENT}
+        for user_id in range(1, doctors + 2)
+    ])
+    per_doctor = appointments // doctors
+    rows = []
+    for doctor_id in range(1, doctors + 1):
+        for slot in rng.sample(range(days * SLOTS_PER_DAY), per_doctor):
+            start = _slot_start(first_day, slot)
+            rows.append({
+                "patient_id": doctors + 1, "doctor_id": doctor_id, "start_time": start, "end_time": start + SLOT,
+                "is_virtual": True, "priority_level": PriorityLevel.MEDIUM,
+                "status": AppointmentStatus.CONFIRMED, "version": 1,
+            })
+    for offset in range(0, len(rows), _INSERT_CHUNK):
+        db.execute(insert(Appointment), rows[offset:offset + _INSERT_CHUNK])
+    db.commit()
+
+
+def _slot_start(first_day: datetime, slot: int) -> datetime:
+    return first_day + timedelta(days=slot // SLOTS_PER_DAY) + SLOT * (slot % SLOTS_PER_DAY)
+
+
+def full_scan(engine: SchedulingEngine, request: SchedulingRequest) -> Optional[int]:
+    """Doctor menos cargado libre recorriendo a todos (referencia)."""
+    free = [(engine._loads[doctor_id], doctor_id) for doctor_id, index in engine._indexes.items()
+            if index.is_free(request.start_time, request.end_time)]
+    return min(free)[1] if free else None
+
+
+def measure(name: str, requests: List[SchedulingRequest], step: Callable[[SchedulingRequest], object]) -> None:
+    latencies = []
+    for request in requests:
+        started = time.perf_counter()
+        step(request)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    total = sum(latencies)
+    p50 = latencies[len(latencies) // 2] * 1e6
+    p99 = latencies[int(len(latencies) * 0.99)] * 1e6
+    print(f"  {name:<32} {len(requests) / total:12,.0f} reservas/s   p50 {p50:8.1f} µs   p99 {p99:8.1f} µs")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Latencia por reserva del motor de asignación.")
+    parser.add_argument("--appointments", type=int, default=100_000)
+    parser.add_argument("--doctors", type=int, default=500)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    if args.appointments // args.doctors > args.days * SLOTS_PER_DAY:
+        parser.error("No caben tantas citas por doctor en los días indicados.")
+
+    rng = random.Random(args.seed)
+    first_day = (datetime.utcnow() + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+    with tempfile.TemporaryDirectory() as directory:
+        db_engine = create_engine(f"sqlite:///{os.path.join(directory, 'scheduling.db')}")
+        Base.metadata.create_all(db_engine)
+        try:
+            with Session(db_engine) as db:
+                started = time.perf_counter()
+                seed(db, args.appointments, args.doctors, args.days, first_day, rng)
+                print(f"{args.appointments:,} citas de {args.doctors} doctores creadas en "
+                      f"{time.perf_counter() - started:.1f} s")
+                engine = SchedulingEngine()
+                started = time.perf_counter()
+                engine.load(db)
+                print(f"Motor cargado en {time.perf_counter() - started:.2f} s")
+        finally:
+            db_engine.dispose()
+
+    slots = args.days * SLOTS_PER_DAY
+    requests = [
+        SchedulingRequest(start_time=start, end_time=start + SLOT, priority_level=PriorityLevel.MEDIUM)
+        for start in (_slot_start(first_day, rng.randrange(slots)) for _ in range(args.requests))
+    ]
+    measure("referencia: recorrer doctores", requests, lambda request: full_scan(engine, request))
+    measure("reserve (hay doctores libres)", requests, engine.reserve)
+
+    # Se llena un horario hasta que nadie esté libre y se sigue pidiendo en él
+    busy_start = _slot_start(first_day, slots // 2)
+    crowded = [SchedulingRequest(start_time=busy_start, end_time=busy_start + SLOT) for _ in range(args.doctors)]
+    for request in crowded:
+        engine.reserve(request)
+    measure("reserve (todos ocupados)", crowded[:min(len(crowded), 2000)], engine.reserve)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import argparse
+import json
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence
+
+from pydantic import TypeAdapter
+
+from app.models.appointment import AppointmentStatus, PriorityLevel
+from app.routes.citas import APPOINTMENT_LIST_COLUMNS, APPOINTMENT_ROW_SERIALIZER
+from app.utils.fast_json import orjson
+from app.utils.schemas import AppointmentResponse
+
+# Benchmark de serialización del listado de citas (filas/segundo).
+#
+#   python -m benchmarks.serialization --rows 500 --repeat 50
+#
+# Compara el camino con Pydantic (validar cada fila con from_attributes y después
+# codificar, tanto con el dump_json de pydantic-core como con json.dumps) con
+# RowSerializer, que codifica las tuplas de Core directamente.
+
+AppointmentRow = namedtuple("AppointmentRow", [column.key for column in APPOINTMENT_LIST_COLUMNS])
+
+_adapter = TypeAdapter(List[AppointmentResponse])
+
+
+def build_rows(count: int) -> List[AppointmentRow]:
+    """Filas sintéticas con la misma forma que devuelve select(*APPOINTMENT_LIST_COLUMNS)."""
+    start = datetime(2030, 1, 7, 8, 0)
+    statuses = list(AppointmentStatus)
+    priorities = list(PriorityLevel)
+    return [
+        AppointmentRow(
+            id=index + 1,
+            patient_id=1000 + index % 97,
+            doctor_id=10 + index % 13,
+            start_time=start + timedelta(minutes=30 * index),
+            end_time=start + timedelta(minutes=30 * index + 30),
+            status=statuses[index % len(statuses)],
+            priority_level=priorities[index % len(priorities)],
+            video_url=f"https://meet.google.com/abc-{index:04d}" if index % 2 else None,
+            created_at=start - timedelta(days=3, seconds=index),
+        )
+        for index in range(count)
+    ]
+
+
+def pydantic_dump_json(rows: Sequence[AppointmentRow]) -> bytes:
+    """Camino de FastAPI con response_model: validación + dump_json de pydantic-core."""
+    return _adapter.dump_json(_adapter.validate_python(rows, from_attributes=True))
+
+
+def pydantic_stdlib_json(rows: Sequence[AppointmentRow]) -> bytes:
+    """Camino clásico: validación, dict en modo JSON y json.dumps."""
+    content = _adapter.dump_python(_adapter.validate_python(rows, from_attributes=True), mode="json")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+PIPELINES: Dict[str, Callable[[Sequence[AppointmentRow]], bytes]] = {
+    "pydantic + dump_json": pydantic_dump_json,
+    "pydantic + json.dumps": pydantic_stdlib_json,
+    "RowSerializer": APPOINTMENT_ROW_SERIALIZER.dumps,
+}
+
+
+def measure(pipeline: Callable[[Sequence[AppointmentRow]], bytes], rows: Sequence[AppointmentRow], repeat: int) -> float:
+    """Filas por segundo (mejor de `repeat` ejecuciones)."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        pipeline(rows)
+        best = min(best, time.perf_counter() - started)
+    return len(rows) / best
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Filas/segundo al serializar el listado de citas.")
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    rows = build_rows(args.rows)
+    # Todos los caminos deben producir el mismo JSON
+    expected = json.loads(pydantic_dump_json(rows))
+    for name, pipeline in PIPELINES.items():
+        if json.loads(pipeline(rows)) != expected:
+            print(f"{name}: la salida no coincide con la de Pydantic")
+            return 1
+
+    print(f"{args.rows} filas, codificador: {'orjson' if orjson is not None else 'pydantic-core'}")
+    baseline = None
+    for name, pipeline in PIPELINES.items():
+        rate = measure(pipeline, rows, args.repeat)
+        baseline = baseline or rate
+        print(f"  {name:<24} {rate:12,.0f} filas/s  x{rate / baseline:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+import argparse
+import sys
+import time
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Sequence
+
+from jose import jwt
+
+from app.config import settings
+from app.utils import security
+
+# Micro-benchmark de la validación del token de acceso (decodificaciones/segundo).
+#
+#   python -m benchmarks.token_decode --tokens 1000 --rounds 20
+#
+# Compara, sobre `--tokens` tokens distintos usados `--rounds` veces cada uno (como
+# un cliente que repite peticiones durante la vigencia de su token):
+#   - jwt.decode: verificación criptográfica en cada petición (sin caché);
+#   - decode_access_token en frío: primera vez de cada token (verifica y guarda);
+#   - decode_access_token en caché: el payload sale de la caché de tokens
+#     verificados (digest SHA-256 + consulta de revocaciones).
+
+
+def _decode_without_cache(token: str) -> dict:
+    return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+
+
+def measure(decode: Callable[[str], Optional[dict]], tokens: List[str], rounds: int) -> float:
+    """Decodificaciones por segundo."""
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for token in tokens:
+            decode(token)
+    return len(tokens) * rounds / (time.perf_counter() - started)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Decodificaciones/segundo del token de acceso, con y sin caché.")
+    parser.add_argument("--tokens", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    tokens = [
+        security.create_access_token({"user_id": user_id, "role": "Paciente"}, expires_delta=timedelta(minutes=30))
+        for user_id in range(args.tokens)
+    ]
+    security._verified_tokens.clear()
+
+    results: Dict[str, float] = {"jwt.decode (sin caché)": measure(_decode_without_cache, tokens, args.rounds)}
+    results["decode_access_token en frío"] = measure(security.decode_access_token, tokens, 1)
+    results["decode_access_token en caché"] = measure(security.decode_access_token, tokens, args.rounds)
+    if any(security.decode_access_token(token)["user_id"] != user_id for user_id, token in enumerate(tokens)):
+        print("La caché devolvió un payload distinto")
+        return 1
+
+    print(f"{args.tokens} tokens {settings.ALGORITHM}, {args.rounds} usos por token")
+    baseline = None
+    for name, rate in results.items():
+        baseline = baseline or rate
+        print(f"  {name:<30} {rate:12,.0f} tokens/s  x{rate / baseline:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Sequence
+
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models.appointment import Appointment, AppointmentStatus, PriorityLevel
+from app.models.user import User, UserRole
+from app.utils.agenda_versions import affected_users
+from app.utils.appointment_changes import AppointmentChange
+from app.utils.appointment_lifecycle import TransitionCriteria, bulk_transition
+
+# Benchmark de transiciones masivas de estado (filas/segundo).
+#
+#   python -m benchmarks.transitions --rows 1000000 --orm-rows 20000
+#
+# Crea una agenda sintética de citas confirmadas ya terminadas y las marca como
+# NO_SHOW de tres formas: cargando cada cita en el ORM y confirmando (camino por
+# fila), con bulk_transition en una sola sentencia y con bulk_transition por
+# bloques, como hace el barrido nocturno. Las versiones de agenda se incrementan
+# en la misma transacción, como en la aplicación. Por defecto usa un SQLite temporal;
+# --url permite medir contra otro motor (las tablas deben poder crearse).
+
+DOCTORS = 100
+PATIENTS = 1000
+_INSERT_CHUNK = 10000
+
+
+def seed(engine: Engine, rows: int, now: datetime) -> None:
+    """Citas confirmadas de 30 minutos, sin solapes por doctor, que terminaron antes de `now`."""
+    Base.metadata.create_all(engine)
+    slots = rows // DOCTORS + 1
+    first_start = now - timedelta(days=1, minutes=30 * slots)
+    with engine.begin() as connection:
+        connection.execute(insert(User), [
+            {"id": user_id, "email": f"bench{user_id}@example.com",
+             "role": UserRole.DOCTOR if user_id <= DOCTORS else UserRole.PATIENT}
+            for user_id in range(1, DOCTORS + PATIENTS + 1)
+        ])
+        for offset in range(0, rows, _INSERT_CHUNK):
+            connection.execute(insert(Appointment), [
+                {
+                    "patient_id": DOCTORS + 1 + index % PATIENTS,
+                    "doctor_id": 1 + index % DOCTORS,
+                    "start_time": first_start + timedelta(minutes=30 * (index // DOCTORS)),
+                    "end_time": first_start + timedelta(minutes=30 * (index // DOCTORS) + 30),
+                    "is_virtual": True,
+                    "priority_level": PriorityLevel.MEDIUM,
+                    "status": AppointmentStatus.CONFIRMED,
+                    "version": 1,
+                }
+                for index in range(offset, min(offset + _INSERT_CHUNK, rows))
+            ])
+
+
+def orm_transition(engine: Engine, now: datetime, limit: int) -> int:
+    """Camino por fila: carga las citas en el ORM, cambia el estado y confirma."""
+    with Session(engine) as db:
+        appointments = db.scalars(
+            select(Appointment)
+            .where(Appointment.status == AppointmentStatus.CONFIRMED, Appointment.end_time <= now)
+            .order_by(Appointment.id)
+            .limit(limit)
+        ).all()
+        for appointment in appointments:
+            appointment.status = AppointmentStatus.NO_SHOW
+        db.commit()
+        return len(appointments)
+
+
+def bulk_transition_once(
+    engine: Engine, now: datetime, limit: Optional[int] = None, after_id: Optional[int] = None
+) -> List[AppointmentChange]:
+    criteria = TransitionCriteria(
+        from_statuses=[AppointmentStatus.CONFIRMED], end_before=now, after_id=after_id
+    )
+    with Session(engine) as db:
+        changes = bulk_transition(db, AppointmentStatus.NO_SHOW, criteria, now=now, limit=limit)
+        db.commit()
+        return changes
+
+
+def bulk_transition_chunked(engine: Engine, now: datetime, chunk_size: int) -> int:
+    """Igual que sweep_no_shows: una transacción por bloque, avanzando por id."""
+    total = 0
+    after_id = None
+    while True:
+        changes = bulk_transition_once(engine, now, limit=chunk_size, after_id=after_id)
+        total += len(changes)
+        if len(changes) < chunk_size:
+            return total
+        after_id = max(change.appointment_id for change in changes)
+
+
+def measure(name: str, step: Callable[[], int]) -> float:
+    started = time.perf_counter()
+    updated = step()
+    elapsed = time.perf_counter() - started
+    rate = updated / elapsed if elapsed else 0.0
+    print(f"  {name:<28} {updated:>10,} filas {elapsed:8.2f} s {rate:12,.0f} filas/s")
+    return rate
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Filas/segundo al cambiar de estado citas en masa.")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--orm-rows", type=int, default=20_000,
+                        help="Citas que se actualizan por el camino del ORM (el más lento).")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--url", default=None, help="URL de SQLAlchemy; por defecto un SQLite temporal.")
+    args = parser.parse_args(argv)
+
+    directory = None
+    url = args.url
+    if url is None:
+        directory = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(directory.name, 'transitions.db')}"
+    engine = create_engine(url)
+    now = datetime.utcnow()
+    try:
+        started = time.perf_counter()
+        seed(engine, args.rows, now)
+        print(f"{args.rows:,} citas creadas en {time.perf_counter() - started:.1f} s ({engine.dialect.name})")
+
+        # Cada camino actualiza una parte distinta de las citas confirmadas
+        remaining = args.rows - args.orm_rows
+        half = remaining // 2
+        orm_rate = measure("ORM (carga + commit)", lambda: orm_transition(engine, now, args.orm_rows))
+        bulk_changes: List[AppointmentChange] = []
+
+        def single_statement() -> int:
+            bulk_changes.extend(bulk_transition_once(engine, now, limit=half))
+            return len(bulk_changes)
+
+        bulk_rate = measure("bulk_transition", single_statement)
+        chunked_rate = measure(
+            f"bulk_transition x{args.chunk_size}", lambda: bulk_transition_chunked(engine, now, args.chunk_size)
+        )
+        print(f"  agendas versionadas en la sentencia única: {len(affected_users(bulk_changes)):,}")
+        if orm_rate:
+            print(f"  aceleración frente al ORM: x{bulk_rate / orm_rate:.1f} (una sentencia), "
+                  f"x{chunked_rate / orm_rate:.1f} (por bloques)")
+
+        with Session(engine) as db:
+            pending = db.scalar(
+                select(func.count()).select_from(Appointment).where(Appointment.status == AppointmentStatus.CONFIRMED)
+            )
+        if pending:
+            print(f"Quedaron {pending} citas sin transicionar")
+            return 1
+        return 0
+    finally:
+        engine.dispose()
+        if directory is not None:
+            directory.cleanup()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
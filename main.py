@@ -1,25 +1,64 @@
+import asyncio
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from sqlalchemy.exc import OperationalError
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
 import logging
+import time
 
 # Configuración de log
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Importaciones de la DB y modelos
-from app.database import Base, engine
-from app.routes import ruta, citas # Rutas de Autenticación (auth.py) y Citas
+from app.config import settings
+from app.database import SessionLocal, engine, async_engine, run_pool_liveness_checks, warm_up_pools
+from app.migraciones import upgrade_schema
+from app.routes import ruta, citas, metricas # Rutas de Autenticación (auth.py), Citas y Monitoreo
+from app.utils.agenda_events import agenda_events
+from app.utils.appointment_lifecycle import run_no_show_sweeper
+from app.utils.availability_cache import availability_cache
+from app.utils.calendar_outbox import calendar_outbox_worker
+from app.utils.google_tokens import close_http_clients
+from app.utils.password_pool import password_pool
+from app.utils.request_metrics import PerformanceMiddleware, instrument_engine
 
-# Bloque try-except para manejar el error de conexión a la DB durante el startup
-try:
-    # Intenta crear todas las tablas en la DB (si no existen)
-    Base.metadata.create_all(bind=engine)
-    logger.info("Conexión exitosa a la base de datos. Tablas creadas/verificadas.")
-except OperationalError as e:
-    logger.error(f"⚠️ ERROR: Falló la conexión a la base de datos PostgreSQL en el inicio. Esto es esperado si el servicio de DB no está corriendo. Detalles: {e}")
-    # Nota: La aplicación seguirá cargando, pero las operaciones de DB fallarán hasta que el servicio esté disponible.
+def _create_schema():
+    """
+    Crea las tablas que falten y actualiza las existentes (ver app/migraciones.py).
+    Se ejecuta en el lifespan (no al importar el módulo); en producción, con el
+    esquema gestionado por migraciones, se desactiva con DB_CREATE_SCHEMA_ON_STARTUP=False.
+    """
+    # Bloque try-except para manejar el error de conexión a la DB durante el startup
+    try:
+        # Crea las tablas que falten y aplica los cambios de esquema pendientes
+        for step in upgrade_schema(engine):
+            logger.info(f"Esquema actualizado: {step}")
+        logger.info("Conexión exitosa a la base de datos. Tablas creadas/verificadas.")
+    except RuntimeError as e:
+        logger.error(f"⚠️ ERROR: No se pudo actualizar el esquema de la base de datos: {e}")
+    except OperationalError as e:
+        logger.error(f"⚠️ ERROR: Falló la conexión a la base de datos PostgreSQL en el inicio. Esto es esperado si el servicio de DB no está corriendo. Detalles: {e}")
+        # Nota: La aplicación seguirá cargando, pero las operaciones de DB fallarán hasta que el servicio esté disponible.
+
+
+async def _warm_up_pools():
+    try:
+        opened = await warm_up_pools(settings.DB_POOL_WARMUP_CONNECTIONS)
+        logger.info(f"Pool de conexiones calentado: {opened}")
+    except OperationalError as e:
+        logger.error(f"⚠️ No se pudo calentar el pool de conexiones: {e}")
+
+
+def _warm_up_availability():
+    """Precalcula la disponibilidad de los próximos días para todos los doctores."""
+    try:
+        with SessionLocal() as db:
+            availability_cache.warm_up(db, settings.AVAILABILITY_WARMUP_DAYS)
+        logger.info(f"Caché de disponibilidad precalculada para {settings.AVAILABILITY_WARMUP_DAYS} días.")
+    except OperationalError as e:
+        logger.error(f"⚠️ No se pudo precalcular la disponibilidad: {e}")
 
 
 # Contexto de inicio y cierre de la aplicación
@@ -27,9 +66,43 @@ except OperationalError as e:
 async def lifespan(app: FastAPI):
     # Lógica que se ejecuta al iniciar la aplicación
     logger.info("Iniciando FastAPI server...")
+    started = time.perf_counter()
+    # Esquema y pool de conexiones en paralelo; la caché de disponibilidad necesita las tablas
+    startup_steps = [_warm_up_pools()]
+    if settings.DB_CREATE_SCHEMA_ON_STARTUP:
+        startup_steps.append(run_in_threadpool(_create_schema))
+    await asyncio.gather(*startup_steps)
+    if settings.AVAILABILITY_WARMUP_DAYS > 0:
+        await run_in_threadpool(_warm_up_availability)
+    elapsed = time.perf_counter() - started
+    if elapsed > settings.STARTUP_TIME_BUDGET_SECONDS:
+        logger.warning(f"⚠️ El arranque tardó {elapsed:.2f}s (presupuesto: {settings.STARTUP_TIME_BUDGET_SECONDS}s)")
+    else:
+        logger.info(f"Arranque completado en {elapsed:.2f}s")
+    # Entrega de eventos de agenda (SSE) desde el hub de cambios
+    await agenda_events.start()
+    background_tasks = []
+    if not settings.DB_POOL_PRE_PING and settings.DB_POOL_LIVENESS_INTERVAL_SECONDS > 0:
+        # Verificación periódica del pool en lugar del pre-ping por checkout
+        background_tasks.append(asyncio.create_task(
+            run_pool_liveness_checks(settings.DB_POOL_LIVENESS_INTERVAL_SECONDS)
+        ))
+    if settings.CALENDAR_OUTBOX_ENABLED:
+        # Creación de eventos de Google Calendar/Meet en segundo plano
+        background_tasks.append(asyncio.create_task(calendar_outbox_worker.run()))
+    if settings.NO_SHOW_SWEEP_ENABLED:
+        # Barrido nocturno: citas confirmadas ya terminadas -> NO_SHOW
+        background_tasks.append(asyncio.create_task(run_no_show_sweeper()))
     yield
     # Lógica que se ejecuta al cerrar la aplicación
     logger.info("Cerrando FastAPI server...")
+    for task in background_tasks:
+        task.cancel()
+    await agenda_events.close()
+    password_pool.shutdown()
+    await close_http_clients()
+    if async_engine is not None:
+        await async_engine.dispose()
 
 # Inicialización de la aplicación FastAPI
 app = FastAPI(
@@ -51,9 +124,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Instrumentación de latencias, consultas SQL y llamadas externas por ruta (GET /metrics)
+if settings.REQUEST_METRICS_ENABLED:
+    instrument_engine(engine)
+    if async_engine is not None:
+        instrument_engine(async_engine.sync_engine)
+    app.add_middleware(PerformanceMiddleware)
+
 # Inclusión de las rutas
 app.include_router(ruta.router, prefix="/api/v1/auth", tags=["Autenticación"])
 app.include_router(citas.router, prefix="/api/v1/appointments", tags=["Citas"])
+app.include_router(metricas.router)
 
 # Ruta de prueba o health check
 @app.get("/")
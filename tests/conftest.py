@@ -0,0 +1,144 @@
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Tuple
+
+# La configuración se lee al importar app.config: el entorno de pruebas se fija antes.
+# Base SQLite en un directorio temporal y sin tareas en segundo plano.
+_TEST_DIR = tempfile.mkdtemp(prefix="back_no_country_tests_")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_TEST_DIR, 'test.db')}",
+    "BCRYPT_ROUNDS": "4",
+    "CALENDAR_OUTBOX_ENABLED": "False",
+    "NO_SHOW_SWEEP_ENABLED": "False",
+    "AVAILABILITY_WARMUP_DAYS": "0",
+    "DB_POOL_WARMUP_CONNECTIONS": "0",
+    "REQUEST_QUERY_WARNING_THRESHOLD": "0",
+})
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import main
+from app.database import Base, SessionLocal, async_engine, engine
+from app.models.user import User, UserRole
+from app.utils.availability_cache import availability_cache
+from app.utils.password_pool import password_pool
+from app.utils.principal_cache import principal_cache
+from app.utils.scheduling import scheduling_engine
+from tests.fake_calendar import FakeCalendarServer
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "heavy: pruebas de carga lentas (se excluyen con -m 'not heavy')")
+
+
+@pytest.fixture(autouse=True)
+def fresh_database():
+    """Esquema vacío y cachés del proceso limpias en cada prueba."""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    # Los singletons sobreviven entre pruebas: se vuelven a su estado inicial
+    scheduling_engine.__init__()
+    principal_cache.clear()
+    availability_cache.clear()
+    # El lifespan de cada TestClient apaga el pool de hashing al salir
+    password_pool.__init__(password_pool.workers, password_pool.max_pending)
+    yield
+
+
+@pytest.fixture
+def db():
+    with SessionLocal() as session:
+        yield session
+
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def calendar_server(monkeypatch):
+    """
+    Google Calendar simulado: los clientes de la API hablan con un FakeCalendarServer
+    en memoria y el limitador y el breaker de Calendar empiezan de cero.
+    """
+    from googleapiclient.discovery import build_from_document
+
+    from app.utils import servicios_meet_calendar as calendar
+
+    server = FakeCalendarServer()
+    monkeypatch.setattr(calendar, "get_doctor_credentials", lambda doctor: None)
+    monkeypatch.setattr(calendar, "get_calendar_service", lambda credentials: build_from_document(
+        calendar._discovery_document("calendar", "v3"), http=server,
+    ))
+    monkeypatch.setattr(calendar, "calendar_rate_limiter", calendar.KeyedRateLimiter(
+        global_rate=1000, global_burst=1000, key_rate=1000, key_burst=1000,
+    ))
+    monkeypatch.setattr(calendar, "calendar_breaker", calendar.CircuitBreaker(
+        name="test", failure_threshold=100, recovery_seconds=30,
+    ))
+    return server
+
+
+def register(client: TestClient, email: str, role: str) -> dict:
+    """Registra un usuario y devuelve la cabecera Authorization de su token."""
+    response = client.post("/api/v1/auth/auth/register", json={"email": email, "password": "pw", "role": role})
+    assert response.status_code == 201, response.text
+    response = client.post("/api/v1/auth/auth/login", json={"email": email, "password": "pw"})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def add_users(db, doctors: int = 1) -> tuple:
+    """Crea `doctors` doctores y un paciente directamente en la base; devuelve (ids de doctores, id del paciente)."""
+    users = [User(email=f"doc{i}@example.com", role=UserRole.DOCTOR) for i in range(doctors)]
+    users.append(User(email="patient@example.com", role=UserRole.PATIENT))
+    db.add_all(users)
+    db.commit()
+    return [user.id for user in users[:-1]], users[-1].id
+
+
+def race(attempt: Callable[[int], None], count: int) -> List[Optional[Exception]]:
+    """Ejecuta `attempt(i)` en `count` hilos a la vez; devuelve la excepción de cada uno (o None)."""
+    barrier = threading.Barrier(count)
+
+    def run(index: int) -> Optional[Exception]:
+        barrier.wait()
+        try:
+            attempt(index)
+        except Exception as e:
+            return e
+        return None
+
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        return list(pool.map(run, range(count)))
+
+
+@contextmanager
+def captured_queries(table: Optional[str] = None):
+    """SELECT emitidos por el código en ambos motores (solo los de `table`, si se indica)."""
+    statements: List[Tuple[str, object]] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and (table is None or f"FROM {table}" in statement):
+            statements.append((statement, parameters))
+
+    engines = [engine] + ([async_engine.sync_engine] if async_engine is not None else [])
+    for target in engines:
+        event.listen(target, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        for target in engines:
+            event.remove(target, "before_cursor_execute", capture)
+
+
+def captured_appointment_queries():
+    """SELECT sobre appointments emitidos por el código, en ambos motores."""
+    return captured_queries("appointments")
@@ -0,0 +1,107 @@
+import json
+import re
+import threading
+from collections import defaultdict, deque
+from email.parser import Parser
+from typing import Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httplib2
+
+# Google Calendar simulado a nivel de transporte HTTP (sustituye al httplib2.Http
+# del cliente de googleapiclient). Guarda los eventos en memoria, responde al insert
+# con id propio (409 si ya existe), al get y a la API batch (multipart/mixed), y
+# permite programar fallos por id de evento para probar reintentos.
+
+_EVENTS_PATH = re.compile(r"^/calendar/v3/calendars/primary/events(?:/(?P<event_id>[^/?]+))?$")
+BATCH_PATH = "/batch/calendar/v3"
+_STATUS_REASONS = {200: "OK", 204: "No Content", 403: "Forbidden", 404: "Not Found", 409: "Conflict", 503: "Service Unavailable"}
+
+
+class FakeCalendarServer:
+
+    def __init__(self):
+        self.events: Dict[str, dict] = {}
+        # (método, id de evento) de cada petición atendida, incluidas las de los lotes
+        self.calls: List[Tuple[str, Optional[str]]] = []
+        # Peticiones batch recibidas: ids de evento de cada sub-petición
+        self.batches: List[List[Optional[str]]] = []
+        self._failures: Dict[str, Deque[int]] = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def fail(self, event_id: str, *status_codes: int) -> None:
+        """Las próximas peticiones sobre `event_id` responden con esos códigos, en orden."""
+        self._failures[event_id].extend(status_codes)
+
+    # --- Transporte (interfaz de httplib2.Http) ---
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        parts = urlsplit(uri)
+        if parts.path == BATCH_PATH:
+            return self._batch(body, headers or {})
+        status, payload = self._handle(method, parts.path, body)
+        return self._response(status), json.dumps(payload).encode()
+
+    @staticmethod
+    def _parse(path: str, body) -> Tuple[Optional[str], dict]:
+        """(id del evento, cuerpo) de una petición sobre los eventos del calendario principal."""
+        if isinstance(body, bytes):
+            body = body.decode()
+        event = json.loads(body) if body else {}
+        match = _EVENTS_PATH.match(path)
+        return (match.group("event_id") if match else None) or event.get("id"), event
+
+    def _handle(self, method: str, path: str, body) -> Tuple[int, dict]:
+        if _EVENTS_PATH.match(path) is None:
+            return 404, {"error": {"code": 404, "message": f"Ruta desconocida: {path}"}}
+        event_id, event = self._parse(path, body)
+        with self._lock:
+            self.calls.append((method, event_id))
+            failures = self._failures.get(event_id)
+            if failures:
+                code = failures.popleft()
+                return code, {"error": {"code": code, "message": "Fallo programado.",
+                                        "errors": [{"reason": "backendError"}]}}
+            if method == "POST":
+                if event_id in self.events:
+                    return 409, {"error": {"code": 409, "message": "The requested identifier already exists."}}
+                event["htmlLink"] = f"https://calendar.example.com/event?eid={event_id}"
+                event["conferenceData"] = {"entryPoints": [
+                    {"entryPointType": "video", "uri": f"https://meet.example.com/{event_id}"},
+                ]}
+                self.events[event_id] = event
+                return 200, event
+            if method == "GET" and event_id in self.events:
+                return 200, self.events[event_id]
+            return 404, {"error": {"code": 404, "message": "Not Found"}}
+
+    def _batch(self, body, headers: dict):
+        """Separa el multipart/mixed, atiende cada sub-petición y responde otro multipart."""
+        if isinstance(body, bytes):
+            body = body.decode()
+        message = Parser().parsestr(f"content-type: {headers['content-type']}\r\n\r\n{body}")
+        responses = []
+        event_ids = []
+        for part in message.get_payload():
+            request_line, _, rest = part.get_payload().replace("\r\n", "\n").partition("\n")
+            method, target, _ = request_line.split(" ", 2)
+            _, _, sub_body = rest.partition("\n\n")
+            path = urlsplit(target).path
+            event_ids.append(self._parse(path, sub_body)[0])
+            status, payload = self._handle(method, path, sub_body)
+            responses.append(
+                f"--batch_fake\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{part['Content-ID'][1:]}\r\n\r\n"
+                f"HTTP/1.1 {status} {_STATUS_REASONS.get(status, 'Error')}\r\n"
+                f"Content-Type: application/json\r\n\r\n{json.dumps(payload)}\r\n"
+            )
+        with self._lock:
+            self.batches.append(event_ids)
+        content = "".join(responses) + "--batch_fake--\r\n"
+        return self._response(200, "multipart/mixed; boundary=batch_fake"), content.encode()
+
+    @staticmethod
+    def _response(status: int, content_type: str = "application/json") -> httplib2.Response:
+        response = httplib2.Response({"status": status, "content-type": content_type})
+        response.reason = _STATUS_REASONS.get(status, "Error")
+        return response
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.utils.agenda_events import AgendaEvent, AgendaEventBroker, LocalAgendaBackend
+
+
+def _broker(max_connections: int = 2) -> AgendaEventBroker:
+    return AgendaEventBroker(LocalAgendaBackend(history_size=10), queue_size=10,
+                             max_connections=max_connections, heartbeat_seconds=60)
+
+
+def test_stream_that_is_never_iterated_holds_no_subscription():
+    broker = _broker()
+    stream = broker.stream(1, None)
+    assert broker.stats()["connections"] == 0
+    del stream
+    broker.ensure_capacity()
+
+
+def test_subscription_lives_while_the_stream_is_open():
+    async def scenario():
+        broker = _broker()
+        await broker.start()
+        stream = broker.stream(1, None)
+        assert await stream.__anext__() == b"retry: 3000\n\n"
+        assert broker.stats()["connections"] == 1
+
+        await broker.backend.publish([AgendaEvent("created", 7, (1,), {"appointment_id": 7})])
+        assert b"event: created" in await stream.__anext__()
+
+        await stream.aclose()
+        assert broker.stats()["connections"] == 0
+        assert broker.stats()["users"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_ensure_capacity_rejects_when_all_connections_are_open():
+    async def scenario():
+        broker = _broker(max_connections=1)
+        stream = broker.stream(1, None)
+        await stream.__anext__()
+        with pytest.raises(HTTPException) as error:
+            broker.ensure_capacity()
+        assert error.value.status_code == 503
+        await stream.aclose()
+        broker.ensure_capacity()
+
+    asyncio.run(scenario())
@@ -0,0 +1,61 @@
+from datetime import date
+
+import pytest
+
+from app.utils.availability import SLOT_MINUTES, compute_availability
+from tests.conftest import register
+
+EARLIEST = "/api/v1/appointments/citas/disponibilidad/primer-hueco"
+HOURS = "/api/v1/appointments/citas/disponibilidad/horario"
+
+
+@pytest.fixture
+def patient(client):
+    register(client, "doctor@example.com", "Doctor")
+    return register(client, "patient@example.com", "Paciente")
+
+
+@pytest.mark.parametrize("not_before, expected", [
+    ("2030-01-07T10:00:00", "2030-01-07T10:00:00"),
+    ("2030-01-07T10:00:00Z", "2030-01-07T10:00:00"),
+    ("2030-01-07T10:00:00+00:00", "2030-01-07T10:00:00"),
+    # 11:00 en UTC+2 son las 9:00 UTC
+    ("2030-01-07T11:00:00+02:00", "2030-01-07T09:00:00"),
+])
+def test_earliest_slot_accepts_aware_not_before(client, patient, not_before, expected):
+    response = client.get(EARLIEST, params={"not_before": not_before, "days": 1}, headers=patient)
+    assert response.status_code == 200, response.text
+    assert response.json()["start_time"] == expected
+
+
+def test_saved_working_hours_replace_the_default_template(client, db):
+    doctor = register(client, "doctor@example.com", "Doctor")
+    patient = register(client, "patient@example.com", "Paciente")
+    params = {"not_before": "2030-01-07T08:00:00", "days": 2}
+    # Primera consulta con el horario por defecto: deja los días en la caché
+    assert client.get(EARLIEST, params=params, headers=patient).json()["start_time"] == "2030-01-07T09:00:00"
+
+    response = client.put(HOURS, headers=doctor, json=[
+        {"weekday": 1, "start_time": "14:00:00", "end_time": "16:00:00"},
+    ])
+    assert response.status_code == 200, response.text
+    assert client.get(HOURS, headers=doctor).json() == response.json()
+
+    # El lunes ya no es laborable y la caché se recalculó con la plantilla guardada
+    assert client.get(EARLIEST, params=params, headers=patient).json()["start_time"] == "2030-01-08T14:00:00"
+    grid = compute_availability(db, date(2030, 1, 7), 2)
+    assert not grid.free[0, 0].any()
+    assert grid.free[0, 1].sum() == 120 // SLOT_MINUTES
+
+    # Lista vacía: vuelve el horario por defecto
+    assert client.put(HOURS, headers=doctor, json=[]).status_code == 200
+    assert client.get(EARLIEST, params=params, headers=patient).json()["start_time"] == "2030-01-07T09:00:00"
+
+
+def test_working_hours_are_validated(client):
+    doctor = register(client, "doctor@example.com", "Doctor")
+    patient = register(client, "patient@example.com", "Paciente")
+    backwards = [{"weekday": 0, "start_time": "12:00:00", "end_time": "09:00:00"}]
+    assert client.put(HOURS, headers=doctor, json=backwards).status_code == 400
+    assert client.put(HOURS, headers=doctor, json=[{**backwards[0], "weekday": 7}]).status_code == 422
+    assert client.put(HOURS, headers=patient, json=[]).status_code == 403
@@ -0,0 +1,75 @@
+from datetime import date, datetime, timedelta
+
+from app.database import SessionLocal
+from app.models.appointment import Appointment, AppointmentStatus, PriorityLevel
+from app.utils import availability_cache as cache_module
+from app.utils.appointment_changes import AppointmentChange, AppointmentState
+from app.utils.availability_cache import availability_cache
+from tests.conftest import add_users
+
+DAY = date(2030, 1, 7)
+TEN = datetime(2030, 1, 7, 10, 0)
+SLOT = timedelta(minutes=30)
+
+
+def _book(session, doctor_id: int, patient_id: int, start: datetime) -> Appointment:
+    appointment = Appointment(
+        patient_id=patient_id, doctor_id=doctor_id, start_time=start, end_time=start + SLOT,
+        priority_level=PriorityLevel.MEDIUM, status=AppointmentStatus.CONFIRMED,
+    )
+    session.add(appointment)
+    session.commit()
+    return appointment
+
+
+def _slot_is_free(db, doctor_id: int, start: datetime) -> bool:
+    return bool(availability_cache.get_day(db, doctor_id, DAY)[(start.hour * 60 + start.minute) // cache_module.SLOT_MINUTES])
+
+
+def test_booking_committed_during_warm_up_is_not_lost(db, monkeypatch):
+    (doctor_id,), patient_id = add_users(db)
+    real_load = cache_module.load_booked_appointments
+
+    def load_then_book(*args, **kwargs):
+        rows = real_load(*args, **kwargs)
+        # Otra petición confirma una cita después de la lectura y antes de guardar el día
+        with SessionLocal() as other:
+            _book(other, doctor_id, patient_id, TEN)
+        return rows
+
+    monkeypatch.setattr(cache_module, "load_booked_appointments", load_then_book)
+    availability_cache.warm_up(db, days=1, today=DAY)
+    monkeypatch.setattr(cache_module, "load_booked_appointments", real_load)
+
+    assert not _slot_is_free(db, doctor_id, TEN)
+    assert availability_cache.verify(db, doctor_id, DAY)
+
+
+def test_change_already_read_by_the_load_is_not_counted_twice(db):
+    (doctor_id,), patient_id = add_users(db)
+    appointment = _book(db, doctor_id, patient_id, TEN)
+    availability_cache.warm_up(db, days=1, today=DAY)
+
+    # El mismo cambio notificado después de que la carga del día ya lo leyera de la DB
+    state = AppointmentState(patient_id, doctor_id, TEN, TEN + SLOT, AppointmentStatus.CONFIRMED)
+    availability_cache.apply_changes([AppointmentChange(appointment.id, None, state)])
+    assert availability_cache.verify(db, doctor_id, DAY)
+
+    appointment.status = AppointmentStatus.CANCELLED
+    db.commit()
+    assert _slot_is_free(db, doctor_id, TEN)
+    assert availability_cache.verify(db, doctor_id, DAY)
+
+
+def test_reschedule_moves_the_booking_in_the_cached_day(db):
+    (doctor_id,), patient_id = add_users(db)
+    availability_cache.warm_up(db, days=1, today=DAY)
+    appointment = _book(db, doctor_id, patient_id, TEN)
+    assert not _slot_is_free(db, doctor_id, TEN)
+
+    appointment.start_time, appointment.end_time = TEN + 2 * SLOT, TEN + 3 * SLOT
+    db.commit()
+    assert _slot_is_free(db, doctor_id, TEN)
+    assert not _slot_is_free(db, doctor_id, TEN + 2 * SLOT)
+    assert availability_cache.verify(db, doctor_id, DAY)
+    assert availability_cache.stats()["misses"] == 1
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select
+
+from app.models.appointment import Appointment, AppointmentStatus, PriorityLevel
+from app.routes.citas import schedule_and_persist_batch
+from app.utils.schemas import AppointmentBatchItem
+from app.utils.scheduling import SchedulingRequest, scheduling_engine
+from tests.conftest import add_users
+
+START = datetime(2030, 1, 7, 9, 0)
+SLOT = timedelta(minutes=30)
+
+
+def _overlaps(db) -> int:
+    rows = db.execute(
+        select(Appointment.doctor_id, Appointment.start_time, Appointment.end_time)
+        .where(Appointment.doctor_id.is_not(None), Appointment.status.in_(["REQUESTED", "CONFIRMED"]))
+        .order_by(Appointment.doctor_id, Appointment.start_time)
+    ).all()
+    return sum(
+        1 for previous, current in zip(rows, rows[1:])
+        if previous.doctor_id == current.doctor_id and current.start_time < previous.end_time
+    )
+
+
+def test_reload_doctor_keeps_pending_reservations(db):
+    (doctor_id,), _ = add_users(db, doctors=1)
+    scheduling_engine.load(db)
+    # Un solo doctor: cada reserva ocupa el siguiente hueco libre de su agenda
+    request = SchedulingRequest(start_time=START, end_time=START + SLOT)
+
+    first = scheduling_engine.reserve(request)
+    second = scheduling_engine.reserve(request)
+    assert (first.start_time, second.start_time) == (START, START + SLOT)
+
+    # Recargar desde la DB (vacía) no debe volver a ofrecer las reservas en curso
+    scheduling_engine.reload_doctor(db, doctor_id)
+    assert scheduling_engine.reserve(request).start_time == START + 2 * SLOT
+    assert scheduling_engine.pending_count() == 3
+
+    scheduling_engine.release(second)
+    scheduling_engine.reload_doctor(db, doctor_id)
+    assert scheduling_engine.reserve(request).start_time == START + SLOT
+
+
+def test_committed_reservation_is_no_longer_pending(db):
+    (doctor_id,), patient_id = add_users(db, doctors=1)
+    scheduling_engine.load(db)
+    assignment = scheduling_engine.reserve(SchedulingRequest(start_time=START, end_time=START + SLOT, doctor_id=doctor_id))
+
+    db.add(Appointment(
+        patient_id=patient_id, doctor_id=doctor_id, start_time=assignment.start_time, end_time=assignment.end_time,
+        priority_level=PriorityLevel.MEDIUM, status=AppointmentStatus.CONFIRMED,
+    ))
+    db.commit()
+    assert scheduling_engine.pending_count() == 0
+
+    # La cita confirmada y la reserva eran la misma: tras recargar sigue habiendo un solo intervalo
+    scheduling_engine.reload_doctor(db, doctor_id)
+    request = SchedulingRequest(start_time=START, end_time=START + SLOT)
+    assert scheduling_engine.reserve(request).start_time == START + SLOT
+
+
+def test_batch_conflict_reload_does_not_reassign_the_rest_of_the_chunk(db):
+    doctor_ids, patient_id = add_users(db, doctors=2)
+    scheduling_engine.load(db)
+    # Otro worker confirmó una cita que este proceso no conoce (sin pasar por el hub)
+    db.execute(insert(Appointment), [{
+        "patient_id": patient_id, "doctor_id": doctor_ids[0], "start_time": START, "end_time": START + SLOT,
+        "priority_level": PriorityLevel.MEDIUM, "status": AppointmentStatus.CONFIRMED, "version": 1,
+    }])
+    db.commit()
+
+    items = [
+        (index, AppointmentBatchItem(
+            start_time=START, end_time=START + SLOT, is_virtual=True, priority_level=PriorityLevel.MEDIUM,
+        ), patient_id)
+        for index in range(8)
+    ]
+    results = schedule_and_persist_batch(db, items)
+
+    assert all(result.ok for result in results.values()), [result.error for result in results.values()]
+    assert all(result.doctor_id is not None for result in results.values())
+    assert _overlaps(db) == 0
+    assert scheduling_engine.pending_count() == 0
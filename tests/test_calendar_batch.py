@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.appointment import Appointment, AppointmentStatus, PriorityLevel
+from app.models.calendar_outbox import CalendarOutbox, CalendarOutboxStatus
+from app.models.user import User, UserRole
+from app.utils import calendar_outbox, servicios_meet_calendar
+from app.utils.servicios_meet_calendar import CalendarOperation, batch_calendar_operations, build_event_body
+from tests.conftest import add_users
+
+START = datetime(2030, 1, 7, 10, 0)
+DOCTOR = User(id=1, email="doc@example.com", role=UserRole.DOCTOR)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    """Los reintentos del lote no esperan de verdad."""
+    monkeypatch.setattr(servicios_meet_calendar.time, "sleep", lambda seconds: None)
+
+
+def _inserts(count: int) -> list:
+    operations = []
+    for index in range(count):
+        start = START + timedelta(minutes=30 * index)
+        event_id = f"cita{index}n{index}"
+        operations.append(CalendarOperation(
+            key=index, kind="insert", event_id=event_id,
+            body=build_event_body(DOCTOR, f"Consulta {index}", "", start, start + timedelta(minutes=30),
+                                  "patient@example.com", event_id),
+        ))
+    return operations
+
+
+def test_operations_travel_in_one_multipart_request(calendar_server):
+    operations = _inserts(3)
+    results = batch_calendar_operations(DOCTOR, operations)
+
+    assert calendar_server.batches == [["cita0n0", "cita1n1", "cita2n2"]]
+    assert [result.key for result in results] == [0, 1, 2]
+    assert all(result.ok for result in results)
+    assert results[1].event["summary"] == "Consulta 1"
+    assert results[1].event["conferenceData"]["entryPoints"][0]["uri"] == "https://meet.example.com/cita1n1"
+
+
+def test_only_failed_sub_requests_are_retried(calendar_server):
+    calendar_server.fail("cita1n1", 503)
+    calendar_server.fail("cita2n2", 404)
+    results = batch_calendar_operations(DOCTOR, _inserts(3), max_attempts=3)
+
+    # El segundo lote solo lleva la operación con error transitorio
+    assert calendar_server.batches == [["cita0n0", "cita1n1", "cita2n2"], ["cita1n1"]]
+    assert [result.ok for result in results] == [True, True, False]
+    assert not results[2].retryable
+    assert "Fallo programado" in results[2].error
+    assert sorted(calendar_server.events) == ["cita0n0", "cita1n1"]
+
+
+def test_conflict_on_retry_reads_the_existing_event(calendar_server):
+    operations = _inserts(2)
+    batch_calendar_operations(DOCTOR, operations[:1])
+    calendar_server.batches.clear()
+
+    results = batch_calendar_operations(DOCTOR, operations)
+    # El 409 del evento ya creado se resuelve con un get en el mismo intento
+    assert calendar_server.batches == [["cita0n0", "cita1n1"], ["cita0n0"]]
+    assert calendar_server.calls[-1] == ("GET", "cita0n0")
+    assert all(result.ok for result in results)
+    assert results[0].event["id"] == "cita0n0"
+
+
+def test_large_agendas_are_split_at_the_batch_limit(calendar_server, monkeypatch):
+    monkeypatch.setattr(servicios_meet_calendar.settings, "GOOGLE_BATCH_MAX_SIZE", 2)
+    results = batch_calendar_operations(DOCTOR, _inserts(5))
+
+    assert [len(batch) for batch in calendar_server.batches] == [2, 2, 1]
+    assert all(result.ok for result in results)
+
+
+def test_outbox_entries_of_one_doctor_share_a_batch(db, calendar_server):
+    (doctor_id,), patient_id = add_users(db)
+    for index in range(3):
+        start = START + timedelta(minutes=30 * index)
+        appointment = Appointment(
+            patient_id=patient_id, doctor_id=doctor_id, start_time=start, end_time=start + timedelta(minutes=30),
+            priority_level=PriorityLevel.MEDIUM, status=AppointmentStatus.CONFIRMED,
+        )
+        calendar_outbox.enqueue_calendar_event(db, appointment, f"Consulta {index}", None, "patient@example.com")
+    db.commit()
+    calendar_server.fail("cita1n1", 503)
+
+    worker = calendar_outbox.CalendarOutboxWorker(
+        concurrency=1, batch_size=10, poll_seconds=1, max_attempts=3, lease_seconds=60,
+    )
+    for entry_ids in worker._claim_due().values():
+        worker._process(entry_ids)
+
+    # Un solo intento por lote: la entrada fallida vuelve a la cola del outbox
+    assert calendar_server.batches == [["cita1n1", "cita2n2", "cita3n3"]]
+    statuses = dict(db.query(CalendarOutbox.id, CalendarOutbox.status).all())
+    assert statuses == {1: CalendarOutboxStatus.PENDING, 2: CalendarOutboxStatus.DONE, 3: CalendarOutboxStatus.DONE}
+    assert db.get(Appointment, 2).video_url == "https://meet.example.com/cita2n2"
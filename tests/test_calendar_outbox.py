@@ -0,0 +1,149 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from app.config import settings
+from app.models.appointment import Appointment, AppointmentStatus, PriorityLevel
+from app.models.calendar_outbox import CalendarOutbox, CalendarOutboxStatus
+from app.models.user import User
+from app.utils import calendar_outbox
+from app.utils.calendar_outbox import CalendarOutboxWorker, event_id_for
+from tests.conftest import add_users, register
+
+CREATE = "/api/v1/auth/auth/appointments/create"
+START = datetime(2030, 1, 7, 10, 0)
+LEASE_SECONDS = 60
+MAX_ATTEMPTS = 3
+
+
+def _worker() -> CalendarOutboxWorker:
+    return CalendarOutboxWorker(
+        concurrency=1, batch_size=10, poll_seconds=1, max_attempts=MAX_ATTEMPTS, lease_seconds=LEASE_SECONDS,
+    )
+
+
+def _run_once(worker: CalendarOutboxWorker) -> dict:
+    """Una vuelta del bucle del worker, sin asyncio: toma las entradas vencidas y las procesa."""
+    claimed = worker._claim_due()
+    for entry_ids in claimed.values():
+        worker._process(entry_ids)
+    return claimed
+
+
+@pytest.fixture
+def entry(db):
+    """Entrada pendiente de una cita confirmada; devuelve (id de la entrada, id del evento)."""
+    (doctor_id,), patient_id = add_users(db)
+    appointment = Appointment(
+        patient_id=patient_id, doctor_id=doctor_id, start_time=START, end_time=START + timedelta(minutes=30),
+        priority_level=PriorityLevel.MEDIUM, status=AppointmentStatus.CONFIRMED,
+    )
+    outbox_entry = calendar_outbox.enqueue_calendar_event(db, appointment, "Consulta", None, "patient@example.com")
+    db.commit()
+    return outbox_entry.id, event_id_for(outbox_entry)
+
+
+def test_entry_is_enqueued_with_the_appointment_commit(client, db, calendar_server):
+    doctor = register(client, "doctor@example.com", "Doctor")
+    db.execute(User.__table__.update().values(google_refresh_token="refresh"))
+    db.commit()
+    body = {"patient_email": "patient@example.com", "start_time": START.isoformat(),
+            "end_time": (START + timedelta(minutes=30)).isoformat()}
+
+    response = client.post(CREATE, json=body, headers=doctor)
+    assert response.status_code == 202, response.text
+    appointment_id = response.json()["appointment_id"]
+    # La cita solapada se revierte junto con su entrada del outbox
+    assert client.post(CREATE, json=body, headers=doctor).status_code == 409
+    assert db.scalar(select(func.count()).select_from(CalendarOutbox)) == 1
+    assert calendar_server.calls == []
+
+    _run_once(_worker())
+
+    (event_id, event), = calendar_server.events.items()
+    status = client.get(f"/api/v1/auth/auth/appointments/{appointment_id}/calendar", headers=doctor).json()
+    assert status["calendar_status"] == CalendarOutboxStatus.DONE.value
+    assert status["attempts"] == 1
+    assert status["meet_url"] == f"https://meet.example.com/{event_id}"
+    assert event["attendees"][1]["email"] == "patient@example.com"
+
+
+def test_expired_lease_is_reclaimed_without_duplicating_the_event(db, calendar_server, entry):
+    entry_id, event_id = entry
+    worker = _worker()
+    assert _run_once(worker) != {}
+    row = db.get(CalendarOutbox, entry_id)
+    assert row.status == CalendarOutboxStatus.DONE
+
+    # Un worker que murió tras crear el evento deja la entrada tomada
+    row.status = CalendarOutboxStatus.IN_PROGRESS
+    row.locked_at = datetime.utcnow()
+    db.commit()
+    assert _run_once(worker) == {}
+
+    row.locked_at = datetime.utcnow() - timedelta(seconds=LEASE_SECONDS + 1)
+    db.commit()
+    assert list(_run_once(worker).values()) == [[entry_id]]
+
+    db.refresh(row)
+    assert row.status == CalendarOutboxStatus.DONE
+    # El reintento con el mismo id recibe un 409 y lee el evento existente
+    assert calendar_server.calls == [("POST", event_id), ("POST", event_id), ("GET", event_id)]
+    assert list(calendar_server.events) == [event_id]
+
+
+def test_transient_errors_back_off_exponentially(db, calendar_server, entry):
+    entry_id, event_id = entry
+    calendar_server.fail(event_id, 503, 503)
+    worker = _worker()
+    base = settings.CALENDAR_OUTBOX_BACKOFF_BASE_SECONDS
+
+    for attempt in (1, 2):
+        before = datetime.utcnow()
+        assert list(_run_once(worker).values()) == [[entry_id]]
+        after = datetime.utcnow()
+        row = db.get(CalendarOutbox, entry_id)
+        db.refresh(row)
+        delay = base * 2 ** (attempt - 1)
+        assert row.status == CalendarOutboxStatus.PENDING
+        assert row.attempts == attempt
+        assert before + timedelta(seconds=delay * 0.5) <= row.next_attempt_at <= after + timedelta(seconds=delay)
+        assert "Fallo programado" in row.last_error
+
+        # No se vuelve a tomar antes de que venza la espera
+        assert _run_once(worker) == {}
+        row.next_attempt_at = datetime.utcnow()
+        db.commit()
+
+    _run_once(worker)
+    db.refresh(row)
+    assert row.status == CalendarOutboxStatus.DONE
+    assert row.attempts == 3
+    assert worker.stats()["retried"] == 2
+
+
+@pytest.mark.parametrize("status_codes, attempts", [
+    ((503,) * MAX_ATTEMPTS, MAX_ATTEMPTS),
+    # Un 403 sin motivo de cuota no es reintentable: falla al primer intento
+    ((403,), 1),
+])
+def test_entry_fails_after_max_attempts_or_permanent_error(db, calendar_server, entry, status_codes, attempts):
+    entry_id, event_id = entry
+    calendar_server.fail(event_id, *status_codes)
+    worker = _worker()
+
+    for _ in range(attempts):
+        assert list(_run_once(worker).values()) == [[entry_id]]
+        db.execute(CalendarOutbox.__table__.update().values(next_attempt_at=datetime.utcnow()))
+        db.commit()
+
+    row = db.get(CalendarOutbox, entry_id)
+    assert row.status == CalendarOutboxStatus.FAILED
+    assert row.attempts == attempts
+    assert _run_once(worker) == {}
+    assert calendar_server.calls == [("POST", event_id)] * attempts
+    assert calendar_server.events == {}
+    assert worker.stats()["failed"] == 1
+    assert worker.stats()["retried"] == attempts - 1
+
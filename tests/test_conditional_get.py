@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from tests.conftest import captured_appointment_queries, captured_queries, register
+
+MY = "/api/v1/appointments/citas/my"
+START = datetime(2030, 1, 7, 9, 0)
+
+
+@pytest.fixture
+def patient(client):
+    register(client, "doctor@example.com", "Doctor")
+    return register(client, "patient@example.com", "Paciente")
+
+
+def _book(client, headers: dict, offset: int) -> None:
+    start = START + timedelta(minutes=30 * offset)
+    response = client.post("/api/v1/appointments/citas/", headers=headers, json={
+        "start_time": start.isoformat(),
+        "end_time": (start + timedelta(minutes=30)).isoformat(),
+        "is_virtual": True,
+        "priority_level": "Media",
+    })
+    assert response.status_code == 201, response.text
+
+
+def test_poll_storm_collapses_to_version_lookups(client, patient):
+    _book(client, patient, 0)
+    _book(client, patient, 1)
+    etag = client.get(MY, headers=patient).headers["ETag"]
+
+    with captured_appointment_queries() as appointment_queries, captured_queries() as queries:
+        for _ in range(50):
+            response = client.get(MY, headers={**patient, "If-None-Match": etag})
+            assert response.status_code == 304
+            assert response.headers["ETag"] == etag
+    # Cada 304 se resuelve con la versión de la agenda: ni una lectura de appointments
+    assert appointment_queries == []
+    assert len(queries) == 50
+    assert all("FROM agenda_versions" in statement for statement, _ in queries)
+
+
+def test_etag_revalidation_sees_a_change_in_the_same_second(client, patient):
+    _book(client, patient, 0)
+    first = client.get(MY, headers=patient)
+    assert client.get(MY, headers={**patient, "If-None-Match": first.headers["ETag"]}).status_code == 304
+
+    _book(client, patient, 1)
+    second = client.get(MY, headers={**patient, "If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 200
+    assert len(second.json()) == 2
+    assert second.headers["ETag"] != first.headers["ETag"]
+
+
+def test_if_modified_since_alone_never_returns_304(client, patient):
+    _book(client, patient, 0)
+    first = client.get(MY, headers=patient)
+    assert "Last-Modified" in first.headers
+
+    # Segundo cambio dentro del mismo segundo que Last-Modified
+    _book(client, patient, 1)
+    response = client.get(MY, headers={**patient, "If-Modified-Since": first.headers["Last-Modified"]})
+    assert response.status_code == 200
+    assert len(response.json()) == 2
+
+
+def test_validators_from_another_page_do_not_match(client, patient):
+    _book(client, patient, 0)
+    _book(client, patient, 1)
+    first_page = client.get(MY, params={"limit": 1}, headers=patient)
+    other_filter = client.get(MY, params={"priority": "Media"}, headers=patient)
+    assert first_page.headers["ETag"] != other_filter.headers["ETag"]
+
+    for validators in (
+        {"If-None-Match": first_page.headers["ETag"]},
+        {"If-Modified-Since": first_page.headers["Last-Modified"]},
+    ):
+        response = client.get(MY, params={"priority": "Media"}, headers={**patient, **validators})
+        assert response.status_code == 200
+        assert len(response.json()) == 2
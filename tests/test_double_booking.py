@@ -0,0 +1,136 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from sqlalchemy import func, select, update
+
+from app.database import SessionLocal
+from app.models.appointment import ACTIVE_STATUSES, Appointment, AppointmentStatus, PriorityLevel
+from app.models.user import User
+from app.utils.principal_cache import principal_cache
+from app.utils.scheduling import is_booking_conflict
+from tests.conftest import add_users, race, register
+
+# Reservas concurrentes del mismo horario contra SQLite: la restricción de
+# solapamiento (triggers) debe dejar pasar exactamente una. La variante `heavy`
+# lanza 1.000 reservas a la vez y exige un mínimo de reservas resueltas por segundo
+# (se excluye con `-m "not heavy"`).
+
+WORKERS = 32
+SLOT_START = datetime(2030, 1, 7, 10, 0)
+SLOT_END = SLOT_START + timedelta(minutes=30)
+
+
+def _active_in_slot(db, doctor_id: int) -> int:
+    return db.scalar(select(func.count()).select_from(Appointment).where(
+        Appointment.doctor_id == doctor_id,
+        Appointment.status.in_(ACTIVE_STATUSES),
+        Appointment.start_time < SLOT_END,
+        Appointment.end_time > SLOT_START,
+    ))
+
+
+def test_concurrent_inserts_of_the_same_slot_commit_once(db):
+    (doctor_id,), patient_id = add_users(db)
+
+    def book(index: int) -> None:
+        with SessionLocal() as session:
+            session.add(Appointment(
+                patient_id=patient_id, doctor_id=doctor_id, start_time=SLOT_START, end_time=SLOT_END,
+                priority_level=PriorityLevel.MEDIUM, status=AppointmentStatus.CONFIRMED,
+            ))
+            session.commit()
+
+    errors = race(book, WORKERS)
+    assert errors.count(None) == 1
+    assert all(is_booking_conflict(error) for error in errors if error is not None), errors
+    assert _active_in_slot(db, doctor_id) == 1
+
+
+def test_concurrent_reschedules_into_the_same_slot_commit_once(db):
+    (doctor_id,), patient_id = add_users(db)
+    # Una cita por hilo, cada una en un horario distinto de días anteriores
+    appointments = [
+        Appointment(
+            patient_id=patient_id, doctor_id=doctor_id,
+            start_time=SLOT_START - timedelta(days=index + 1), end_time=SLOT_END - timedelta(days=index + 1),
+            priority_level=PriorityLevel.MEDIUM, status=AppointmentStatus.CONFIRMED,
+        )
+        for index in range(WORKERS)
+    ]
+    db.add_all(appointments)
+    db.commit()
+    ids = [appointment.id for appointment in appointments]
+
+    def reschedule(index: int) -> None:
+        with SessionLocal() as session:
+            session.execute(
+                update(Appointment).where(Appointment.id == ids[index]).values(start_time=SLOT_START, end_time=SLOT_END)
+            )
+            session.commit()
+
+    errors = race(reschedule, WORKERS)
+    assert errors.count(None) == 1
+    assert all(is_booking_conflict(error) for error in errors if error is not None), errors
+    assert _active_in_slot(db, doctor_id) == 1
+
+
+def test_concurrent_requests_for_the_same_slot_get_one_success_and_409s(client, db):
+    doctor = register(client, "doctor@example.com", "Doctor")
+    register(client, "patient@example.com", "Paciente")
+    db.execute(update(User).where(User.email == "doctor@example.com").values(google_refresh_token="refresh"))
+    db.commit()
+    principal_cache.clear()
+
+    def book(index: int) -> None:
+        response = client.post("/api/v1/auth/auth/appointments/create", headers=doctor, json={
+            "patient_email": "patient@example.com",
+            "start_time": SLOT_START.isoformat(),
+            "end_time": SLOT_END.isoformat(),
+        })
+        if response.status_code != 202:
+            raise AssertionError(response.status_code, response.text)
+
+    errors = race(book, WORKERS // 2)
+    assert errors.count(None) == 1
+    assert all(error.args[0] == 409 for error in errors if error is not None), errors
+    doctor_id = db.scalar(select(User.id).where(User.email == "doctor@example.com"))
+    assert _active_in_slot(db, doctor_id) == 1
+
+
+HEAVY_BOOKINGS = 1000
+HEAVY_SLOTS = 20
+# Reservas resueltas por segundo (éxitos y conflictos) como mínimo
+HEAVY_MIN_THROUGHPUT = 200
+
+
+@pytest.mark.heavy
+def test_thousand_parallel_bookings_leave_no_overlaps(db):
+    doctor_ids, patient_id = add_users(db, doctors=2)
+
+    def book(index: int) -> None:
+        start = SLOT_START + timedelta(minutes=30 * (index % HEAVY_SLOTS))
+        with SessionLocal() as session:
+            session.add(Appointment(
+                patient_id=patient_id, doctor_id=doctor_ids[index // HEAVY_SLOTS % 2], start_time=start,
+                end_time=start + timedelta(minutes=30),
+                priority_level=PriorityLevel.MEDIUM, status=AppointmentStatus.CONFIRMED,
+            ))
+            session.commit()
+
+    started = time.perf_counter()
+    errors = race(book, HEAVY_BOOKINGS)
+    elapsed = time.perf_counter() - started
+
+    assert all(is_booking_conflict(error) for error in errors if error is not None), errors
+    # Una reserva por doctor y slot, sin solapes
+    assert errors.count(None) == HEAVY_SLOTS * len(doctor_ids)
+    for doctor_id in doctor_ids:
+        booked = db.execute(
+            select(Appointment.start_time, Appointment.end_time)
+            .where(Appointment.doctor_id == doctor_id, Appointment.status.in_(ACTIVE_STATUSES))
+            .order_by(Appointment.start_time)
+        ).all()
+        assert all(previous.end_time <= current.start_time for previous, current in zip(booked, booked[1:]))
+    assert HEAVY_BOOKINGS / elapsed >= HEAVY_MIN_THROUGHPUT, f"{HEAVY_BOOKINGS / elapsed:.0f} reservas/s"
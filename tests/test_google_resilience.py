@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.excepciones import GoogleThrottledError, GoogleUnavailableError
+from app.models.appointment import Appointment, AppointmentStatus, PriorityLevel
+from app.models.calendar_outbox import CalendarOutbox, CalendarOutboxStatus
+from app.models.user import User, UserRole
+from app.utils import calendar_outbox, google_tokens
+from app.utils.resilience import CircuitBreaker
+
+START = datetime(2030, 1, 7, 10, 0)
+MAX_ATTEMPTS = 3
+
+
+def test_unexpected_refresh_error_releases_the_half_open_probe(monkeypatch):
+    breaker = CircuitBreaker(name="test", failure_threshold=1, recovery_seconds=0)
+    breaker.record_failure()
+    monkeypatch.setattr(google_tokens, "token_refresh_breaker", breaker)
+
+    def broken_refresh(refresh_token):
+        raise ValueError("respuesta inesperada")
+
+    monkeypatch.setattr(google_tokens, "refresh_credentials", broken_refresh)
+    cache = google_tokens.GoogleCredentialsCache(max_entries=10, refresh_margin_seconds=60)
+    with pytest.raises(ValueError):
+        cache._refresh(1, "refresh")
+    # El fallo se registró: el breaker vuelve a admitir una llamada de prueba
+    assert breaker.allow()
+
+
+@pytest.fixture
+def claimed_entry(db):
+    doctor = User(email="doc@example.com", role=UserRole.DOCTOR, google_refresh_token="refresh")
+    patient = User(email="patient@example.com", role=UserRole.PATIENT)
+    db.add_all([doctor, patient])
+    db.flush()
+    appointment = Appointment(
+        patient_id=patient.id, doctor_id=doctor.id, start_time=START, end_time=START + timedelta(minutes=30),
+        priority_level=PriorityLevel.MEDIUM, status=AppointmentStatus.CONFIRMED,
+    )
+    entry = calendar_outbox.enqueue_calendar_event(db, appointment, "Consulta", None, "patient@example.com")
+    entry.status = CalendarOutboxStatus.IN_PROGRESS
+    entry.attempts = MAX_ATTEMPTS - 1
+    entry.locked_at = datetime.utcnow()
+    db.commit()
+    return entry.id
+
+
+@pytest.mark.parametrize("error", [
+    GoogleThrottledError("Límite alcanzado.", retry_after_seconds=30),
+    GoogleUnavailableError("Breaker abierto.", retry_after_seconds=30),
+])
+def test_throttled_entries_are_rescheduled_without_spending_attempts(db, monkeypatch, claimed_entry, error):
+    def refuse(**kwargs):
+        raise error
+
+    monkeypatch.setattr(calendar_outbox, "create_google_calendar_event", refuse)
+    worker = calendar_outbox.CalendarOutboxWorker(
+        concurrency=1, batch_size=10, poll_seconds=1, max_attempts=MAX_ATTEMPTS, lease_seconds=60,
+    )
+    before = datetime.utcnow()
+    worker._process([claimed_entry])
+
+    entry = db.get(CalendarOutbox, claimed_entry)
+    assert entry.status == CalendarOutboxStatus.PENDING
+    assert entry.attempts == MAX_ATTEMPTS - 1
+    assert entry.next_attempt_at >= before + timedelta(seconds=30)
+    assert worker.stats()["deferred"] == 1
+    assert worker.stats()["failed"] == 0
+
+
+def test_refresh_locks_do_not_grow_with_the_number_of_doctors():
+    cache = google_tokens.GoogleCredentialsCache(max_entries=10, refresh_margin_seconds=60, lock_stripes=8)
+    locks = {id(cache._lock_for(doctor_id)) for doctor_id in range(10000)}
+    assert len(locks) == 8
+    assert cache._lock_for(42) is cache._lock_for(42)
@@ -0,0 +1,143 @@
+import json
+import threading
+import time
+from collections import Counter
+from urllib.parse import parse_qs
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from app.excepciones import GoogleCalendarError, GoogleUnavailableError
+from app.utils import google_tokens, resilience
+from app.utils.resilience import CircuitBreaker
+from tests.conftest import race
+
+THRESHOLD = 3
+
+
+class FakeTokenEndpoint(BaseAdapter):
+    """
+    Endpoint de tokens de Google simulado sobre el transporte de requests:
+    cuenta las peticiones por refresh token y cuántas hay en curso a la vez.
+    mode: "ok" (token nuevo), "revoked" (invalid_grant) o "down" (error de conexión).
+    """
+
+    def __init__(self, delay: float = 0.0):
+        super().__init__()
+        self.mode = "ok"
+        self.delay = delay
+        self.calls: Counter = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        body = request.body.decode() if isinstance(request.body, bytes) else request.body
+        refresh_token = parse_qs(body)["refresh_token"][0]
+        with self._lock:
+            self.calls[refresh_token] += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            if self.mode == "down":
+                raise requests.ConnectionError("sin conexión")
+            if self.mode == "revoked":
+                return self._response(request, 400, {"error": "invalid_grant", "error_description": "Token revocado."})
+            return self._response(request, 200, {
+                "access_token": f"access-{refresh_token}-{self.calls[refresh_token]}",
+                "expires_in": 3600,
+                "token_type": "Bearer",
+            })
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    @staticmethod
+    def _response(request, status_code: int, payload: dict) -> requests.Response:
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers["Content-Type"] = "application/json"
+        response._content = json.dumps(payload).encode()
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    fake = FakeTokenEndpoint(delay=0.05)
+    session = requests.Session()
+    session.mount(google_tokens.CLIENT_CONFIG["web"]["token_uri"], fake)
+    monkeypatch.setattr(google_tokens, "_http_session", session)
+    monkeypatch.setattr(google_tokens, "_auth_request", None)
+    monkeypatch.setattr(google_tokens, "token_refresh_breaker", CircuitBreaker(
+        name="test", failure_threshold=THRESHOLD, recovery_seconds=30,
+    ))
+    return fake
+
+
+def _cache(lock_stripes: int = 64) -> google_tokens.GoogleCredentialsCache:
+    return google_tokens.GoogleCredentialsCache(max_entries=100, refresh_margin_seconds=60, lock_stripes=lock_stripes)
+
+
+def test_concurrent_requests_for_one_doctor_refresh_once(endpoint):
+    cache = _cache()
+    tokens = []
+    errors = race(lambda index: tokens.append(cache.get(7, "refresh-7").token), 16)
+
+    assert errors == [None] * 16
+    assert endpoint.calls == {"refresh-7": 1}
+    assert set(tokens) == {"access-refresh-7-1"}
+    assert cache.stats()["refreshes"] == 1
+
+
+def test_doctors_on_different_stripes_refresh_in_parallel(endpoint):
+    cache = _cache(lock_stripes=2)
+    # 1 y 2 caen en franjas distintas: sus refrescos se solapan
+    race(lambda index: cache.get(index + 1, f"refresh-{index + 1}"), 2)
+    assert endpoint.max_in_flight == 2
+
+    # 3 y 5 comparten franja con 1: se refrescan de uno en uno
+    endpoint.max_in_flight = 0
+    race(lambda index: cache.get(3 + 2 * index, f"refresh-{3 + 2 * index}"), 2)
+    assert endpoint.max_in_flight == 1
+    assert endpoint.calls == {f"refresh-{doctor_id}": 1 for doctor_id in (1, 2, 3, 5)}
+
+
+def test_breaker_opens_after_transport_failures_and_recovers(endpoint, monkeypatch):
+    cache = _cache()
+    endpoint.mode = "down"
+    for doctor_id in range(THRESHOLD):
+        with pytest.raises(GoogleCalendarError) as error:
+            cache.get(doctor_id, f"refresh-{doctor_id}")
+        assert error.value.retryable
+
+    # Abierto: se responde sin llamar a Google
+    with pytest.raises(GoogleUnavailableError) as error:
+        cache.get(99, "refresh-99")
+    assert error.value.retry_after_seconds > 0
+    assert "refresh-99" not in endpoint.calls
+    assert google_tokens.token_refresh_breaker.stats()["state"] == CircuitBreaker.OPEN
+
+    # Pasado el tiempo de recuperación, una llamada de prueba con éxito lo cierra
+    endpoint.mode = "ok"
+    real_monotonic = time.monotonic
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: real_monotonic() + 31)
+    assert cache.get(99, "refresh-99").token == "access-refresh-99-1"
+    assert google_tokens.token_refresh_breaker.stats()["state"] == CircuitBreaker.CLOSED
+
+
+def test_revoked_refresh_token_does_not_open_the_breaker(endpoint):
+    cache = _cache()
+    endpoint.mode = "revoked"
+    for _ in range(THRESHOLD + 1):
+        assert cache.get(7, "refresh-7") is None
+
+    assert endpoint.calls == {"refresh-7": THRESHOLD + 1}
+    assert google_tokens.token_refresh_breaker.stats()["state"] == CircuitBreaker.CLOSED
+    assert cache.stats()["failures"] == THRESHOLD + 1
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import InvalidRequestError
+
+from app.models.appointment import Appointment, AppointmentStatus, PriorityLevel
+from app.models.clinical_record import ClinicalRecord
+from app.models.user import User
+from app.utils.loading_profiles import loading_options
+from tests.conftest import add_users, captured_queries
+
+START = datetime(2030, 1, 7, 8, 0)
+
+
+@pytest.fixture
+def users(db):
+    """Un doctor y un paciente con tres citas y un registro clínico."""
+    (doctor_id,), patient_id = add_users(db)
+    db.add_all([
+        Appointment(patient_id=patient_id, doctor_id=doctor_id, start_time=START + timedelta(hours=index),
+                    end_time=START + timedelta(hours=index, minutes=30), priority_level=PriorityLevel.MEDIUM,
+                    status=AppointmentStatus.CONFIRMED)
+        for index in range(3)
+    ])
+    db.add(ClinicalRecord(patient_id=patient_id, doctor_id=doctor_id, notes="Control"))
+    db.commit()
+    db.expunge_all()
+    return doctor_id, patient_id
+
+
+def _load(db, user_id: int, profile: str) -> tuple:
+    with captured_queries() as statements:
+        user = db.execute(select(User).where(User.id == user_id).options(*loading_options(profile))).scalar_one()
+    return user, len(statements)
+
+
+def test_patient_dashboard_preloads_appointments_and_records(db, users):
+    _, patient_id = users
+    patient, queries = _load(db, patient_id, "patient-dashboard")
+    # Usuario + una consulta selectin por relación
+    assert queries == 3
+    with captured_queries() as statements:
+        assert len(patient.patient_appointments) == 3
+        assert [record.notes for record in patient.patient_records] == ["Control"]
+    assert statements == []
+    with pytest.raises(InvalidRequestError):
+        patient.doctor_appointments
+
+
+def test_doctor_agenda_preloads_only_assigned_appointments(db, users):
+    doctor_id, _ = users
+    doctor, queries = _load(db, doctor_id, "doctor-agenda")
+    assert queries == 2
+    with captured_queries() as statements:
+        assert len(doctor.doctor_appointments) == 3
+    assert statements == []
+    with pytest.raises(InvalidRequestError):
+        doctor.doctor_records
+
+
+def test_unknown_profile_is_rejected():
+    with pytest.raises(ValueError):
+        loading_options("dashboard")
@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+from app.utils import security
+from app.utils.cache import RedisCacheBackend
+from tests.conftest import register
+
+LOGOUT = "/api/v1/auth/auth/logout"
+MY = "/api/v1/appointments/citas/my"
+
+
+class FakeRedis:
+    """Cliente mínimo compatible con Redis (get/setex/delete/scan_iter), compartido entre "workers"."""
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        value = self.values.get(key)
+        return None if value is None or value[1] < time.time() else value[0]
+
+    def setex(self, key, ttl, value):
+        self.values[key] = (value, time.time() + ttl)
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def scan_iter(self, pattern):
+        return [key for key in list(self.values) if key.startswith(pattern.rstrip("*"))]
+
+
+def test_logout_revokes_only_the_token_used(client):
+    headers = register(client, "patient@example.com", "Paciente")
+    response = client.post("/api/v1/auth/auth/login", json={"email": "patient@example.com", "password": "pw"})
+    other_device = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert client.get(MY, headers=headers).status_code == 200
+
+    assert client.post(LOGOUT, headers=headers).status_code == 204
+    assert client.get(MY, headers=headers).status_code == 401
+    assert client.post(LOGOUT, headers=headers).status_code == 401
+    # El otro inicio de sesión (emitido en el mismo segundo) sigue siendo válido
+    assert client.get(MY, headers=other_device).status_code == 200
+
+
+def test_revocations_are_shared_through_redis(client, monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr(security, "_revoked_tokens", RedisCacheBackend(redis, prefix="revoked_token", ttl_seconds=60))
+    headers = register(client, "patient@example.com", "Paciente")
+    token = headers["Authorization"].removeprefix("Bearer ")
+    assert client.get(MY, headers=headers).status_code == 200
+
+    assert client.post(LOGOUT, headers=headers).status_code == 204
+    (key, (_, expires_at)), = redis.values.items()
+    assert key == f"revoked_token:{security._token_digest(token)}"
+    # La revocación dura lo que le quedaba al token
+    assert expires_at == pytest.approx(security.jwt.get_unverified_claims(token)["exp"], abs=2)
+
+    # Otro worker (caché de tokens verificados propia) consulta el mismo Redis
+    security._verified_tokens.clear()
+    assert security.decode_access_token(token) is None
+    assert client.get(MY, headers=headers).status_code == 401
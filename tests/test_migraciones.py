@@ -0,0 +1,102 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.migraciones import upgrade_schema
+from app.models.appointment import Appointment
+
+# Esquema de la versión original (lo que create_all dejó en las bases existentes)
+ORIGINAL_SCHEMA = (
+    """CREATE TABLE users (
+        id INTEGER NOT NULL PRIMARY KEY, full_name VARCHAR, email VARCHAR, hashed_password VARCHAR,
+        role VARCHAR(7), is_active BOOLEAN, google_refresh_token TEXT
+    )""",
+    "CREATE INDEX ix_users_id ON users (id)",
+    "CREATE INDEX ix_users_full_name ON users (full_name)",
+    "CREATE UNIQUE INDEX ix_users_email ON users (email)",
+    """CREATE TABLE appointments (
+        id INTEGER NOT NULL PRIMARY KEY, patient_id INTEGER REFERENCES users (id),
+        doctor_id INTEGER REFERENCES users (id), start_time DATETIME, end_time DATETIME, is_virtual BOOLEAN,
+        priority_level VARCHAR(6), status VARCHAR(9), video_url TEXT, notes TEXT, created_at DATETIME
+    )""",
+    "CREATE INDEX ix_appointments_id ON appointments (id)",
+    "CREATE INDEX ix_appointments_patient_id ON appointments (patient_id)",
+    "CREATE INDEX ix_appointments_doctor_id ON appointments (doctor_id)",
+)
+INSERT = text(
+    "INSERT INTO appointments (patient_id, doctor_id, start_time, end_time, is_virtual, priority_level, status) "
+    "VALUES (2, 1, :start, :end, 1, 'MEDIUM', :status)"
+)
+
+
+def _schema(engine) -> dict:
+    """Tablas, columnas, índices y triggers de una base, para comparar esquemas."""
+    inspector = inspect(engine)
+    with engine.connect() as connection:
+        triggers = connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'")).scalars().all()
+    return {
+        "tables": sorted(inspector.get_table_names()),
+        "appointment_columns": sorted(
+            (column["name"], column["nullable"]) for column in inspector.get_columns("appointments")
+        ),
+        "appointment_indexes": sorted(index["name"] for index in inspector.get_indexes("appointments")),
+        "triggers": sorted(triggers),
+    }
+
+
+@pytest.fixture
+def original_engine(tmp_path):
+    """Base SQLite con el esquema original, dos usuarios y una cita."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'original.db'}")
+    with engine.begin() as connection:
+        for statement in ORIGINAL_SCHEMA:
+            connection.exec_driver_sql(statement)
+        connection.exec_driver_sql("INSERT INTO users (id, email, role) VALUES (1, 'doc@example.com', 'DOCTOR'), "
+                                   "(2, 'patient@example.com', 'PATIENT')")
+        connection.execute(INSERT, {"start": datetime(2030, 1, 7, 10), "end": datetime(2030, 1, 7, 10, 30),
+                                    "status": "CONFIRMED"})
+    yield engine
+    engine.dispose()
+
+
+def test_upgrade_brings_an_original_database_to_the_current_schema(original_engine, tmp_path):
+    applied = upgrade_schema(original_engine)
+    assert "columna appointments.version añadida" in applied
+    assert "protección contra solapamientos añadida" in applied
+
+    fresh = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    Base.metadata.create_all(fresh)
+    assert _schema(original_engine) == _schema(fresh)
+    fresh.dispose()
+
+    # Idempotente: una segunda ejecución no tiene nada que hacer
+    assert upgrade_schema(original_engine) == []
+
+    with Session(original_engine) as session:
+        appointment = session.get(Appointment, 1)
+        assert appointment.version == 1
+        appointment.notes = "Actualizada"
+        session.commit()
+        assert appointment.version == 2
+
+    with pytest.raises(IntegrityError, match="appointment_overlap"), original_engine.begin() as connection:
+        connection.execute(INSERT, {"start": datetime(2030, 1, 7, 10, 15), "end": datetime(2030, 1, 7, 10, 45),
+                                    "status": "REQUESTED"})
+
+
+def test_upgrade_aborts_before_any_change_if_appointments_already_overlap(original_engine):
+    with original_engine.begin() as connection:
+        connection.execute(INSERT, {"start": datetime(2030, 1, 7, 10, 15), "end": datetime(2030, 1, 7, 10, 45),
+                                    "status": "REQUESTED"})
+        # Las canceladas no ocupan agenda
+        connection.execute(INSERT, {"start": datetime(2030, 1, 7, 10), "end": datetime(2030, 1, 7, 10, 30),
+                                    "status": "CANCELLED"})
+    before = _schema(original_engine)
+
+    with pytest.raises(RuntimeError, match=r"\(ids 1/2\)"):
+        upgrade_schema(original_engine)
+    assert _schema(original_engine) == before
@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from app import database
+from app.config import settings
+
+
+def test_metrics_require_the_configured_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-secret")
+    assert client.get("/metrics/pool").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer otro"}).status_code == 401
+    response = client.get("/metrics/pool", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
+    assert "checkout_wait_seconds" in response.json()
+
+
+def test_metrics_without_token_are_only_served_to_loopback(client, monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "")
+    # El TestClient se presenta como el host "testclient"
+    assert client.get("/metrics/pool").status_code == 403
+    with TestClient(main.app, client=("127.0.0.1", 50000)) as local:
+        assert local.get("/metrics/pool").status_code == 200
+
+
+def test_liveness_checks_survive_unexpected_errors(monkeypatch):
+    calls = []
+
+    def check() -> None:
+        calls.append(None)
+        if len(calls) == 1:
+            raise ValueError("fallo inesperado")
+        if len(calls) == 3:
+            raise asyncio.CancelledError
+
+    monkeypatch.setattr(database, "_check_sync_pool", check)
+    monkeypatch.setattr(database, "async_engine", None)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(database.run_pool_liveness_checks(0))
+    assert len(calls) == 3
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from app.database import engine
+from app.models.appointment import Appointment, AppointmentStatus, PriorityLevel
+from tests.conftest import register
+
+START = datetime(2030, 1, 7, 8, 0)
+MY = "/api/v1/appointments/citas/my"
+
+
+def _seed(patient_id: int, doctor_id: int, starts) -> None:
+    rows = [
+        {
+            "patient_id": patient_id, "doctor_id": doctor_id,
+            "start_time": start, "end_time": start and start + timedelta(minutes=30),
+            "priority_level": PriorityLevel.MEDIUM, "status": AppointmentStatus.CONFIRMED, "version": 1,
+        }
+        for start in starts
+    ]
+    with engine.begin() as connection:
+        connection.execute(insert(Appointment), rows)
+
+
+def test_keyset_pages_skip_appointments_without_start_time(client):
+    patient = register(client, "patient@example.com", "Paciente")
+    register(client, "doctor@example.com", "Doctor")
+    # Filas heredadas sin fecha: en SQLite ordenan antes que cualquier fecha
+    _seed(1, 2, [None, None] + [START + timedelta(hours=index) for index in range(5)])
+
+    seen, cursor = [], None
+    while True:
+        url = f"{MY}?limit=2" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url, headers=patient)
+        assert response.status_code == 200, response.text
+        seen.extend(item["start_time"] for item in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert seen == [(START + timedelta(hours=index)).isoformat() for index in range(5)]
@@ -0,0 +1,103 @@
+import re
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import insert
+
+from app.database import engine
+from app.models.appointment import (
+    _SQLITE_OVERLAP_CHECK, Appointment, AppointmentStatus, PriorityLevel,
+)
+from app.utils.availability import load_booked_intervals
+from app.utils.scheduling import Assignment, slot_is_free_in_db
+from tests.conftest import captured_appointment_queries, register
+
+# Regresión de planes de consulta: las consultas calientes sobre appointments deben
+# resolverse con los índices compuestos del modelo, nunca con un recorrido completo.
+
+START = datetime(2030, 1, 7, 8, 0)
+DOCTORS = 10
+
+
+@pytest.fixture
+def agenda(client):
+    """Un paciente y un doctor registrados por la API, con una agenda sembrada alrededor."""
+    patient = register(client, "patient@example.com", "Paciente")
+    doctor = register(client, "doctor@example.com", "Doctor")
+    for index in range(DOCTORS - 1):
+        register(client, f"doc{index}@example.com", "Doctor")
+    patient_id, doctor_id = 1, 2
+    rows = [
+        {
+            "patient_id": patient_id,
+            "doctor_id": 2 + index % DOCTORS,
+            "start_time": START + timedelta(minutes=30 * (index // DOCTORS)),
+            "end_time": START + timedelta(minutes=30 * (index // DOCTORS) + 30),
+            "priority_level": PriorityLevel.MEDIUM,
+            "status": (AppointmentStatus.CONFIRMED, AppointmentStatus.CANCELLED)[index % 7 == 0],
+            "version": 1,
+        }
+        for index in range(2000)
+    ]
+    with engine.begin() as connection:
+        connection.execute(insert(Appointment), rows)
+    return {"patient": patient, "doctor": doctor, "patient_id": patient_id, "doctor_id": doctor_id}
+
+
+def query_plan(statement: str, parameters) -> str:
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    return "\n".join(row[-1] for row in rows)
+
+
+def assert_uses_index(statement: str, parameters, index_name: str) -> None:
+    plan = query_plan(statement, parameters)
+    assert index_name in plan, plan
+    assert "SCAN appointments" not in plan, plan
+
+
+def test_patient_agenda_and_keyset_pages_use_patient_index(client, agenda):
+    with captured_appointment_queries() as statements:
+        first = client.get("/api/v1/appointments/citas/my?limit=20", headers=agenda["patient"])
+        cursor = first.headers["X-Next-Cursor"]
+        client.get(f"/api/v1/appointments/citas/my?limit=20&cursor={cursor}", headers=agenda["patient"])
+        client.get("/api/v1/appointments/citas/my?limit=20&date_from=2030-01-08T00:00:00", headers=agenda["patient"])
+    assert len(statements) == 3
+    for statement, parameters in statements:
+        assert_uses_index(statement, parameters, "ix_appointments_patient_start")
+
+
+def test_doctor_agenda_uses_doctor_index(client, agenda):
+    with captured_appointment_queries() as statements:
+        first = client.get("/api/v1/appointments/citas/my?limit=20", headers=agenda["doctor"])
+        cursor = first.headers["X-Next-Cursor"]
+        client.get(f"/api/v1/appointments/citas/my?limit=20&cursor={cursor}", headers=agenda["doctor"])
+    assert len(statements) == 2
+    for statement, parameters in statements:
+        assert_uses_index(statement, parameters, "ix_appointments_doctor_start")
+
+
+def test_overlap_check_uses_active_interval_index(db, agenda):
+    assignment = Assignment(agenda["doctor_id"], START + timedelta(hours=3), START + timedelta(hours=3, minutes=30))
+    with captured_appointment_queries() as statements:
+        slot_is_free_in_db(db, assignment)
+    assert len(statements) == 1
+    assert_uses_index(*statements[0], "ix_appointments_doctor_active_interval")
+
+
+def test_availability_load_uses_active_interval_index(db, agenda):
+    with captured_appointment_queries() as statements:
+        load_booked_intervals(db, list(range(2, 2 + DOCTORS)), START, START + timedelta(days=1))
+    assert len(statements) == 1
+    assert_uses_index(*statements[0], "ix_appointments_doctor_active_interval")
+
+
+def test_sqlite_overlap_trigger_probe_uses_active_interval_index(agenda):
+    # Cuerpo del trigger con los valores de NEW como parámetros
+    probe = re.search(r"\(\s*(SELECT end_time FROM appointments .*?LIMIT 1)\s*\)", _SQLITE_OVERLAP_CHECK, re.S).group(1)
+    probe = re.sub(r"NEW\.(\w+)", r":\1", probe)
+    parameters = {
+        "doctor_id": agenda["doctor_id"], "id": 0,
+        "start_time": (START + timedelta(hours=3)).isoformat(sep=" "),
+        "end_time": (START + timedelta(hours=3, minutes=30)).isoformat(sep=" "),
+    }
+    assert_uses_index(probe, parameters, "ix_appointments_doctor_active_interval")
@@ -0,0 +1,112 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.excepciones import SlotConflictError
+from app.models.appointment import Appointment, AppointmentStatus, PriorityLevel
+from app.routes import citas
+from app.utils.scheduling import Assignment, SchedulingEngine, SchedulingRequest, scheduling_engine
+from tests.conftest import add_users, register
+
+START = datetime(2030, 1, 7, 9, 0)
+SLOT = timedelta(minutes=30)
+
+
+def _expected(booked: dict, start: datetime, end: datetime) -> Assignment:
+    """Elección de referencia recorriendo a todos los doctores (la del motor antes de los heaps)."""
+    free = [(len(intervals), doctor_id) for doctor_id, intervals in booked.items()
+            if all(e <= start or s >= end for s, e in intervals)]
+    if free:
+        return Assignment(min(free)[1], start, end)
+    best = None
+    for doctor_id, intervals in booked.items():
+        candidate = start
+        for s, e in sorted(intervals):
+            if s < candidate + (end - start) and e > candidate:
+                candidate = e
+        best = min(best or (candidate, len(intervals), doctor_id), (candidate, len(intervals), doctor_id))
+    return Assignment(best[2], best[0], best[0] + (end - start))
+
+
+def test_engine_matches_a_full_scan_of_the_doctors(db):
+    doctor_ids, _ = add_users(db, doctors=12)
+    engine = SchedulingEngine(max_candidate_heaps=4)
+    engine.load(db)
+    booked = {doctor_id: [] for doctor_id in doctor_ids}
+    made = []
+    rng = random.Random(7)
+
+    for _ in range(600):
+        if made and rng.random() < 0.3:
+            assignment = made.pop(rng.randrange(len(made)))
+            engine.release(assignment)
+            booked[assignment.doctor_id].remove((assignment.start_time, assignment.end_time))
+            continue
+        start = START + SLOT * rng.randrange(16)
+        end = start + SLOT * rng.choice((1, 1, 2))
+        assignment = engine.reserve(SchedulingRequest(start_time=start, end_time=end))
+        assert assignment == _expected(booked, start, end)
+        booked[assignment.doctor_id].append((assignment.start_time, assignment.end_time))
+        made.append(assignment)
+
+
+def test_requested_doctor_is_not_moved_to_another_time(db):
+    (doctor_id, _), _ = add_users(db, doctors=2)
+    scheduling_engine.load(db)
+    request = SchedulingRequest(start_time=START, end_time=START + SLOT, doctor_id=doctor_id)
+    assert scheduling_engine.reserve(request) == Assignment(doctor_id, START, START + SLOT)
+    assert scheduling_engine.reserve(request) is None
+
+
+def test_busy_requested_doctor_is_rejected_with_409(client):
+    patient = register(client, "patient@example.com", "Paciente")
+    register(client, "doctor@example.com", "Doctor")
+    body = {
+        "start_time": START.isoformat(), "end_time": (START + SLOT).isoformat(),
+        "is_virtual": True, "priority_level": "Media",
+    }
+    first = client.post("/api/v1/appointments/citas/", headers=patient, json=body)
+    assert first.status_code == 201, first.text
+    doctor_id = first.json()["doctor_id"]
+
+    second = client.post("/api/v1/appointments/citas/", headers=patient, json={**body, "doctor_id": doctor_id})
+    assert second.status_code == 409
+    assert scheduling_engine.pending_count() == 0
+
+
+def test_reservation_is_released_when_the_db_check_fails(db, monkeypatch):
+    (doctor_id,), patient_id = add_users(db, doctors=1)
+
+    def broken_check(session, assignment, exclude_appointment_id=None):
+        raise RuntimeError("conexión perdida")
+
+    monkeypatch.setattr(citas, "slot_is_free_in_db", broken_check)
+    appointment = Appointment(
+        patient_id=patient_id, start_time=START, end_time=START + SLOT,
+        priority_level=PriorityLevel.MEDIUM, status=AppointmentStatus.REQUESTED,
+    )
+    with pytest.raises(RuntimeError):
+        citas.assign_priority_and_schedule(db, appointment)
+    assert scheduling_engine.pending_count() == 0
+    # El horario vuelve a estar libre para el motor
+    assert scheduling_engine.reserve(SchedulingRequest(start_time=START, end_time=START + SLOT, doctor_id=doctor_id))
+
+
+def test_batch_item_for_a_busy_doctor_is_rejected(db):
+    (doctor_id,), patient_id = add_users(db, doctors=1)
+    items = [
+        (index, citas.AppointmentBatchItem(
+            start_time=START, end_time=START + SLOT, is_virtual=True,
+            priority_level=PriorityLevel.MEDIUM, doctor_id=doctor_id,
+        ), patient_id)
+        for index in range(2)
+    ]
+    results = citas.schedule_and_persist_batch(db, items)
+    assert [result.ok for result in sorted(results.values(), key=lambda result: result.index)] == [True, False]
+    assert db.query(Appointment).count() == 1
+    with pytest.raises(SlotConflictError):
+        citas.assign_priority_and_schedule(db, Appointment(
+            patient_id=patient_id, doctor_id=doctor_id, start_time=START, end_time=START + SLOT,
+            priority_level=PriorityLevel.MEDIUM, status=AppointmentStatus.REQUESTED,
+        ))
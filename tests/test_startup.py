@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from sqlalchemy import inspect
+
+import main
+from app.config import settings
+from app.database import Base, engine
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Importar main en un intérprete limpio: mide el tiempo de importación y
+# comprueba que no abre ninguna conexión (la base de datos SQLite no llega a crearse).
+_IMPORT_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import main
+print(json.dumps({"seconds": time.perf_counter() - started}))
+"""
+
+
+def test_importing_main_is_within_budget_and_does_not_touch_the_database(tmp_path):
+    database = tmp_path / "import.db"
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{database}"}
+    result = subprocess.run(
+        [sys.executable, "-c", _IMPORT_SCRIPT], cwd=ROOT, env=env, capture_output=True, text=True, timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+    seconds = json.loads(result.stdout.strip().splitlines()[-1])["seconds"]
+    assert seconds < settings.STARTUP_TIME_BUDGET_SECONDS
+    assert not database.exists()
+
+
+def test_lifespan_creates_the_schema():
+    Base.metadata.drop_all(bind=engine)
+    assert not inspect(engine).get_table_names()
+    with TestClient(main.app):
+        assert set(Base.metadata.tables) <= set(inspect(engine).get_table_names())
+
+
+def test_lifespan_skips_the_schema_when_migrations_own_it(monkeypatch):
+    monkeypatch.setattr(settings, "DB_CREATE_SCHEMA_ON_STARTUP", False)
+    Base.metadata.drop_all(bind=engine)
+    with TestClient(main.app):
+        assert not inspect(engine).get_table_names()
@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import database
+from tests.conftest import register
+
+# Camino síncrono (DB_ASYNC_ENABLED=False): las rutas async reciben la Session de
+# siempre envuelta en SyncSessionAdapter.
+
+START = datetime(2030, 1, 7, 9, 0)
+
+
+@pytest.fixture
+def sync_sessions(monkeypatch):
+    monkeypatch.setattr(database, "AsyncSessionLocal", None)
+
+
+def test_routes_work_with_the_sync_session_adapter(sync_sessions, client):
+    register(client, "doctor@example.com", "Doctor")
+    patient = register(client, "patient@example.com", "Paciente")
+
+    response = client.post("/api/v1/appointments/citas/", headers=patient, json={
+        "start_time": START.isoformat(),
+        "end_time": (START + timedelta(minutes=30)).isoformat(),
+        "is_virtual": True,
+        "priority_level": "Media",
+    })
+    assert response.status_code == 201, response.text
+    listing = client.get("/api/v1/appointments/citas/my", headers=patient)
+    assert listing.status_code == 200
+    assert [appointment["id"] for appointment in listing.json()] == [response.json()["id"]]